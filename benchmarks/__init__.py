@@ -0,0 +1,26 @@
+"""
+Benchmarks, run from the repository root:
+    python -m benchmarks.bench_runtime         AES backends and event loops
+    python -m benchmarks.bench_game_rules      rule matching throughput
+    python -m benchmarks.bench_captcha         classify() vs the old substring check
+    python -m benchmarks.bench_trade_offers    parse_offer() vs the old line parser
+    python -m benchmarks.bench_user_runtime    memory per user, records vs dicts
+    python -m benchmarks.bench_logging         per-call cost of a log line
+    python -m benchmarks.bench_mongo_profiles  durability profiles on MONGODB_URI
+
+Correctness lives in tests/; these only measure.
+"""
+
+import time
+
+
+def per_call_us(fn, items, rounds=1, repeat=5):
+    """Best-of-`repeat` microseconds per fn(item) over `rounds` passes of items"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for item in items:
+                fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best / (rounds * len(items)) * 1e6
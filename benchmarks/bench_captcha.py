@@ -0,0 +1,44 @@
+"""classify() against the substring check bot.py used before it, on the
+messages of tests/fixtures/captcha_messages.json"""
+
+import json
+import os
+
+from benchmarks import per_call_us
+from captcha_detector import classify
+from game_rules import RULES_PATH, load_rules
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "tests", "fixtures", "captcha_messages.json")
+
+# The check bot.py used before classify(), on lowercased text
+LEGACY_PHRASES = (
+    "defeat before you can continue", "upon an Ancient", "you like to enter",
+    "select the correct number of monsters", "rich merchant", "found a Village",
+    "ship", "are few eggs", "you stumble upon evil mystic wizard",
+)
+
+
+def legacy_is_captcha(text):
+    text = text.lower()
+    return any(phrase in text for phrase in LEGACY_PHRASES)
+
+
+def main(rounds=2000):
+    rules, _ = load_rules(RULES_PATH)
+    with open(FIXTURE, encoding="utf-8") as f:
+        messages = json.load(f)["messages"]
+
+    correct = sum(legacy_is_captcha(m["text"]) == m["captcha"] for m in messages)
+    print(f"corpus: {len(messages)} messages, legacy substring check labels {correct} correctly\n")
+
+    normal = [m["text"] for m in messages if not m["captcha"]]
+    long_text = ["\n".join(normal) * 2]
+    for name, texts in (("normal messages", normal), (f"{len(long_text[0])} chars of text", long_text)):
+        legacy = per_call_us(legacy_is_captcha, texts, rounds)
+        scored = per_call_us(lambda text: classify(text, rules.captcha), texts, rounds)
+        print(f"{name:22} classify {scored:6.2f} us   legacy substring check {legacy:6.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Throughput of matching every game rule plus the captcha score per message"""
+
+from benchmarks import per_call_us
+from captcha_detector import classify
+from game_rules import RULES_PATH, load_rules
+
+SAMPLE_MESSAGES = (
+    "You run into a Forest Goblin!\nThreat level: ⭐⭐\nHP 120/120",
+    "Goblin dealt 12 damage to you. You dealt 30 damage. Choose your next move",
+    "You earned 35 coins and 12 xp while exploring the forest",
+    "The merchant left. You walked away with 2 potions",
+    "A trader appears! Check out offers before he leaves",
+    "The trader offers you 3 pearls for 180 coins",
+    "You found a village! Would you like to enter?",
+    "Select the correct number of monsters shown above to continue",
+    "A wild pet appears! Rarity : Epic. Do you want to try and capture it?",
+    "You also found 2 essences in a chest",
+    "Your friendship band glows. You get 5 aura",
+    "Nothing interesting happened.",
+)
+
+BUTTON_LABELS = ("⚔️ Attack", "Run", "Ｅngage", "Eńɢaǵe now", "Walk away", "1", "2", "3")
+
+
+def main(rounds=2000):
+    rules, _ = load_rules(RULES_PATH)
+    texts = [text.lower() for text in SAMPLE_MESSAGES]
+
+    def score(text):
+        rules.matching(text)
+        classify(text, rules.captcha)
+
+    us = per_call_us(score, texts, rounds)
+    print(f"game rules v{rules.version}: {len(rules.matchers)} rules")
+    print(f"all rules + captcha score: {1e6 / us:,.0f} messages/s ({us:.2f} us each)")
+
+    engage = rules.engage_button
+    us = per_call_us(lambda label: engage.search(engage.prepare(label)), BUTTON_LABELS, rounds)
+    print(f"engage button check: {1e6 / us:,.0f} labels/s")
+
+
+if __name__ == "__main__":
+    main()
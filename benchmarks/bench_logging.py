@@ -0,0 +1,79 @@
+"""Per-call cost of a log line, writing directly vs through the log_setup queue,
+and what a burst into a slow sink does to INFO and WARNING records"""
+
+import io
+import time
+import queue
+import logging
+from logging.handlers import QueueListener
+
+from benchmarks import per_call_us
+from log_setup import TEXT_FORMAT, DroppingQueueHandler
+
+SLOW_SINK_DELAY = 0.0002
+
+
+class SlowSink(io.StringIO):
+    """A stdout that takes SLOW_SINK_DELAY per write (a piped collector)"""
+
+    def write(self, text):
+        time.sleep(SLOW_SINK_DELAY)
+        return len(text)
+
+
+def _logger(name, handler, level=logging.INFO):
+    logger = logging.getLogger(f"bench.{name}")
+    logger.handlers[:] = [handler]
+    logger.propagate = False
+    logger.setLevel(level)
+    return logger
+
+
+def _writer(stream):
+    writer = logging.StreamHandler(stream)
+    writer.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return writer
+
+
+def _queued(name, stream, size=10000):
+    writer = _writer(stream)
+    handler = DroppingQueueHandler(queue.Queue(size), overflow=writer)
+    listener = QueueListener(handler.queue, writer)
+    listener.start()
+    return _logger(name, handler), handler, listener
+
+
+def _stop(listener):
+    # stop() puts its sentinel with put_nowait, let the writer catch up first
+    listener.queue.join()
+    listener.stop()
+
+
+def main(count=2000, burst=20000):
+    def info(logger):
+        return lambda i: logger.info("[✓] Explore answered for %s in %.1f ms", 1000000 + i, 12.5)
+
+    items = range(count)
+    print(f"{'StreamHandler, fast sink':34} {per_call_us(info(_logger('fast', _writer(io.StringIO()))), items):8.1f} us")
+    print(f"{'StreamHandler, 0.2 ms sink':34} {per_call_us(info(_logger('slow', _writer(SlowSink()))), range(200), repeat=2):8.1f} us")
+
+    logger, handler, listener = _queued("queued", SlowSink(), size=count * 10)
+    print(f"{'queue handler, same slow sink':34} {per_call_us(info(logger), items, repeat=1):8.1f} us")
+    _stop(listener)
+
+    farm = _logger("farm", _writer(io.StringIO()), logging.WARNING)
+    print(f"{'farm trace (logger at WARNING)':34} {per_call_us(info(farm), items):8.1f} us\n")
+
+    for level in (logging.INFO, logging.WARNING):
+        logger, handler, listener = _queued(f"burst{level}", SlowSink())
+        start = time.perf_counter()
+        for i in range(burst):
+            logger.log(level, "[✓] Explore answered for %s", i)
+        elapsed = time.perf_counter() - start
+        _stop(listener)
+        print(f"{burst} {logging.getLevelName(level)} records into the 0.2 ms sink: {elapsed:.2f}s, "
+              f"{handler.dropped} dropped, {handler.overflowed} written past the queue")
+
+
+if __name__ == "__main__":
+    main()
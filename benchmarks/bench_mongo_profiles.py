@@ -0,0 +1,66 @@
+"""Latency and throughput of the durability profiles
+    python -m benchmarks.bench_mongo_profiles [count] [concurrency]
+Writes to a scratch collection on MONGODB_URI / MONGODB_DB_NAME and drops it
+afterwards. Point it at a replica set: on a standalone server "majority"
+is the same as w=1 and secondary reads go to the primary."""
+
+import sys
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from mongo_db import (DURABILITY_PROFILES, MONGODB_MAJORITY_WTIMEOUT_MS, MONGODB_MAX_POOL_SIZE,
+                      MONGODB_TELEMETRY_W, MongoDBManager, mongo_manager)
+
+BENCH_COLLECTION = "durability_benchmark"
+
+
+def _percentile(samples, share):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * share))] * 1000
+
+
+def _timed(operation, count, concurrency):
+    """Run operation(i) count times; returns (latencies, seconds elapsed)"""
+    def run(i):
+        t0 = time.perf_counter()
+        operation(i)
+        return time.perf_counter() - t0
+
+    start = time.perf_counter()
+    if concurrency <= 1:
+        latencies = [run(i) for i in range(count)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(run, range(count)))
+    return latencies, time.perf_counter() - start
+
+
+def benchmark_profiles(manager, count=500, concurrency=16):
+    manager.db.drop_collection(BENCH_COLLECTION)
+    try:
+        print(f"{'profile':10} {'operation':22} {'conc':>4} {'p50 ms':>8} {'p99 ms':>8} {'ops/s':>9}")
+        for profile in DURABILITY_PROFILES:
+            coll = manager._coll(BENCH_COLLECTION, profile)
+            operations = (
+                ("upsert", lambda i: coll.update_one({"_id": f"{profile}-{i}"}, {"$set": {"n": i, "ts": datetime.utcnow()}}, upsert=True)),
+                ("insert_many x100", lambda i: coll.insert_many([{"p": profile, "n": i, "k": k} for k in range(100)], ordered=False)),
+                ("find_one", lambda i: coll.find_one({"_id": f"{profile}-{i}"})),
+            )
+            for name, operation in operations:
+                for conc in (1, concurrency):
+                    latencies, elapsed = _timed(operation, count, conc)
+                    print(f"{profile:10} {name:22} {conc:>4} {_percentile(latencies, 0.5):8.2f} "
+                          f"{_percentile(latencies, 0.99):8.2f} {count / elapsed:9.0f}")
+    finally:
+        manager.db.drop_collection(BENCH_COLLECTION)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if not isinstance(mongo_manager, MongoDBManager) or not mongo_manager.is_available():
+        print("MongoDB is not reachable, set MONGODB_URI")
+        sys.exit(1)
+    print(f"pool {MONGODB_MAX_POOL_SIZE}, majority wtimeout {MONGODB_MAJORITY_WTIMEOUT_MS} ms, telemetry w={MONGODB_TELEMETRY_W}")
+    benchmark_profiles(mongo_manager, *(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,84 @@
+"""Throughput of the AES-IGE backends Telethon can use, and of the event loops"""
+
+import os
+import time
+import asyncio
+import platform
+
+import telethon
+from telethon.crypto import aes as telethon_aes, libssl
+
+from runtime import CRYPTO_CRYPTG, CRYPTO_LIBSSL, CRYPTO_PYTHON, crypto_backend
+
+
+def aes_backends():
+    """(name, encrypt_ige) for every AES implementation importable here"""
+    backends = []
+    try:
+        import cryptg
+        backends.append((CRYPTO_CRYPTG, cryptg.encrypt_ige))
+    except ImportError:
+        pass
+    if libssl.encrypt_ige:
+        backends.append((CRYPTO_LIBSSL, libssl.encrypt_ige))
+    # Same code path Telethon falls back to, with the faster backends hidden
+    def python_encrypt(data, key, iv):
+        saved = telethon_aes.cryptg, libssl.encrypt_ige
+        telethon_aes.cryptg, libssl.encrypt_ige = None, None
+        try:
+            return telethon_aes.AES.encrypt_ige(data, key, iv)
+        finally:
+            telethon_aes.cryptg, libssl.encrypt_ige = saved
+    backends.append((CRYPTO_PYTHON, python_encrypt))
+    return backends
+
+
+def aes_throughput(encrypt, size=64 * 1024, seconds=1.0):
+    """MB/s encrypting `size` byte payloads for about `seconds`"""
+    key, iv, data = os.urandom(32), os.urandom(32), os.urandom(size)
+    done, start = 0, time.perf_counter()
+    while True:
+        encrypt(data, key, iv)
+        done += size
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return done / elapsed / 1e6
+
+
+def loop_throughput(loop, tasks=20000):
+    """Coroutine round trips per second through a fresh loop (task + future each)"""
+    async def hop(fut):
+        fut.set_result(None)
+
+    async def run():
+        start = time.perf_counter()
+        for _ in range(tasks):
+            fut = loop.create_future()
+            loop.create_task(hop(fut))
+            await fut
+        return tasks / (time.perf_counter() - start)
+
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+def main():
+    print(f"{platform.python_implementation()} {platform.python_version()}, telethon {telethon.__version__}")
+    print(f"Telethon uses: {crypto_backend()}\n")
+    for name, encrypt in aes_backends():
+        # pure Python is slow enough that small payloads give a stable figure
+        size = 4 * 1024 if name == CRYPTO_PYTHON else 64 * 1024
+        print(f"AES-IGE {name:8} {aes_throughput(encrypt, size):10.2f} MB/s")
+    print()
+    print(f"asyncio loop   {loop_throughput(asyncio.new_event_loop()):10.0f} round trips/s")
+    try:
+        import uvloop
+        print(f"uvloop loop    {loop_throughput(uvloop.new_event_loop()):10.0f} round trips/s")
+    except ImportError:
+        print("uvloop loop    not installed")
+
+
+if __name__ == "__main__":
+    main()
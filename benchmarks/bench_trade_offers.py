@@ -0,0 +1,57 @@
+"""parse_offer() + decide_offer() against the line parser bot.py used before"""
+
+import random
+import re
+from typing import Dict, Optional
+
+from benchmarks import per_call_us
+from trade_offers import CURRENCIES, decide_offer, parse_offer
+
+_LEGACY_PRICE = re.compile(r'for (\d+)')
+
+
+def legacy_decide(text: str, max_prices: Dict[str, int]) -> Optional[str]:
+    """The parser bot.py used before parse_offer (one regex search per line)"""
+    per_pearl, per_ticket = None, None
+    for line in text.lower().split("\n"):
+        if "pearls for" in line:
+            m = _LEGACY_PRICE.search(line)
+            per_pearl = int(m.group(1)) if m else None
+        elif "tickets for" in line:
+            m = _LEGACY_PRICE.search(line)
+            per_ticket = int(m.group(1)) if m else None
+    if per_pearl and per_pearl <= max_prices["pearl"]:
+        return "pearl"
+    if per_ticket and per_ticket <= max_prices["ticket"]:
+        return "ticket"
+    return None
+
+
+def random_offer_message(rng: random.Random) -> str:
+    """A trader message in the shapes the game sends, with noise around the offers"""
+    lines = [rng.choice(["🧳 A wandering trader", "The Trader", "TRADER"]) + " offers you:"]
+    currencies = list(CURRENCIES) + ["gem", "coin"]
+    for _ in range(rng.randint(0, 3)):
+        name = rng.choice(currencies)
+        amount = rng.randint(1, 20)
+        price = rng.choice([rng.randint(0, 2000), rng.randint(100, 300)])
+        line = f"{amount} {name}s for {price}"
+        line = rng.choice([line, line.upper(), line.title(), "• " + line, line + " coins", line + " each 💰"])
+        lines.append(line)
+    rng.shuffle(lines[1:])
+    if rng.random() < 0.3:
+        lines.append(rng.choice(["Check out the offers below", "Offer ends soon", ""]))
+    return "\n".join(lines)
+
+
+def main(count=20000):
+    rng = random.Random(2)
+    messages = [random_offer_message(rng) for _ in range(count)]
+    limits = {"pearl": 200, "ticket": 500}
+    for name, decide in (("legacy line parser", legacy_decide),
+                         ("parse_offer + decide", lambda text, limits: decide_offer(parse_offer(text), limits))):
+        print(f"{name:22} {per_call_us(lambda text: decide(text, limits), messages):6.2f} us/message (best of 5)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Memory per user: UserRuntime records against the per-user dicts bot.py kept
+    python -m benchmarks.bench_user_runtime [users]"""
+
+import sys
+import tracemalloc
+
+from user_runtime import UserRegistry
+
+
+def _legacy_state(count):
+    """The per-user dicts bot.py kept before UserRuntime (one logged-in, farming user each)"""
+    state = {name: {} for name in (
+        "user_clients", "pending_clients", "pending_expect", "farming_enabled",
+        "waiting_for_phone", "user_session_state", "last_explore", "user_login_states",
+    )}
+    state["debug_users"] = set()
+    for uid in range(10**9, 10**9 + count):
+        state["user_clients"][uid] = None
+        state["pending_clients"][uid] = None
+        state["pending_expect"][uid] = None
+        state["farming_enabled"][uid] = True
+        state["waiting_for_phone"][uid] = False
+        state["user_session_state"][uid] = {
+            "explore_waiting": False,
+            "in_combat_or_capture": False,
+            "captcha_active": False,
+            "latest_msg_id": None,
+        }
+        state["last_explore"][uid] = 1.5 + uid
+        state["user_login_states"][uid] = True
+    return state
+
+
+def _registry(count):
+    registry = UserRegistry()
+    for uid in range(10**9, 10**9 + count):
+        rt = registry.get_or_create(uid)
+        rt.farming = True
+        rt.logged_in = True
+        rt.last_explore = 1.5 + uid
+    return registry
+
+
+def measure_memory(build, count):
+    """Bytes per user allocated by build(count), measured with tracemalloc"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    state = build(count)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del state
+    return used / count
+
+
+def main(count=10000):
+    # The explore Event is left out on both sides: it used to be created
+    # for every user, UserRuntime creates it lazily
+    legacy = measure_memory(_legacy_state, count)
+    slots = measure_memory(_registry, count)
+    print(f"{count} users")
+    print(f"per-user dicts     {legacy:6.0f} B/user")
+    print(f"UserRuntime slots  {slots:6.0f} B/user ({slots / legacy:.0%})")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
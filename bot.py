@@ -18,14 +18,34 @@ AutoFarm Bot with user farming logic
 - Admin management system added
 """
 
-import os, re, time, threading, asyncio, random, logging, json
-from typing import Dict, Optional
+import os, re, time, threading, asyncio, random, logging, json, hashlib, signal
+import log_setup
+log_setup.setup_logging()  # before the imports below, mongo_db already logs while connecting
+from typing import Dict, Tuple
+from datetime import datetime
 from telethon import TelegramClient, events
 from telethon.errors import SessionPasswordNeededError
 import telebot
 from telebot import types
-from web_server import keep_alive  
-from mongo_db import mongo_manager  # MongoDB integration
+from flask import request as web_request
+from web_server import keep_alive, app as web_app, set_fleet_provider, set_health_checks
+from mongo_db import mongo_manager  # MongoDB (or local SQLite) storage
+from storage_backend import BatchInserter, UNAVAILABLE
+from message_cache import MessageVersionCache
+from bot_api import transport as bot_api
+from update_executor import KeyedExecutor
+from stats_cache import StatsSnapshotCache
+from user_runtime import users
+from trade_offers import CURRENCIES, parse_offer, decide_offer
+from trade_stats import TradeStats
+from captcha_detector import classify as classify_captcha, captcha_outcome, CaptchaTracker, CLEARED as CAPTCHA_CLEARED
+import runtime
+from game_rules import RulesFile
+from farm_trace import Tracer
+from loop_shards import LoopShards
+from watchdog import ClientWatchdog, WATCHDOG_INTERVAL, HANDLER_TIMEOUT, ALERT_AFTER, RECONNECT
+from shutdown import ActionGate, SHUTDOWN_GRACE, HANDOFF_WAIT, HANDOFF_POLL_INTERVAL
+from farm_scheduler import TimerQueue, StartStagger, parse_schedule, format_schedule, window_state
 
 # ==============================
 # CONFIG
@@ -40,19 +60,89 @@ BOT_ID = 5364964725  # replace with the game bot's id
 MAX_PEARL_PRICE = 250
 MAX_TICKET_PRICE = 500
 
-bot = telebot.TeleBot(BOT_TOKEN, parse_mode=None)
+# Webhook mode - set WEBHOOK_URL (public https base URL) to receive updates
+# through the keep-alive web server instead of long polling
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()[:32]
+WEBHOOK_PATH = f"/webhook/{WEBHOOK_SECRET}"
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Command handler pool - updates run concurrently across users, in order per user
+HANDLER_WORKERS = int(os.environ.get("HANDLER_WORKERS", "8"))
+HANDLER_QUEUE_SIZE = int(os.environ.get("HANDLER_QUEUE_SIZE", "1000"))
+
+# Captcha confidence (0..1) needed to pause farming, see captcha_detector.py
+CAPTCHA_THRESHOLD = float(os.environ.get("CAPTCHA_THRESHOLD", "0.5"))
+
+# Game text triggers, compiled from game_rules.json and reloaded on change
+game_rules = RulesFile()
+
+update_executor = KeyedExecutor(HANDLER_WORKERS, HANDLER_QUEUE_SIZE, name="handler")
+
+def update_user_id(update):
+    """Find the user an update belongs to, used as its ordering key"""
+    for obj in (update.message, update.edited_message, update.callback_query,
+                update.inline_query, update.chosen_inline_result, update.my_chat_member):
+        if obj is not None and getattr(obj, "from_user", None):
+            return obj.from_user.id
+    return f"update_{update.update_id}"
+
+class OrderedTeleBot(telebot.TeleBot):
+    """TeleBot that runs each update on the per-user ordered executor"""
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            # Advance the polling offset only once the update is queued: the
+            # executor only refuses it when shutting down, and then the next
+            # poll (this or the next process) fetches it again
+            if not self.dispatch_update(update):
+                log.warning(f"[✗] Update {update.update_id} not queued, leaving it for the next poll")
+                break
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+
+    def dispatch_update(self, update, block=True):
+        """Queue one update; returns False if the executor is full and block is False"""
+        return update_executor.submit(update_user_id(update), self.run_update, update, block=block)
+
+    def run_update(self, update):
+        super().process_new_updates([update])
+
+# threaded=False: handler concurrency comes from update_executor instead of telebot's pool
+bot = OrderedTeleBot(BOT_TOKEN, parse_mode=None, threaded=False)
+bot_api.install()  # shared keep-alive connection pool for all Bot API calls
 
 # ==============================
 # LOGGING
 # ==============================
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+# Queue-based handler installed by log_setup.setup_logging() at the top
 log = logging.getLogger("AutoFarm")
 
-debug_users = set()
-
-def dbg(uid, msg):
-    if uid in debug_users:
-        log.debug(f"[User {uid}] {msg}")
+# uvloop policy and crypto check, before the first event loop is created
+runtime_info = runtime.bootstrap()
+
+# Per-action farm logging is off by default: decisions go to per-user trace
+# buffers (see farm_trace.py, /trace), the farm logger only shows problems
+FARM_LOG_LEVEL = os.environ.get("FARM_LOG_LEVEL", "WARNING").upper()
+farm_log = logging.getLogger("AutoFarm.farm")
+farm_log.setLevel(FARM_LOG_LEVEL)
+tracer = Tracer(farm_log=farm_log)
+trace = tracer.record
+
+# Opt-in capture of game bot messages as JSON lines, in the shape of
+# tests/fixtures/captcha_messages.json ("captcha" is left for a human to label)
+GAME_MESSAGE_LOG = os.environ.get("GAME_MESSAGE_LOG", "")
+_game_message_lock = threading.Lock()
+
+def record_game_message(event, verdict):
+    buttons = [[button.text for button in row] for row in (event.buttons or [])]
+    line = json.dumps({"text": event.raw_text, "buttons": buttons, "captcha": None,
+                       "score": verdict.confidence}, ensure_ascii=False)
+    try:
+        with _game_message_lock, open(GAME_MESSAGE_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        log.warning(f"[✗] Could not record game message: {e}")
 
 # ==============================
 # STATE - MONGODB INTEGRATION
@@ -78,6 +168,25 @@ if mongo_manager:
     except Exception as e:
         log.error(f"❌ Error loading admins: {e}")
 
+def reload_stored_state():
+    """MongoDB was down at startup, so the loads above got empty fallbacks:
+    replace them with the stored state (the write-ahead log is replayed first)"""
+    for cache, stored in ((approved_users, mongo_manager.get_approved_users()),
+                          (user_config, mongo_manager.get_all_user_configs()),
+                          (user_data, mongo_manager.get_all_user_data())):
+        for key in set(cache) - set(stored):
+            cache.pop(key, None)
+        cache.update(stored)
+    stored_admins = mongo_manager.get_admins()
+    admins.intersection_update(stored_admins)
+    admins.update(stored_admins)
+    log.info(f"✅ Reloaded {len(approved_users)} approvals, {len(user_config)} configs and {len(admins)} admins from MongoDB")
+    # Handoff states were unreadable at startup as well
+    asyncio.run_coroutine_threadsafe(take_over_sessions(), loop)
+
+if mongo_manager:
+    mongo_manager.on_connected(reload_stored_state)
+
 def save_admins():
     """Save admins to MongoDB"""
     try:
@@ -127,44 +236,58 @@ def save_user_data():
 def get_user_data(user_id):
     """Get user data from MongoDB"""
     if user_id not in user_data:
-        user_data[user_id] = mongo_manager.get_user_data(user_id) if mongo_manager else {'gc_noti': False, 'group_id': None}
+        if not mongo_manager:
+            user_data[user_id] = {'gc_noti': False, 'group_id': None}
+        else:
+            data = mongo_manager.get_user_data(user_id)
+            if not mongo_manager.is_available():
+                return data  # outage fallback, don't cache it
+            user_data[user_id] = data
     return user_data[user_id]
 
-def get_user_pearl_price(user_id):
+# User configs are cached in memory (loaded at startup); reads never hit MongoDB
+def update_user_config(user_id, **changes):
+    """Apply changes to a user's config in memory and MongoDB (None removes a key)"""
+    # The cache sees every change, so it is the source of truth (also during outages)
+    config = dict(user_config.get(user_id, {}))
+    for key, value in changes.items():
+        if value is None:
+            config.pop(key, None)
+        else:
+            config[key] = value
+    user_config[user_id] = config
     if mongo_manager:
-        config = mongo_manager.get_user_config(user_id)
-        return config.get('max_pearl_price', MAX_PEARL_PRICE)
+        mongo_manager.save_user_config(user_id, config)
     else:
-        return user_config.get(str(user_id), {}).get('max_pearl_price', MAX_PEARL_PRICE)
+        save_user_config()
+
+def get_user_pearl_price(user_id):
+    return user_config.get(user_id, {}).get('max_pearl_price', MAX_PEARL_PRICE)
 
 def get_user_ticket_price(user_id):
-    if mongo_manager:
-        config = mongo_manager.get_user_config(user_id)
-        return config.get('max_ticket_price', MAX_TICKET_PRICE)
-    else:
-        return user_config.get(str(user_id), {}).get('max_ticket_price', MAX_TICKET_PRICE)
+    return user_config.get(user_id, {}).get('max_ticket_price', MAX_TICKET_PRICE)
+
+def get_user_trade_limits(user_id):
+    """Max price per currency for trader offers"""
+    config = user_config.get(user_id, {})
+    return {
+        "pearl": config.get('max_pearl_price', MAX_PEARL_PRICE),
+        "ticket": config.get('max_ticket_price', MAX_TICKET_PRICE),
+    }
 
 def set_user_pearl_price(user_id, price):
-    if mongo_manager:
-        config = mongo_manager.get_user_config(user_id)
-        config['max_pearl_price'] = price
-        mongo_manager.save_user_config(user_id, config)
-    else:
-        if str(user_id) not in user_config:
-            user_config[str(user_id)] = {}
-        user_config[str(user_id)]['max_pearl_price'] = price
-        save_user_config()
+    update_user_config(user_id, max_pearl_price=price)
 
 def set_user_ticket_price(user_id, price):
-    if mongo_manager:
-        config = mongo_manager.get_user_config(user_id)
-        config['max_ticket_price'] = price
-        mongo_manager.save_user_config(user_id, config)
-    else:
-        if str(user_id) not in user_config:
-            user_config[str(user_id)] = {}
-        user_config[str(user_id)]['max_ticket_price'] = price
-        save_user_config()
+    update_user_config(user_id, max_ticket_price=price)
+
+def get_user_schedule(user_id):
+    """Farming schedule (None = no schedule)"""
+    return user_config.get(user_id, {}).get('schedule')
+
+def set_user_schedule(user_id, schedule):
+    """Store a farming schedule (None removes it)"""
+    update_user_config(user_id, schedule=schedule)
 
 # ==============================
 # TIME HELPERS
@@ -241,36 +364,26 @@ def format_time_remaining(expiration):
 # ==============================
 # SESSION MEMORY MANAGEMENT
 # ==============================
-user_clients: Dict[int, TelegramClient] = {}
-pending_clients: Dict[int, Optional[TelegramClient]] = {}
-pending_expect: Dict[int, Optional[str]] = {}
-farming_enabled: Dict[int, bool] = {}
-waiting_for_phone: Dict[int, bool] = {}
-user_session_state: Dict[int, Dict] = {}
-last_explore: Dict[int, float] = {}
-
-# Track user login states
-user_login_states: Dict[int, bool] = {}
+# All per-user runtime state lives in one UserRuntime record per user,
+# see user_runtime.py for the lifecycle.
 
 def is_user_logged_in(user_id: int) -> bool:
     """Check if user is already logged in"""
-    return user_login_states.get(user_id, False)
+    rt = users.get(user_id)
+    return rt is not None and rt.logged_in
 
 def set_user_logged_in(user_id: int, status: bool):
     """Set user login status"""
-    user_login_states[user_id] = status
+    users.get_or_create(user_id).logged_in = status
     log.info(f"[🔐] User {user_id} login status set to: {status}")
+    if status:
+        plan_farming(user_id)
 
 def cleanup_user_session(user_id: int):
     """Clean up user session from memory only (not from MongoDB)"""
-    user_clients.pop(user_id, None)
-    pending_clients.pop(user_id, None)
-    farming_enabled.pop(user_id, None)
-    pending_expect.pop(user_id, None)
-    waiting_for_phone.pop(user_id, None)
-    user_session_state.pop(user_id, None)
-    last_explore.pop(user_id, None)
-    user_login_states.pop(user_id, None)
+    users.remove(user_id)
+    shards.release(user_id)
+    tracer.forget(user_id)
     log.info(f"[🧹] Cleaned up session for user {user_id} from memory (session preserved in MongoDB)")
 
 async def restore_existing_session(user_id: int):
@@ -280,8 +393,11 @@ async def restore_existing_session(user_id: int):
         session_file = f"{session}.session"
         
         # Get session data from MongoDB
-        if mongo_manager and mongo_manager.session_file_exists(user_id):
+        if mongo_manager and mongo_manager.session_file_exists(user_id) is not False:  # UNAVAILABLE: get_session_file says so too
             session_data = mongo_manager.get_session_file(user_id)
+            if session_data is UNAVAILABLE:
+                await bot_api.call(bot.send_message, user_id, STORAGE_UNAVAILABLE_TEXT)
+                return False
             if session_data:
                 # Create temporary session file for Telethon
                 with open(session_file, 'wb') as f:
@@ -291,11 +407,13 @@ async def restore_existing_session(user_id: int):
                 await client.connect()
                 
                 if await client.is_user_authorized():
-                    user_clients[user_id] = client
-                    farming_enabled[user_id] = False
+                    rt = users.get_or_create(user_id)
+                    rt.client = client
+                    rt.hibernated = False
+                    rt.farming = False
                     set_user_logged_in(user_id, True)
                     await attach_handlers(user_id, client)
-                    bot.send_message(user_id, "✅ Session restored! Use /toggle to start farming.")
+                    await bot_api.call(bot.send_message, user_id, "✅ Session restored! Use /toggle to start farming.")
                     return True
                 else:
                     await client.disconnect()
@@ -305,15 +423,23 @@ async def restore_existing_session(user_id: int):
                     mongo_manager.delete_session_file(user_id)
         
         # If we get here, session restoration failed
-        bot.send_message(user_id, "❌ Session restoration failed. Please login again with /setup")
+        await bot_api.call(bot.send_message, user_id, "❌ Session restoration failed. Please login again with /setup")
         return False
         
     except Exception as e:
         log.error(f"Session restoration failed for user {user_id}: {e}")
-        bot.send_message(user_id, f"❌ Session restoration failed: {e}")
+        await bot_api.call(bot.send_message, user_id, f"❌ Session restoration failed: {e}")
         return False
 
-loop = asyncio.get_event_loop()
+loop = asyncio.new_event_loop()  # uvloop when runtime.bootstrap() installed it
+asyncio.set_event_loop(loop)
+
+# Event loops for Telethon clients; each user is pinned to one (see loop_shards.py)
+LOOP_SHARDS = int(os.environ.get("LOOP_SHARDS", "1"))
+shards = LoopShards(loop, LOOP_SHARDS)
+
+# Closed on shutdown: no new clicks, explores or farming starts (see shutdown.py)
+action_gate = ActionGate()
 
 # ==============================
 # HELPERS
@@ -326,19 +452,31 @@ def owner_only(handler):
             bot.reply_to(message,"❌ Not authorized.")
     return wrapper
 
+# Display names change rarely - cache get_chat lookups for an hour
+USER_NAME_TTL = 3600
+user_names: Dict[int, Tuple[str, float]] = {}
+
 def get_user_name(user_id):
     """Get user's first name or full name if available"""
+    cached = user_names.get(user_id)
+    if cached and time.time() - cached[1] < USER_NAME_TTL:
+        return cached[0]
+
     try:
         user_info = bot.get_chat(user_id)
         if user_info.first_name and user_info.last_name:
-            return f"{user_info.first_name} {user_info.last_name}"
+            name = f"{user_info.first_name} {user_info.last_name}"
         elif user_info.first_name:
-            return user_info.first_name
+            name = user_info.first_name
         else:
-            return f"User_{user_id}"
+            name = f"User_{user_id}"
     except Exception:
+        # Don't cache failures, the lookup may work next time
         return f"User_{user_id}"
 
+    user_names[user_id] = (name, time.time())
+    return name
+
 def send_captcha(user_id,text):
     try:
         user_name = get_user_name(user_id)
@@ -372,11 +510,71 @@ async def jitter_sleep(min_s=0.2, max_s=0.35):
     await asyncio.sleep(random.uniform(min_s, max_s))
 
 async def safe_explore(client, uid):
+    rt = users.get(uid)
+    if rt is None:
+        return
     now = time.time()
-    if now - last_explore.get(uid, 0) > 1:  # 1s cooldown
-        last_explore[uid] = now
+    if now - rt.last_explore > 1:  # 1s cooldown
+        rt.last_explore = now
         await client.send_message(BOT_ID, "/explore")
-        log.info(f"[✓] Sent /explore for user {uid}")
+        trace(uid, "explore", "sent /explore")
+
+# ==============================
+# FARM EVENT JOURNAL
+# ==============================
+# Farm outcomes go into a bounded in-memory ring buffer that is written to the
+# capped farm_events collection in bulk, never one round trip per event
+EVENT_ESSENCE = "essence"
+EVENT_SPECIAL_PET = "special_pet"
+EVENT_CAPTCHA = "captcha"
+EVENT_CAPTCHA_END = "captcha_end"
+EVENT_ENCOUNTER = "encounter"
+
+FARM_EVENT_BUFFER = int(os.environ.get("FARM_EVENT_BUFFER", "50000"))
+farm_events = BatchInserter(mongo_manager.collection("farm_events"), max_buffer=FARM_EVENT_BUFFER) if mongo_manager else None
+
+def journal(user_id, kind, detail=None, **fields):
+    """Append one farm event (O(1), never waits on MongoDB)"""
+    if farm_events is None:
+        return
+    event = {"ts": datetime.utcnow(), "user_id": user_id, "kind": kind}
+    if detail:
+        event["detail"] = detail
+    event.update(fields)
+    farm_events.add(event)
+
+# ==============================
+# CAPTCHA LIFECYCLE
+# ==============================
+# After a solved/failed result farming resumes right away. A captcha that just
+# disappears (the game moved on) gets a short grace period first, since the
+# message that cleared it usually leads to the next explore by itself.
+# Grace plus the jitter_sleep() in send_explore_with_timeout stays under 1s.
+CAPTCHA_RESUME_GRACE = 0.6
+
+captcha_tracker = CaptchaTracker()
+
+async def finish_captcha(rt, outcome):
+    blocked = captcha_tracker.finish(rt, outcome)
+    journal(rt.user_id, EVENT_CAPTCHA_END, outcome, blocked_s=round(blocked, 1))
+    log.info(f"[✓] Captcha {outcome} for user {rt.user_id} after {blocked:.0f}s")
+
+    if outcome == CAPTCHA_CLEARED:
+        cleared_at = time.time()
+        farm_timers.schedule(cleared_at + CAPTCHA_RESUME_GRACE, ("resume", rt.user_id),
+                             lambda: shards.run_on(rt.user_id, resume_after_captcha(rt.user_id, cleared_at)))
+    else:
+        await resume_after_captcha(rt.user_id)
+
+async def resume_after_captcha(user_id, since=None):
+    """Send /explore again unless farming already continued after `since`"""
+    rt = users.get(user_id)
+    if rt is None or rt.client is None or not rt.farming or rt.captcha_active or rt.in_combat:
+        return
+    if since is not None and rt.last_explore >= since:
+        return
+    log.info(f"[▶️] Resuming farming for user {user_id} after captcha")
+    await send_explore_with_timeout(rt.client, user_id, True)
 
 # ==============================
 # FARMING LOGIC (UNCHANGED)
@@ -384,121 +582,102 @@ async def safe_explore(client, uid):
 async def send_explore_with_timeout(client, user_id, retry_on_fail=False):
     try:
         # Check if we're in a state where we shouldn't explore
-        state = user_session_state.get(user_id, {})
-        if state.get('in_combat_or_capture', False) or state.get('captcha_active', False):
-            log.info(f"[⏸️] Skipping /explore - in combat/captcha state for user {user_id}")
+        rt = users.get(user_id)
+        if rt is None:
+            return
+        if rt.in_combat or rt.captcha_active:
+            trace(user_id, "explore", "skipped, in %s", "captcha" if rt.captcha_active else "combat")
             return
             
         await jitter_sleep()
-        state['explore_response_event'] = asyncio.Event()  # reset before sending
+        rt.explore_event = explore_event = asyncio.Event()  # reset before sending
 
         await safe_explore(client, user_id)
+        sent_at = time.perf_counter()
 
         try:
             # Wait max 5s for ANY response (normal encounter or captcha)
-            await asyncio.wait_for(state['explore_response_event'].wait(), timeout=5)
-            log.info(f"[✓] Got response for /explore user {user_id}")
+            await asyncio.wait_for(explore_event.wait(), timeout=5)
+            trace(user_id, "explore", "answered", duration=time.perf_counter() - sent_at)
         except asyncio.TimeoutError:
-            log.warning(f"[✗] No response after /explore for {user_id}, retrying...")
-            if farming_enabled.get(user_id, False):
+            trace(user_id, "explore", "no answer, retrying", duration=time.perf_counter() - sent_at)
+            farm_log.warning(f"[✗] No response after /explore for {user_id}, retrying...")
+            if rt.farming:
                 await jitter_sleep(0.5, 1.0)
                 await safe_explore(client, user_id)
 
     except Exception as e:
-        log.error(f"[✗] Failed to send /explore: {e}")
+        farm_log.error(f"[✗] Failed to send /explore for {user_id}: {e}")
         if retry_on_fail:
             await jitter_sleep(0.3, 0.6)
             await send_explore_with_timeout(client, user_id, False)
 
-async def handle_buttons(event, user_id, stage, prevent_repeat=False):
+def signal_explore_response(rt):
+    """Wake send_explore_with_timeout - the game bot answered"""
+    if rt.explore_event is not None:
+        rt.explore_event.set()
+
+async def handle_buttons(event, rt, stage, prevent_repeat=False):
+    user_id = rt.user_id
     
-    if not farming_enabled.get(user_id, False):
+    if not rt.farming:
         return
     
-    if user_id not in user_session_state:
-        user_session_state[user_id] = {'latest_msg_id': None}
-    
-    if prevent_repeat and event.id == user_session_state[user_id]['latest_msg_id']:
+    if prevent_repeat and event.id == rt.latest_msg_id:
         return
-    user_session_state[user_id]['latest_msg_id'] = event.id
+    rt.latest_msg_id = event.id
 
     if not event.buttons:
         return
 
-    engage_variants = [
-        "Eńɢaǵe","ⴹnɠаge","Ꮛngаge","Ɛṅgaɢe","𝓔ṅg͜age","𝐄ŋɡạɠe","Eṅɡaḡe",
-        "Εñgαge","Ẹngaɢe","Ɛńɡàɡe","Ẹɲgḁge","Ꮛngаge","Eŋ͎gấɠє","Ẹ͛nɡᶏɠe","engage"
-    ]
-
+    engage = game_rules.current.engage_button
     for row in event.buttons:
         for button in row:
-            text = button.text.lower().replace(" ", "")
-            if any(v.lower().replace(" ", "") in text for v in engage_variants) or "prestige" in text:
+            if engage(engage.prepare(button.text)):
                 try:
                     await jitter_sleep()
                     await button.click()
-                    log.info(f"[✓] Clicked Engage/Prestige for {user_id}: {button.text}")
+                    trace(user_id, "click", "%s (%s)", button.text, stage)
                     return
                 except Exception as e:
-                    log.error(f"[✗] Failed to click Engage/Prestige: {e}")
+                    farm_log.error(f"[✗] Failed to click Engage/Prestige for {user_id}: {e}")
                     return
 
-async def handle_combat(event, user_id):
-    if not farming_enabled.get(user_id, False):
+async def handle_combat(event, rt):
+    user_id = rt.user_id
+    if not rt.farming:
         return False
 
-    state = user_session_state.get(user_id, {})
-    if state.get("captcha_active", False):
-        log.warning(f"[⏸️] Combat halted for user {user_id} - captcha active")
+    if rt.captcha_active:
+        trace(user_id, "combat", "halted, captcha active")
         return False
 
-    text = event.raw_text
+    text = event.raw_text  # combat rules are case-sensitive
+    rules = game_rules.current
     try:
-        if "dealt" in text or "blocked" in text:
-            await jitter_sleep()
-            await event.click(0)
-            return True
-
-        if any(word in text for word in [
-            "Ring of Life","Demonic seal","Insanity Rune ","Eternal Elixir",
-            "Cursed sword","Flame Amulet","Phantom of Death","Venomous Dagger",
-            "Resurrection Lyre","Will of Wind","Evasion Boot","Chaotic Totem",
-            "Iris Talisman","Sensory Stone","Pathbreaker Veil","Frostbound Prism",
-            "Friendship Band","Unity Pendant","Comrade Emblem","Anguish Sigil",
-            "Blood Sigil","Hypnotic Orb","Dreamer Lamp","Echoing Barrier","Invincible Aura",
-            "Craftman Hammer","Anti Matter","Starforged Aegis","Guardian Mantle","Identical Mask",
-            "Celestial shield","Devine Relic","Diamond Gauntlet","Lucky Dice","Sukuna Finger","Thunder Spear",
-            "Philosopher Stone","Devil Fruit","SeaPrism Stone","Vivre Card","Reverse Blade Sword","Elixir of Life",
-            "Raphael","Hogyoku","Zanpakuto","Soul Candy","Mana Crystal"
-        ]):
-            await jitter_sleep()
-            await event.click(1, 0)
-            return True
-
-        if "battle status" in text or "dizzy" in text:
-            await jitter_sleep()
-            await event.click(1, 1)
-            return True
+        # (rule, button, what the click does)
+        for rule, button, action in ((rules.combat_attack, (0,), "attack"),
+                                     (rules.combat_item, (1, 0), "use item"),
+                                     (rules.combat_status, (1, 1), "status")):
+            phrase = rule.search(text)
+            if phrase:
+                await jitter_sleep()
+                await event.click(*button)
+                trace(user_id, "combat", "%s (%s)", action, phrase)
+                return True
 
     except Exception as e:
-        log.error(f"[✗] Error in combat: {e}")
+        farm_log.error(f"[✗] Error in combat for {user_id}: {e}")
         return False
 
     return False
 
 async def attach_handlers(user_id, client: TelegramClient):
-    if user_id not in user_session_state:
-        user_session_state[user_id] = {
-            'explore_response_event': asyncio.Event(),
-            'explore_waiting': False,
-            'in_combat_or_capture': False,
-            'captcha_active': False,
-            'latest_msg_id': None
-        }
-
-    async def handle_game_event(event, edited=False):
-        state = user_session_state[user_id]
+    users.get_or_create(user_id).last_active = time.time()
+
+    async def handle_game_event(event, rt, edited=False):
         text = event.raw_text.lower()
+        rules = game_rules.current
 
         # Only process messages from BOT_ID in direct messages
         if event.is_private and event.sender_id == BOT_ID:
@@ -506,207 +685,280 @@ async def attach_handlers(user_id, client: TelegramClient):
             # ==============================
             # ESSENCES FOUND NOTIFICATION
             # ==============================
-            if "essences" in text:
-                farming_enabled[user_id] = False
-                user_name = get_user_name(user_id)
+            if rules.essence(text):
+                rt.farming = False
+                journal(user_id, EVENT_ESSENCE)
+                user_name = await bot_api.call(get_user_name, user_id)
                 notification_text = f"🧪 Farming paused for {user_name} - Essences found!\n\n{event.raw_text}"
-                send_group_notification(user_id, notification_text)
+                await bot_api.call(send_group_notification, user_id, notification_text)
                 return
 
             # Update combat state
-            state['in_combat_or_capture'] = any(k in text for k in ["move", "moves", "randomly attack", "⚔️", "trader"])
+            rt.in_combat = rules.combat_state(text)
 
             # CAPTCHA detection - only in BOT_ID DMs
-            captcha_detected = any(ph in text for ph in [
-                "defeat before you can continue", "upon an Ancient", "you like to enter",
-                "select the correct number of monsters", "rich merchant", "found a Village",
-                "ship", "are few eggs", "you stumble upon evil mystic wizard"
-            ])
+            verdict = classify_captcha(text, rules.captcha, event.buttons, CAPTCHA_THRESHOLD)
+            if verdict.confidence:
+                trace(user_id, "captcha", "score %s (%s)", verdict.confidence, ", ".join(verdict.reasons))
+            if GAME_MESSAGE_LOG:
+                record_game_message(event, verdict)
             
-            # Update captcha state only if detected in BOT_ID DM
-            state['captcha_active'] = captcha_detected
+            # Captcha lifecycle - only from BOT_ID DMs
+            connection_alert = rules.connection_alert(text)
+            if rt.captcha_active:
+                outcome = captcha_outcome(text, rules.captcha)
+                if outcome:
+                    signal_explore_response(rt)
+                    await finish_captcha(rt, outcome)
+                    return
+                if not verdict.is_captcha and not connection_alert:
+                    # No result message, but the game has moved on
+                    await finish_captcha(rt, CAPTCHA_CLEARED)
 
             # ==============================
             # CAPTCHA NOTIFICATION
             # ==============================
-            if "have incoming connections from" in text or state['captcha_active']:
-                state['explore_response_event'].set()
-                state['captcha_active'] = True
-                user_name = get_user_name(user_id)
+            if connection_alert or verdict.is_captcha:
+                signal_explore_response(rt)
+                if captcha_tracker.start(rt):
+                    journal(user_id, EVENT_CAPTCHA)
+                user_name = await bot_api.call(get_user_name, user_id)
                 notification_text = f"❗ CAPTCHA detected for {user_name}!\n\n{event.raw_text}"
-                send_group_notification(user_id, notification_text)
+                await bot_api.call(send_group_notification, user_id, notification_text)
                 return
 
             # Encounter detection (includes ⚔️ and note)
-            if any(k in text for k in ["ㅤㅤㅤ", "threat level", "you run into", "encounter", "⚔️", "note"]):
-                state['explore_response_event'].set()
-                await handle_buttons(event, user_id, "Monster", True)
+            if rules.encounter(text):
+                signal_explore_response(rt)
+                if not edited:
+                    journal(user_id, EVENT_ENCOUNTER)
+                await handle_buttons(event, rt, "Monster", True)
 
             # Safe explore loop - ONLY if not in combat or captcha
-            if any(k in text for k in [
-                "wishing fountain","make a wish","successfully traded with","walked away"
-                "exploring","while","you earned","pocket","core","away with","traded with","merchant left"
-            ]):
-                if "check out the offers" not in text and "offers you" not in text:
-                    if farming_enabled.get(user_id, False) and not state['in_combat_or_capture'] and not state['captcha_active']:
+            if rules.explore_after(text):
+                if not rules.explore_after_exclude(text):
+                    if rt.farming and not rt.in_combat and not rt.captcha_active:
                         await jitter_sleep()
                         await send_explore_with_timeout(client, user_id, True)
 
             # Combat
-            if state['in_combat_or_capture']:
-                await handle_combat(event, user_id)
+            if rt.in_combat:
+                await handle_combat(event, rt)
 
             # Continue exploring - ONLY if not in combat or captcha
-            elif "also found" in text or "you get" in text:
-                # Only send explore if we haven't already processed this message for explore
-                if not state.get('explore_sent_for_message', False):
-                    state['explore_sent_for_message'] = True
-                    if farming_enabled.get(user_id, False) and not state['in_combat_or_capture'] and not state['captcha_active']:
+            elif rules.explore_continue(text):
+                # Only send explore once per message, however often it gets edited
+                if rt.explore_sent_msg_id != event.id:
+                    rt.explore_sent_msg_id = event.id
+                    if rt.farming and not rt.in_combat and not rt.captcha_active:
                         await jitter_sleep()
                         await send_explore_with_timeout(client, user_id, True)
-                else:
-                    # Reset the flag for the next message
-                    state['explore_sent_for_message'] = False
 
-    # Register both new and edited messages - only from BOT_ID
-    @client.on(events.NewMessage(from_users=BOT_ID))
-    async def on_new(event):
-        await handle_game_event(event, edited=False)
+    async def on_new(event, rt):
+        await handle_game_event(event, rt, edited=False)
 
-    @client.on(events.MessageEdited(from_users=BOT_ID))
-    async def on_edit(event):
-        await handle_game_event(event, edited=True)
+    async def on_edit(event, rt):
+        await handle_game_event(event, rt, edited=True)
 
-    @client.on(events.NewMessage(from_users=BOT_ID))
-    @client.on(events.MessageEdited(from_users=BOT_ID))
-    async def trader(event):
-        if not farming_enabled.get(user_id, False):
+    async def trader(event, rt):
+        if not rt.farming:
             return
         t = event.raw_text.lower()
+        rules = game_rules.current
     
         # Add the new condition first
-        if "successfully traded with trader" in t:
+        if rules.trader_done(t):
             await jitter_sleep()
             await client.send_message(BOT_ID, "/explore")
+            trace(user_id, "trade", "trade done, sent /explore")
             return
     
-        if "trader" in t:
+        if rules.trader(t):
             for row in event.buttons:
                 for button in row:
-                    if "check out offers" in button.text.lower():
+                    if rules.trader_offers_button(button.text.lower()):
                         await jitter_sleep(0.7, 0.9)
                         await button.click()
+                        trace(user_id, "trade", "opened offers")
                         return
-        if "offers you" in t:
-            per_pearl, per_ticket = None, None
-            for line in t.split("\n"):
-                if "pearls for" in line:
-                    m = re.search(r'for (\d+)', line)
-                    per_pearl = int(m.group(1)) if m else None
-                elif "tickets for" in line:
-                    m = re.search(r'for (\d+)', line)
-                    per_ticket = int(m.group(1)) if m else None
-            if per_pearl and per_pearl <= get_user_pearl_price(user_id):
-                await jitter_sleep()
-                await event.click(0)
-            elif per_ticket and per_ticket <= get_user_ticket_price(user_id):
+        if rules.trader_offer(t):
+            offer = parse_offer(event.raw_text)
+            limits = get_user_trade_limits(user_id)
+            currency = decide_offer(offer, limits)
+            if currency:
                 await jitter_sleep()
                 await event.click(0)
+                trace(user_id, "trade", "bought %s at %s", currency, offer.prices.get(currency))
             else:
                 await jitter_sleep()
                 await safe_explore(client, user_id)
+                trace(user_id, "trade", "declined %s", offer.prices)
+            # Analytics after acting, so recording never delays the trade
+            trade_stats.record(user_id, offer, currency, limits)
 
-    @client.on(events.NewMessage(from_users=BOT_ID))
-    async def fight_new(event):
-        if not farming_enabled.get(user_id, False):
+    async def fight_new(event, rt):
+        if not rt.farming:
             return
-        if "defeat before you can continue" in event.raw_text.lower():
+        if game_rules.current.fight_required(event.raw_text.lower()):
             await jitter_sleep()
             await client.send_message(BOT_ID,"/fight")
+            trace(user_id, "fight", "sent /fight")
 
-    @client.on(events.MessageEdited(from_users=BOT_ID))
-    async def fight_edit(event):
-        if not farming_enabled.get(user_id, False):
+    async def fight_edit(event, rt):
+        if not rt.farming:
             return
-        if "defeat before you can continue" in event.raw_text.lower():
+        if game_rules.current.fight_required(event.raw_text.lower()):
             await jitter_sleep()
             await client.send_message(BOT_ID,"/explore")
 
-    @client.on(events.NewMessage(from_users=BOT_ID))
-    @client.on(events.MessageEdited(from_users=BOT_ID))
-    async def pet(event):
-        # Extract user_id from client session filename
-        session_name = client.session.filename
-        user_id = int(session_name.replace("session_", "").replace(".session", ""))
-        
-        if not farming_enabled.get(user_id, False):
+    async def pet(event, rt):
+        if not rt.farming:
             return
         
         text = event.raw_text.lower()
+        rules = game_rules.current
 
         # Step 1: Capture attempt
-        if "and capture it" in text or "to try" in text or "you want to try" in text:
+        if rules.pet_capture(text):
             await asyncio.sleep(0.5)
             await event.click(0, 1)
-            log.info(f"[🎯] Tried to capture pet for user {user_id}")
+            trace(user_id, "pet", "capture attempt")
             return
 
         # Step 2: Rarity check after capture
-        if any(r in text for r in ["rarity : rare", "rarity : common"]):
-            log.info(f"[⚪] Common/Rare pet detected for user {user_id} - walking away...")
+        if rules.pet_release(text):
+            trace(user_id, "pet", "%s, walking away", rules.pet_release.search(text))
             for row in event.buttons:
                 for button in row:
-                    if "walk away" in button.text.lower():
+                    if rules.pet_walk_away_button(button.text.lower()):
                         await asyncio.sleep(0.5)
                         await button.click()
-                        log.info(f"[🚶] Clicked: {button.text} for user {user_id}")
+                        trace(user_id, "pet", "clicked %s", button.text)
                         break
         
             # Added the requested line
-            if "walked away" in event.raw_text.lower():
+            if rules.pet_walked_away(text):
                 await jitter_sleep()
                 await client.send_message(BOT_ID, "/explore")
             
-            if farming_enabled.get(user_id, False):
+            if rt.farming:
                 await asyncio.sleep(0.5)
                 await client.send_message(BOT_ID, "/explore")
             return
 
-        if any(r in text for r in ["rarity : epic", "rarity : crossover", "rarity : exotic", "rarity : exclusive"]):
+        rarity = rules.pet_special.search(text)
+        if rarity:
             log.info(f"[✨] Special pet detected for user {user_id} - notifying user")
-            farming_enabled[user_id] = False  # pause farming for this user
+            trace(user_id, "pet", "%s, farming paused", rarity)
+            rt.farming = False  # pause farming for this user
+            journal(user_id, EVENT_SPECIAL_PET, rarity.split(": ")[1])
             
             # GROUP NOTIFICATION FOR SPECIAL PETS
-            user_name = get_user_name(user_id)
+            user_name = await bot_api.call(get_user_name, user_id)
             notification_text = f"✨ Special pet appeared for {user_name}:\n\n{event.raw_text}"
-            send_group_notification(user_id, notification_text)
+            await bot_api.call(send_group_notification, user_id, notification_text)
             
             return
 
+    # ==============================
+    # DISPATCH (one entry point per update, deduplicated)
+    # ==============================
+    new_message_handlers = (on_new, trader, fight_new, pet)
+    edited_message_handlers = (on_edit, trader, fight_edit, pet)
+
+    async def dispatch(event, handlers):
+        rt = users.get(user_id)
+        if rt is None:
+            # User was cancelled/deleted while this client was still connected
+            return
+
+        rt.last_active = time.time()
+        if rt.versions is None:
+            rt.versions = MessageVersionCache()
+        if not rt.versions.check(event):
+            trace(user_id, "dedup", "dropped duplicate version of message %s", event.id)
+            return
+
+        if not action_gate.enter():
+            return
+        started = time.perf_counter()
+        try:
+            # A wedged handler is cancelled; the watchdog restarts the explore chain
+            await asyncio.wait_for(run_handlers(event, rt, handlers), timeout=HANDLER_TIMEOUT)
+        except asyncio.TimeoutError:
+            farm_log.warning(f"[✗] Handlers for message {event.id} of user {user_id} timed out after {HANDLER_TIMEOUT}s")
+        finally:
+            action_gate.exit()
+        trace(user_id, "message", "%s %s handled", "edit" if handlers is edited_message_handlers else "new",
+              event.id, duration=time.perf_counter() - started)
+
+    async def run_handlers(event, rt, handlers):
+        for handler in handlers:
+            try:
+                await handler(event, rt)
+            except Exception as e:
+                farm_log.error(f"[✗] {handler.__name__} failed for user {user_id}: {e}")
+
+    # Register both new and edited messages - only from BOT_ID
+    @client.on(events.NewMessage(from_users=BOT_ID))
+    async def on_new_message(event):
+        await dispatch(event, new_message_handlers)
+
+    @client.on(events.MessageEdited(from_users=BOT_ID))
+    async def on_edited_message(event):
+        await dispatch(event, edited_message_handlers)
+
 # ==============================
 # LOGIN (MODIFIED FOR MONGODB SESSION STORAGE)
 # ==============================
+# Session reads answered UNAVAILABLE (MongoDB down): never start a login or
+# open a client on an empty session file, ask the user to retry instead
+STORAGE_UNAVAILABLE_TEXT = "⚠️ Session storage is unreachable right now. Please try again in a minute."
+
+def persist_session_file(user_id: int) -> bool:
+    """Copy the local Telethon session file to MongoDB"""
+    session_file = f"session_{user_id}.session"
+    if not mongo_manager or not os.path.exists(session_file):
+        return False
+    try:
+        with open(session_file, 'rb') as f:
+            session_data = f.read()
+        mongo_manager.save_session_file(user_id, session_data)
+        log.info(f"[💾] Session saved to MongoDB for user {user_id}")
+        return True
+    except Exception as e:
+        log.error(f"[❌] Failed to save session to MongoDB: {e}")
+        return False
+
 async def start_client(user_id: int, phone: str):
-    if user_id in pending_clients:
-        bot.send_message(user_id, "⚠️ Login already in progress.")
+    rt = users.get_or_create(user_id)
+    if rt.pending_client is not None:
+        await bot_api.call(bot.send_message, user_id, "⚠️ Login already in progress.")
         return None
 
-    old = user_clients.get(user_id)
+    old = rt.client
     if old:
         try:
             await old.disconnect()
         except:
             pass
-        user_clients.pop(user_id, None)
+        rt.client = None
 
     session = f"session_{user_id}"
     session_file = f"{session}.session"
 
     # Check if session exists in MongoDB instead of local file
-    if mongo_manager and mongo_manager.session_file_exists(user_id):
+    exists = mongo_manager.session_file_exists(user_id) if mongo_manager else False
+    if exists is UNAVAILABLE and not os.path.exists(session_file):
+        await bot_api.call(bot.send_message, user_id, STORAGE_UNAVAILABLE_TEXT)
+        return None
+    if exists:
         try:
             # Get session data from MongoDB
             session_data = mongo_manager.get_session_file(user_id)
+            if session_data is UNAVAILABLE and not os.path.exists(session_file):
+                await bot_api.call(bot.send_message, user_id, STORAGE_UNAVAILABLE_TEXT)
+                return None
             if session_data:
                 # Create a temporary session file for Telethon to use
                 with open(session_file, 'wb') as f:
@@ -719,42 +971,36 @@ async def start_client(user_id: int, phone: str):
         client = TelegramClient(session, API_ID, API_HASH)
         await client.connect()
     except Exception as e:
-        bot.send_message(user_id, f"❌ Failed to start login: {e}")
+        await bot_api.call(bot.send_message, user_id, f"❌ Failed to start login: {e}")
         return None
 
     if not await client.is_user_authorized():
         try:
             await client.send_code_request(phone)
-            pending_expect[user_id] = "otp"
-            pending_clients[user_id] = client
-            bot.send_message(user_id, "📲 Enter the OTP (like 1 2 3 4 5).")
+            rt.pending_expect = "otp"
+            rt.pending_client = client
+            await bot_api.call(bot.send_message, user_id, "📲 Enter the OTP (like 1 2 3 4 5).")
         except Exception as e:
-            bot.send_message(user_id, f"❌ Could not send code: {e}")
+            await bot_api.call(bot.send_message, user_id, f"❌ Could not send code: {e}")
             return None
     else:
         await attach_handlers(user_id, client)
-        user_clients[user_id] = client
-        farming_enabled[user_id] = False
+        rt.client = client
+        rt.farming = False
         set_user_logged_in(user_id, True)  # Mark as logged in
         
         # Save session to MongoDB after successful authorization
-        if mongo_manager and os.path.exists(session_file):
-            try:
-                with open(session_file, 'rb') as f:
-                    session_data = f.read()
-                mongo_manager.save_session_file(user_id, session_data)
-                log.info(f"[💾] Session saved to MongoDB for user {user_id}")
-            except Exception as e:
-                log.error(f"[❌] Failed to save session to MongoDB: {e}")
+        await asyncio.get_running_loop().run_in_executor(None, persist_session_file, user_id)
         
-        bot.send_message(user_id, "✅ Session restored! Use /toggle to start farming.")
+        await bot_api.call(bot.send_message, user_id, "✅ Session restored! Use /toggle to start farming.")
 
     return client
 
 async def complete_login(user_id, code=None, password=None):
-    client = user_clients.get(user_id) or pending_clients.get(user_id)
+    rt = users.get(user_id)
+    client = rt.active_client() if rt else None
     if not client:
-        bot.send_message(user_id, "⚠️ No pending login session.")
+        await bot_api.call(bot.send_message, user_id, "⚠️ No pending login session.")
         return False
 
     try:
@@ -762,37 +1008,309 @@ async def complete_login(user_id, code=None, password=None):
             try:
                 await client.sign_in(code=code)
             except SessionPasswordNeededError:
-                pending_expect[user_id] = "password"
-                bot.send_message(user_id, "🔑 Enter your 2FA password:")
+                rt.pending_expect = "password"
+                await bot_api.call(bot.send_message, user_id, "🔑 Enter your 2FA password:")
                 return False
         elif password:
             await client.sign_in(password=password)
 
         if await client.is_user_authorized():
-            user_clients[user_id] = client
-            pending_clients.pop(user_id, None)
-            pending_expect[user_id] = None
+            rt.client = client
+            rt.pending_client = None
+            rt.pending_expect = None
             set_user_logged_in(user_id, True)  # Mark as logged in
             
             # Save session to MongoDB after successful login
-            session_file = f"session_{user_id}.session"
-            if mongo_manager and os.path.exists(session_file):
-                try:
-                    with open(session_file, 'rb') as f:
-                        session_data = f.read()
-                    mongo_manager.save_session_file(user_id, session_data)
-                    log.info(f"[💾] Session saved to MongoDB for user {user_id}")
-                except Exception as e:
-                    log.error(f"[❌] Failed to save session to MongoDB: {e}")
+            await asyncio.get_running_loop().run_in_executor(None, persist_session_file, user_id)
             
-            bot.send_message(user_id, "✅ Login done! Use /toggle to farm.")
+            await bot_api.call(bot.send_message, user_id, "✅ Login done! Use /toggle to farm.")
             await attach_handlers(user_id, client)
             return True
 
     except Exception as e:
-        bot.send_message(user_id, f"❌ Login failed: {e}")
+        await bot_api.call(bot.send_message, user_id, f"❌ Login failed: {e}")
         return False
 
+# ==============================
+# IDLE HIBERNATION
+# ==============================
+# Logged-in clients that are not farming are disconnected after
+# HIBERNATE_AFTER idle seconds; the session stays on disk and in MongoDB and
+# the client is reconnected on demand when farming is turned on again.
+HIBERNATE_AFTER = int(os.environ.get("HIBERNATE_AFTER", "1800"))  # 0 disables
+HIBERNATE_CHECK_INTERVAL = 60
+WAKE_TIMEOUT = float(os.environ.get("WAKE_TIMEOUT", "15"))
+
+async def hibernate_client(rt):
+    """Disconnect an idle client and release it, keeping the session"""
+    client = rt.client
+    if client is None or rt.farming:
+        return
+    # Off the event loop: a MongoDB outage makes this wait out its timeouts
+    await asyncio.get_running_loop().run_in_executor(None, persist_session_file, rt.user_id)
+    if rt.client is not client or rt.farming:
+        return  # woken or restarted while saving
+    rt.client = None
+    rt.hibernated = True
+    rt.explore_event = None
+    rt.versions = None
+    try:
+        await client.disconnect()
+    except Exception as e:
+        log.warning(f"[!] Disconnect failed while hibernating user {rt.user_id}: {e}")
+    log.info(f"[💤] Hibernated idle client for user {rt.user_id}")
+
+async def wake_client(user_id: int):
+    """Return a connected client for the user, reconnecting a hibernated one"""
+    rt = users.get(user_id)
+    if rt is None:
+        return None
+    if rt.client is not None or not rt.hibernated:
+        return rt.client
+
+    session = f"session_{user_id}"
+    session_file = f"{session}.session"
+    try:
+        if not os.path.exists(session_file):
+            session_data = mongo_manager.get_session_file(user_id) if mongo_manager else None
+            if session_data is UNAVAILABLE:
+                # Stay hibernated, the next /toggle tries again
+                log.warning(f"[!] Storage unavailable, not waking user {user_id}")
+                await bot_api.call(bot.send_message, user_id, STORAGE_UNAVAILABLE_TEXT)
+                return None
+            if not session_data:
+                # Nothing to connect with; Telethon would create an empty session file
+                rt.hibernated = False
+                set_user_logged_in(user_id, False)
+                await bot_api.call(bot.send_message, user_id, "❌ Session expired. Please login again with /setup")
+                return None
+            with open(session_file, 'wb') as f:
+                f.write(session_data)
+
+        client = TelegramClient(session, API_ID, API_HASH)
+        await asyncio.wait_for(client.connect(), timeout=WAKE_TIMEOUT)
+        if not await client.is_user_authorized():
+            await client.disconnect()
+            rt.hibernated = False
+            set_user_logged_in(user_id, False)
+            await bot_api.call(bot.send_message, user_id, "❌ Session expired. Please login again with /setup")
+            return None
+    except Exception as e:
+        log.error(f"[✗] Failed to wake client for user {user_id}: {e}")
+        await bot_api.call(bot.send_message, user_id, f"❌ Could not reconnect your session: {e}")
+        return None
+
+    # Another wake may have finished while we were connecting
+    if rt.client is not None:
+        await client.disconnect()
+        return rt.client
+
+    await attach_handlers(user_id, client)
+    rt.client = client
+    rt.hibernated = False
+    log.info(f"[⏰] Woke client for user {user_id}")
+    return client
+
+async def start_farming(user_id: int):
+    """Turn farming on, waking a hibernated client first"""
+    if not action_gate.enter():
+        return False
+    try:
+        client = await wake_client(user_id)
+        rt = users.get(user_id)
+        if client is None or rt is None:
+            return False
+        if not rt.farming:
+            rt.farm_started = time.time()
+        rt.farming = True
+        rt.last_active = time.time()
+        await send_explore_with_timeout(client, user_id, True)
+        return True
+    finally:
+        action_gate.exit()
+
+async def hibernate_idle_clients():
+    """Periodically hibernate clients that have been idle too long"""
+    while True:
+        await asyncio.sleep(HIBERNATE_CHECK_INTERVAL)
+        if HIBERNATE_AFTER <= 0:
+            continue
+        cutoff = time.time() - HIBERNATE_AFTER
+        for rt in users.values():
+            if rt.client is not None and not rt.farming and rt.last_active < cutoff:
+                await shards.run_on(rt.user_id, hibernate_client(rt))
+
+# ==============================
+# CLIENT WATCHDOG & HEALTH CHECKS
+# ==============================
+# Farming clients that dropped their connection or went quiet are reconnected
+# and their /explore chain restarted, with per-user backoff (see watchdog.py)
+watchdog = ClientWatchdog()
+
+async def recover_client(rt, action):
+    """Reconnect and/or re-kick /explore for one user (runs on the user's loop)"""
+    user_id = rt.user_id
+    if not action_gate.enter():
+        return
+    try:
+        client = rt.client
+        if action == RECONNECT:
+            if client is None:
+                rt.hibernated = True
+                client = await wake_client(user_id)
+            elif not client.is_connected():
+                await asyncio.wait_for(client.connect(), timeout=WAKE_TIMEOUT)
+            log.info(f"[🔌] Watchdog reconnected client for user {user_id}")
+        if client is None or not rt.farming:
+            return
+        log.info(f"[🐕] Watchdog restarting /explore for user {user_id} (attempt {rt.watchdog_failures})")
+        rt.in_combat = False  # no message for the whole stall, the fight is not going on
+        await send_explore_with_timeout(client, user_id, True)
+    except Exception as e:
+        log.error(f"[✗] Watchdog {action} failed for user {user_id}: {e}")
+    finally:
+        action_gate.exit()
+    if rt.watchdog_failures == ALERT_AFTER:
+        await bot_api.call(bot.send_message, user_id,
+                           "⚠️ Farming looks stuck and automatic recovery keeps failing. "
+                           "Try /toggle, or /setup if your session expired.")
+
+async def supervise_clients():
+    while True:
+        await asyncio.sleep(WATCHDOG_INTERVAL)
+        if action_gate.closed:
+            return
+        for rt, action in watchdog.sweep(users.values(), time.time()):
+            loop.create_task(shards.run_on(rt.user_id, recover_client(rt, action)))
+
+def liveness():
+    lags = [runtime.loop_lag(shard_loop) for shard_loop in shards.loops]
+    return all(lag is not None for lag in lags), {
+        "loop_lag_ms": [round(lag * 1000, 1) if lag is not None else None for lag in lags],
+    }
+
+def readiness():
+    # Storage is reported only: writes go to the WAL while MongoDB is down,
+    # so an outage must not take the bot out of rotation
+    loops_ok, loop_detail = liveness()
+    watchdog_ok = time.time() - watchdog.last_sweep < 3 * WATCHDOG_INTERVAL
+    return loops_ok and watchdog_ok and not action_gate.closed, {
+        **loop_detail,
+        "storage": bool(mongo_manager and mongo_manager.is_available()),
+        "watchdog": watchdog_ok,
+        "shutting_down": action_gate.closed,
+        "unhealthy_clients": watchdog.unhealthy,
+    }
+
+set_health_checks(liveness, readiness)
+
+# ==============================
+# FARMING SCHEDULES & STAGGERED STARTS
+# ==============================
+# Every farming start (manual /toggle or schedule) is queued on one fleet-wide
+# timer heap and spread FARM_START_INTERVAL apart. Users with a schedule have
+# exactly one pending timer: the next window opening or closing.
+FARM_START_INTERVAL = float(os.environ.get("FARM_START_INTERVAL", "0.5"))
+farm_timers = TimerQueue()
+start_stagger = StartStagger(FARM_START_INTERVAL)
+
+def request_farming_start(user_id: int) -> float:
+    """Queue a staggered farming start, returns the delay in seconds"""
+    slot = start_stagger.next_slot()
+    farm_timers.schedule(slot, ("start", user_id), lambda: shards.run_on(user_id, begin_farming_session(user_id)))
+    return slot - time.time()
+
+async def begin_farming_session(user_id: int):
+    if await start_farming(user_id):
+        plan_farming(user_id)
+
+def plan_farming(user_id: int):
+    """Schedule the next window transition for a user with a schedule"""
+    schedule = get_user_schedule(user_id)
+    rt = users.get(user_id)
+    if not schedule or rt is None or rt.paused:
+        farm_timers.cancel(user_id)
+        return
+
+    now = time.time()
+    in_window, boundary = window_state(schedule, now)
+    if in_window and rt.farming:
+        close_at = boundary
+        if schedule.get('max_session'):
+            close_at = min(close_at, rt.farm_started + schedule['max_session'] * 60)
+        farm_timers.schedule(close_at, user_id, lambda: close_farming_window(user_id))
+    else:
+        farm_timers.schedule(now if in_window else boundary, user_id, lambda: open_farming_window(user_id))
+
+async def open_farming_window(user_id: int):
+    rt = users.get(user_id)
+    if rt is None or rt.paused or not users.has_session(user_id) or not is_approved(user_id):
+        return
+    if rt.farming:
+        plan_farming(user_id)
+    else:
+        request_farming_start(user_id)  # plans the closing timer once started
+
+async def close_farming_window(user_id: int):
+    schedule = get_user_schedule(user_id)
+    rt = users.get(user_id)
+    if not schedule or rt is None or rt.paused:
+        return
+
+    now = time.time()
+    in_window, boundary = window_state(schedule, now)
+    max_reached = bool(schedule.get('max_session')) and now >= rt.farm_started + schedule['max_session'] * 60
+    if in_window and not max_reached:
+        # The window goes on (it runs into the next day or the schedule changed)
+        plan_farming(user_id)
+        return
+
+    if rt.farming:
+        rt.farming = False
+        rt.last_active = now
+        note = "☕ Scheduled break" if in_window else "🌙 Farming window closed"
+        await bot_api.call(bot.send_message, user_id, f"{note} - farming paused")
+
+    resume_at = now + schedule.get('break', 0) * 60 if in_window else boundary
+    farm_timers.schedule(resume_at, user_id, lambda: open_farming_window(user_id))
+
+@bot.message_handler(commands=['schedule'])
+def cmd_schedule(message):
+    uid = message.from_user.id
+    if not is_approved(uid):
+        bot.reply_to(message, "🚫 Not approved or approval expired.")
+        return
+
+    args = message.text.split()[1:]
+    if not args:
+        schedule = get_user_schedule(uid)
+        current = format_schedule(schedule) if schedule else "none"
+        bot.reply_to(
+            message,
+            f"🗓 Farming schedule: {current}\n\n"
+            "Usage: /schedule 08:00-12:00 18:00-23:00 [max=90] [break=15]\n"
+            "Times are UTC, max/break in minutes. /schedule off removes it."
+        )
+        return
+
+    if args[0].lower() == "off":
+        set_user_schedule(uid, None)
+        plan_farming(uid)
+        bot.reply_to(message, "🗓 Schedule removed. Use /toggle to farm manually.")
+        return
+
+    try:
+        schedule = parse_schedule(args)
+    except ValueError as e:
+        bot.reply_to(message, f"❌ Invalid schedule: {e}")
+        return
+
+    set_user_schedule(uid, schedule)
+    plan_farming(uid)
+    rt = users.get(uid)
+    note = "\nFarming is stopped, turn it on with /toggle to follow the schedule." if rt and rt.paused else ""
+    bot.reply_to(message, f"✅ Schedule set: {format_schedule(schedule)}{note}")
+
 # ==============================
 # GROUP NOTIFICATIONS
 # ==============================
@@ -997,7 +1515,8 @@ def get_user_commands():
     return (
         "🤖 *User Commands:*\n\n"
         "*Farming:*\n"
-        "/toggle - Start aura farming system\n\n"
+        "/toggle - Start aura farming system\n"
+        "/schedule - Set daily farming windows\n\n"
         "*Settings:*\n"
         "/gcnoti - Toggle group notifications\n"
         "/setup - Login to aura bot\n"
@@ -1005,6 +1524,8 @@ def get_user_commands():
         "/approval_status - Check approval status\n\n"
         "*Info:*\n"
         "/help - Show this help message\n"
+        "/tradestats - Trader price statistics\n"
+        "/farmstats - Your farming events (24h)\n"
         "/ping - Check bot latency"
     )
 
@@ -1016,12 +1537,14 @@ def get_owner_commands():
         "*User Management:*\n"
         "/approve <id> [duration] - Approve user\n"
         "/unapprove <id> - Remove approval\n"
-        "/approvelist - List approved users\n"
-        "/dbstats - Database Statistics\n\n"
+        "/approvelist [soon|permanent|farming] - List approved users\n"
+        "/dbstats - Database Statistics\n"
+        "/metrics - Runtime and event loop metrics\n\n"
         "*Admin Management (Owner Only):*\n"
         "/promote <id> - Promote user to admin\n"
         "/demote <id> - Demote admin\n"
-        "/adminlist - List all admins\n\n"
+        "/adminlist - List all admins\n"
+        "/trace <id> [follow|unfollow] - Recent farm decisions of a user\n\n"
         "*Duration formats:*\n"
         "`1d` - 1 day, `1w` - 1 week, `1m` - 1 month, `p` - permanent"
     )
@@ -1211,27 +1734,122 @@ def cmd_approval_status(message):
         else:
             bot.reply_to(message, f"✅ Your approval expires in {remaining}")
 
+# ==============================
+# APPROVAL LIST (PAGINATED)
+# ==============================
+APPROVALS_PAGE_SIZE = 20
+EXPIRING_SOON_SECONDS = 3 * 24 * 3600
+
+APPROVAL_FILTERS = {
+    "all": "All",
+    "soon": "Expiring soon",
+    "permanent": "Permanent",
+    "farming": "Farming",
+}
+
+def approval_filter_query(filter_name):
+    """Build the MongoDB query for an approval list filter"""
+    now = time.time()
+    if filter_name == "soon":
+        return {"expiration": {"$gt": now, "$lte": now + EXPIRING_SOON_SECONDS}}
+    if filter_name == "permanent":
+        return {"expiration": None}
+    if filter_name == "farming":
+        return {"user_id": {"$in": [rt.user_id for rt in users.values() if rt.farming]}}
+    return {}
+
+def approval_filter_match(filter_name, uid, expiration):
+    """In-memory equivalent of approval_filter_query"""
+    now = time.time()
+    if filter_name == "soon":
+        return expiration is not None and now < expiration <= now + EXPIRING_SOON_SECONDS
+    if filter_name == "permanent":
+        return expiration is None
+    if filter_name == "farming":
+        return users.is_farming(uid)
+    return True
+
+def get_approvals_page(filter_name, page):
+    """Get one page of approved users, returns (rows, has_more)"""
+    skip = page * APPROVALS_PAGE_SIZE
+    if mongo_manager:
+        return mongo_manager.get_approved_users_page(
+            approval_filter_query(filter_name), skip, APPROVALS_PAGE_SIZE
+        )
+
+    rows = sorted(
+        ((uid, exp) for uid, exp in approved_users.items() if approval_filter_match(filter_name, uid, exp)),
+        key=lambda row: (row[1] is not None, row[1] or 0, row[0])
+    )
+    return rows[skip:skip + APPROVALS_PAGE_SIZE], len(rows) > skip + APPROVALS_PAGE_SIZE
+
+def render_approvals_page(filter_name, page):
+    """Render one approval list page, returns (text, markup)"""
+    rows, has_more = get_approvals_page(filter_name, page)
+
+    response = f"Approved users ({APPROVAL_FILTERS[filter_name]}) - page {page + 1}:\n"
+    if not rows:
+        response += "No approved users\n"
+    for uid, expiration in rows:
+        user_name = get_user_name(uid)
+        status = "permanent" if expiration is None else format_time_remaining(expiration)
+        response += f"• {user_name} ({uid}): {status}\n"
+
+    markup = types.InlineKeyboardMarkup()
+    nav = []
+    if page > 0:
+        nav.append(types.InlineKeyboardButton("⬅️ Prev", callback_data=f"apl:{filter_name}:{page - 1}"))
+    if has_more:
+        nav.append(types.InlineKeyboardButton("Next ➡️", callback_data=f"apl:{filter_name}:{page + 1}"))
+    if nav:
+        markup.row(*nav)
+    markup.row(*[
+        types.InlineKeyboardButton(label, callback_data=f"apl:{name}:0")
+        for name, label in APPROVAL_FILTERS.items() if name != filter_name
+    ])
+    return response, markup
+
 @bot.message_handler(commands=['approvelist'])
 @admin_only
 def cmd_list_approvals(message):
-    if not approved_users:
-        bot.reply_to(message, "No approved users")
+    parts = message.text.split()
+    filter_name = parts[1].lower() if len(parts) > 1 else "all"
+    if filter_name not in APPROVAL_FILTERS:
+        bot.reply_to(message, f"Usage: /approvelist [{'|'.join(APPROVAL_FILTERS)}]")
+        return
+
+    text, markup = render_approvals_page(filter_name, 0)
+    bot.reply_to(message, text, reply_markup=markup)
+
+@bot.callback_query_handler(func=lambda c: c.data.startswith("apl:"))
+def cb_list_approvals(call):
+    if not is_admin(call.from_user.id):
+        bot.answer_callback_query(call.id, "Admin access required")
+        return
+
+    try:
+        _, filter_name, page_str = call.data.split(":")
+        page = max(int(page_str), 0)
+        if filter_name not in APPROVAL_FILTERS:
+            raise ValueError(filter_name)
+    except ValueError:
+        bot.answer_callback_query(call.id, "Invalid page")
         return
-    
-    response = "Approved users:\n"
-    for uid, expiration in approved_users.items():
-        user_name = get_user_name(uid)
-        status = "permanent" if expiration is None else format_time_remaining(expiration)
-        response += f"• {user_name} ({uid}): {status}\n"
-    
-    bot.reply_to(message, response)
+
+    text, markup = render_approvals_page(filter_name, page)
+    try:
+        bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+    except Exception as e:
+        log.error(f"Approval list page edit failed: {e}")
+    bot.answer_callback_query(call.id)
 
 @bot.message_handler(commands=['cancel'])
 def cmd_cancel(message):
     uid = message.from_user.id
-    client = user_clients.get(uid) or pending_clients.get(uid)
+    rt = users.get(uid)
+    client = rt.active_client() if rt else None
 
-    if not client and not waiting_for_phone.get(uid, False):
+    if not client and not (rt and (rt.waiting_for_phone or rt.hibernated)):
         bot.reply_to(message, "⚠️ No active farming or login session to cancel.")
         return
 
@@ -1243,25 +1861,20 @@ def cmd_cancel(message):
             pass
         
         # Only clean up from memory, NOT from MongoDB
-        user_clients.pop(uid, None)
-        pending_clients.pop(uid, None)
-        farming_enabled[uid] = False
-        pending_expect[uid] = None
-        waiting_for_phone[uid] = False
-        user_session_state.pop(uid, None)
-        set_user_logged_in(uid, False)  # Mark as logged out
+        cleanup_user_session(uid)
         
-        bot.send_message(uid, "⛔ Session cancelled. Use /setup to start again.")
+        await bot_api.call(bot.send_message, uid, "⛔ Session cancelled. Use /setup to start again.")
 
-    asyncio.run_coroutine_threadsafe(do_cancel(), loop)
+    shards.submit(uid, do_cancel())
 
 @bot.message_handler(commands=['delete'])
 def cmd_delete(message):
     uid = message.from_user.id
     
-    client = user_clients.get(uid) or pending_clients.get(uid)
+    rt = users.get(uid)
+    client = rt.active_client() if rt else None
     
-    if not client and not waiting_for_phone.get(uid, False):
+    if not client and not (rt and (rt.waiting_for_phone or rt.hibernated)):
         bot.reply_to(message, "⚠️ No active session to delete.")
         return
 
@@ -1286,9 +1899,9 @@ def cmd_delete(message):
             os.remove(session_file)
             log.info(f"[🗑️] Deleted local session file for user {uid}")
         
-        bot.send_message(uid, "🗑️ Session deleted successfully! Use /setup to login again with your phone number and OTP.")
+        await bot_api.call(bot.send_message, uid, "🗑️ Session deleted successfully! Use /setup to login again with your phone number and OTP.")
 
-    asyncio.run_coroutine_threadsafe(do_delete(), loop)
+    shards.submit(uid, do_delete())
     
 @bot.message_handler(commands=['setup'])
 def cmd_setup(message):
@@ -1298,23 +1911,28 @@ def cmd_setup(message):
         return
 
     # Check if user already has an active session in memory
-    if uid in user_clients:
+    if users.has_session(uid):
         bot.reply_to(message, "✅ You are already logged in! Use /toggle to start farming.")
         return
 
     # Check if session exists in MongoDB but not in memory (after /cancel)
-    if mongo_manager and mongo_manager.session_file_exists(uid):
+    exists = mongo_manager.session_file_exists(uid) if mongo_manager else False
+    if exists is UNAVAILABLE:
+        bot.reply_to(message, STORAGE_UNAVAILABLE_TEXT)
+        return
+    if exists:
         # Session exists in DB but not in memory - restore it
         bot.reply_to(message, "🔄 Restoring your existing session...")
-        asyncio.run_coroutine_threadsafe(restore_existing_session(uid), loop)
+        shards.submit(uid, restore_existing_session(uid))
     else:
         # No existing session - start new login
-        waiting_for_phone[uid] = True
+        users.get_or_create(uid).waiting_for_phone = True
         msg = bot.reply_to(message, "📱 Send your phone number with country code:")
         bot.register_next_step_handler(msg, lambda m: process_phone(m, uid))
 
 def process_phone(message, uid):
-    if not waiting_for_phone.get(uid, False):
+    rt = users.get(uid)
+    if rt is None or not rt.waiting_for_phone:
         return
 
     phone = message.text.strip()
@@ -1323,8 +1941,8 @@ def process_phone(message, uid):
         bot.register_next_step_handler(msg, lambda m: process_phone(m, uid))
         return
 
-    waiting_for_phone[uid] = False
-    future = asyncio.run_coroutine_threadsafe(start_client(uid, phone), loop)
+    rt.waiting_for_phone = False
+    future = shards.submit(uid, start_client(uid, phone))
     try:
         future.result()
     except Exception as e:
@@ -1337,7 +1955,7 @@ def cmd_toggle(message):
         bot.reply_to(message, "🚫 Not approved or approval expired.")
         return
         
-    if uid not in user_clients:
+    if not users.has_session(uid):
         bot.reply_to(message, "⚠️ Not logged in.")
         return
         
@@ -1360,17 +1978,22 @@ def cb_toggle(call):
         bot.answer_callback_query(call.id, "Not allowed")
         return
         
-    client = user_clients.get(uid)
-    if not client:
+    rt = users.get(uid)
+    if not users.has_session(uid):
         return
         
     if action == "on":
-        farming_enabled[uid] = True
-        asyncio.run_coroutine_threadsafe(send_explore_with_timeout(client, uid, True), loop)
-        bot.send_message(uid, "🟢 Farming started")
+        rt.paused = False
+        delay = request_farming_start(uid)
+        bot.send_message(uid, "🟢 Farming started" if delay < 1 else f"🟢 Farming starts in {int(delay)}s")
         bot.answer_callback_query(call.id, "Started")
     else:
-        farming_enabled[uid] = False
+        # Also drop the schedule timer, or the next window transition restarts farming
+        farm_timers.cancel(("start", uid))
+        farm_timers.cancel(uid)
+        rt.paused = True
+        rt.farming = False
+        rt.last_active = time.time()
         bot.send_message(uid, "🔴 Farming stopped")
         bot.answer_callback_query(call.id, "Stopped")
 
@@ -1463,46 +2086,286 @@ def cb_gcnoti(call):
     
     bot.answer_callback_query(call.id)
 
+# ==============================
+# TRADE ANALYTICS
+# ==============================
+# Offers are counted in memory and written to MongoDB in batches off the hot path
+TRADE_TARGET_BUY_RATE = float(os.environ.get("TRADE_TARGET_BUY_RATE", "0.3"))
+TRADE_MIN_SAMPLES = 50
+
+trade_log = BatchInserter(mongo_manager.collection("trade_offers")) if mongo_manager else None
+trade_stats = TradeStats(sink=trade_log.add if trade_log else None)
+
+CURRENCY_LABELS = {"pearl": "💎 Pearl", "ticket": "🎫 Ticket"}
+
+def start_trade_analytics():
+    """Load offer history into the histograms, then start the batch writer"""
+    if not trade_log:
+        return
+    trade_stats.load(mongo_manager.get_trade_price_counts())
+    trade_log.start()
+
+@bot.message_handler(commands=['tradestats'])
+def cmd_tradestats(message):
+    """/tradestats [buy %] - fleet-wide offer prices and suggested max prices"""
+    uid = message.from_user.id
+    if not is_approved(uid) and not is_admin(uid):
+        bot.reply_to(message, "🚫 Not approved or approval expired.")
+        return
+
+    buy_rate = TRADE_TARGET_BUY_RATE
+    args = message.text.split()[1:]
+    if args:
+        try:
+            buy_rate = float(args[0].rstrip("%")) / 100
+            if not 0 < buy_rate <= 1:
+                raise ValueError
+        except ValueError:
+            bot.reply_to(message, "Usage: /tradestats [buy %], e.g. /tradestats 25")
+            return
+
+    limits = get_user_trade_limits(uid)
+    response = "📈 **Trader Offers (all users):**\n"
+    for currency in CURRENCIES:
+        summary = trade_stats.summary(currency)
+        response += f"\n{CURRENCY_LABELS[currency]}: `{summary['offers']}` offers, `{summary['bought']}` bought\n"
+        if not summary["offers"]:
+            continue
+        p10, p50, p90 = summary["percentiles"].values()
+        response += f"p10 `{p10}` · p50 `{p50}` · p90 `{p90}`\n"
+        share = trade_stats.share_at_or_below(currency, limits[currency])
+        response += f"Your max `{limits[currency]}` accepts `{share:.0%}` of offers\n"
+        suggested = trade_stats.suggest_limit(currency, buy_rate, TRADE_MIN_SAMPLES)
+        if suggested is not None:
+            response += f"💡 Max `{suggested}` would buy ~`{buy_rate:.0%}` of offers\n"
+    response += "\nChange your max prices with /rate"
+    bot.reply_to(message, response, parse_mode="Markdown")
+
+# ==============================
+# FARM EVENT STATS
+# ==============================
+FARM_STATS_HOURS = 24
+
+@bot.message_handler(commands=['farmstats'])
+def cmd_farmstats(message):
+    """/farmstats - own events; admins: /farmstats <user_id> or /farmstats all"""
+    uid = message.from_user.id
+    if not is_approved(uid) and not is_admin(uid):
+        bot.reply_to(message, "🚫 Not approved or approval expired.")
+        return
+    if not mongo_manager:
+        bot.reply_to(message, "❌ Storage is not connected")
+        return
+
+    args = message.text.split()[1:]
+    target = uid
+    if args:
+        if not is_admin(uid):
+            bot.reply_to(message, "❌ Admin access required.")
+            return
+        if args[0] == "all":
+            target = None
+        else:
+            try:
+                target = int(args[0])
+            except ValueError:
+                bot.reply_to(message, "Usage: /farmstats [user_id|all]")
+                return
+
+    counts = mongo_manager.get_farm_event_counts(FARM_STATS_HOURS, target)
+    who = "all users" if target is None else f"`{target}`"
+    encounters = counts.get(EVENT_ENCOUNTER, 0)
+    captchas = counts.get(EVENT_CAPTCHA, 0)
+
+    response = f"🌾 **Farm events (last {FARM_STATS_HOURS}h):** {who}\n\n"
+    response += f"⚔️ Encounters: `{encounters}` (`{encounters / FARM_STATS_HOURS:.1f}`/h)\n"
+    response += f"❗ Captchas: `{captchas}`"
+    if encounters:
+        response += f" (`{captchas * 100 / encounters:.1f}` per 100 encounters)"
+    response += "\n"
+    response += f"🧪 Essences: `{counts.get(EVENT_ESSENCE, 0)}`\n"
+    response += f"✨ Special Pets: `{counts.get(EVENT_SPECIAL_PET, 0)}`\n"
+
+    if target is not None:
+        hourly = mongo_manager.get_farm_events_per_hour(target, FARM_STATS_HOURS)
+        if hourly:
+            response += "\n🕒 **Per hour (UTC):**\n"
+            for hour, kinds in list(hourly.items())[-8:]:
+                response += f"`{hour[-5:]}` ⚔️ {kinds.get(EVENT_ENCOUNTER, 0)} ❗ {kinds.get(EVENT_CAPTCHA, 0)}\n"
+
+    bot.reply_to(message, response, parse_mode="Markdown")
+
 # ==============================
 # NEW COMMAND: DATABASE STATS
 # ==============================
 
+DB_STATS_TTL = int(os.environ.get("DB_STATS_TTL", "300"))
+db_stats_cache = StatsSnapshotCache(mongo_manager.get_database_stats, DB_STATS_TTL) if mongo_manager else None
+
+def format_bytes(num):
+    """Format a byte count like 12.3 MB"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if num < 1024:
+            return f"{num:.1f} {unit}" if unit != "B" else f"{int(num)} B"
+        num /= 1024
+    return f"{num:.1f} TB"
+
 @bot.message_handler(commands=['dbstats'])
 @admin_only
 def cmd_dbstats(message):
-    """Show MongoDB database statistics"""
+    """Show cached database statistics and live in-process figures"""
     try:
-        if not mongo_manager:
-            bot.reply_to(message, "❌ MongoDB is not connected")
-            return
-            
-        stats = mongo_manager.get_database_stats()
-        
         response = "📊 **Database Statistics:**\n\n"
-        response += f"👥 Approved Users: `{stats.get('approved_users', 0)}`\n"
-        response += f"⚙️ User Configs: `{stats.get('user_configs', 0)}`\n"
-        response += f"📝 User Data: `{stats.get('user_data', 0)}`\n"
-        response += f"💾 Session Files: `{stats.get('session_files', 0)}`\n"
-        response += f"👑 Admins: `{len(admins)}`\n\n"
-        response += "💡 All data is now stored in MongoDB!"
+        if mongo_manager:
+            health = mongo_manager.get_health()
+            response += f"🗃 Backend: `{mongo_manager.name}`"
+            if not health["available"]:
+                response += " ⚠️ unavailable, serving from cache"
+            if health["wal_pending"]:
+                response += f" (`{health['wal_pending']}` writes waiting for replay)"
+            response += "\n"
+        
+        if not db_stats_cache:
+            response += "❌ Storage is not connected\n\n"
+        else:
+            stats, age = db_stats_cache.get()
+            collections = stats.get("collections")
+            if not collections:
+                response += "⏳ Statistics are being collected, try again shortly\n\n"
+            else:
+                labels = [
+                    ("approved_users", "👥 Approved Users"),
+                    ("user_config", "⚙️ User Configs"),
+                    ("user_data", "📝 User Data"),
+                    ("sessions", "🗂 Sessions"),
+                    ("session_files", "💾 Session Files"),
+                    ("trade_offers", "📈 Trade Offers"),
+                    ("farm_events", "🌾 Farm Events"),
+                ]
+                total_storage = total_index = 0
+                for name, label in labels:
+                    coll = collections.get(name, {})
+                    response += f"{label}: `{coll.get('count', 0)}`"
+                    if "storage_size" in coll:
+                        response += f" ({format_bytes(coll['storage_size'])}, avg `{format_bytes(coll['avg_obj_size'])}`)"
+                        total_storage += coll["storage_size"]
+                        total_index += coll["index_size"]
+                    response += "\n"
+                response += f"🗄 Storage: `{format_bytes(total_storage)}` data, `{format_bytes(total_index)}` indexes\n"
+                response += f"🕒 Snapshot age: `{int(age)}s`\n\n"
+        
+        response += "⚡ **Live:**\n"
+        response += f"👑 Admins: `{len(admins)}`\n"
+        response += f"📡 Live Clients: `{users.client_count()}` (hibernated `{users.hibernated_count()}`)\n"
+        response += f"🌾 Farming Users: `{users.farming_count()}`\n"
+        response += f"🔁 Duplicate Updates Dropped: `{MessageVersionCache.suppressed_total}`\n"
+        api_stats = bot_api.get_stats()
+        response += f"🌐 Bot API Requests: `{api_stats['requests_sent']}` (avg `{api_stats['avg_latency_ms']}` ms, in flight `{api_stats['in_flight']}`)\n"
+        response += f"⏱ Pending Timers: `{farm_timers.pending()}`\n"
+        rules_stats = game_rules.get_stats()
+        response += f"📜 Game Rules: `v{rules_stats['version']}` (reloads `{rules_stats['reloads']}`, failed `{rules_stats['failed_reloads']}`)\n"
+        watchdog_stats = watchdog.get_stats()
+        response += (f"🐕 Watchdog: `{watchdog_stats['unhealthy']}` unhealthy clients, "
+                     f"`{watchdog_stats['reconnects']}` reconnects, `{watchdog_stats['rekicks']}` explore restarts\n")
+        shard_stats = shards.get_stats()
+        if shard_stats["shards"] > 1:
+            per_shard = " / ".join(str(n) for n in shard_stats["users_per_shard"])
+            response += f"🧵 Loop Shards: `{shard_stats['shards']}` (users `{per_shard}`)\n"
+        captcha_stats = captcha_tracker.get_stats()
+        response += (f"❗ Captchas Ended: `{captcha_stats['solved']}` solved, `{captcha_stats['failed']}` failed, "
+                     f"`{captcha_stats['cleared']}` cleared (blocked avg `{captcha_stats['avg_blocked_s']}s`, "
+                     f"p90 `{captcha_stats['p90_blocked_s']}s`, max `{captcha_stats['max_blocked_s']}s`)\n")
+        if trade_log:
+            trade_log_stats = trade_log.get_stats()
+            response += f"📈 Trade Log: `{trade_log_stats['inserted']}` written, `{trade_log_stats['buffered']}` buffered, `{trade_log_stats['dropped']}` dropped\n"
+        if farm_events:
+            journal_stats = farm_events.get_stats()
+            response += f"🌾 Event Journal: `{journal_stats['inserted']}` written, `{journal_stats['buffered']}` buffered, `{journal_stats['dropped']}` dropped\n"
+        exec_stats = update_executor.get_stats()
+        response += f"📥 Handler Queue: `{exec_stats['queued']}` (peak `{exec_stats['peak_queued']}`, lanes `{exec_stats['active_lanes']}`)\n"
         
         bot.reply_to(message, response, parse_mode="Markdown")
         
     except Exception as e:
         bot.reply_to(message, f"❌ Error getting database stats: {e}")
 
+@bot.message_handler(commands=['metrics'])
+@admin_only
+def cmd_metrics(message):
+    """Runtime capabilities, event loop lag and process figures"""
+    uptime = int(time.time() - runtime_info["started"])
+    response = "🛠 **Runtime:**\n"
+    response += f"🐍 Python: `{runtime_info['python']}` ({runtime_info['mode']})\n"
+    response += f"🔁 Event Loop: `{runtime_info['event_loop']}`\n"
+    response += f"🔐 Crypto: `{runtime_info['crypto']}` (telethon `{runtime_info['telethon']}`)\n"
+    response += f"⏳ Uptime: `{uptime // 3600}h {uptime % 3600 // 60}m`\n\n"
+
+    response += "⚡ **Event Loops:**\n"
+    for index, shard_loop in enumerate(shards.loops):
+        lag = runtime.loop_lag(shard_loop)
+        lag_text = f"{lag * 1000:.1f} ms" if lag is not None else "> 2 s"
+        response += f"🧵 Shard {index}: lag `{lag_text}`, users `{shards.get_stats()['users_per_shard'][index]}`\n"
+    response += f"📡 Live Clients: `{users.client_count()}` (hibernated `{users.hibernated_count()}`)\n"
+    response += f"🧶 Threads: `{threading.active_count()}`\n"
+    log_stats = log_setup.get_stats()
+    response += f"📝 Log Queue: `{log_stats['queued']}` (dropped `{log_stats['dropped']}`, written past the queue `{log_stats['overflowed']}`, sampled out `{log_stats['sampled_out']}`)\n"
+    trace_stats = tracer.get_stats()
+    response += f"🔎 Trace Buffers: `{trace_stats['users']}` users, `{trace_stats['events']}` records, `{trace_stats['followed']}` followed\n"
+    try:
+        import resource
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        response += f"💾 Peak Memory: `{format_bytes(peak_kb * 1024)}`\n"
+    except ImportError:
+        pass
+
+    bot.reply_to(message, response, parse_mode="Markdown")
+
+TRACE_MESSAGE_LIMIT = 4000  # Telegram allows 4096 characters per message
+
+@bot.message_handler(commands=['trace'])
+@owner_only_strict
+def cmd_trace(message):
+    """Dump a user's recent farm decisions, or log them live (owner only)"""
+    parts = message.text.split()
+    if len(parts) < 2:
+        bot.reply_to(message, "Usage: /trace <user_id> [follow|unfollow]")
+        return
+    try:
+        user_id = int(parts[1])
+    except ValueError:
+        bot.reply_to(message, "❌ Invalid user ID")
+        return
+
+    if len(parts) > 2 and parts[2] in ("follow", "unfollow"):
+        following = parts[2] == "follow"
+        tracer.follow(user_id, following)
+        bot.reply_to(message, f"🔎 {'Logging' if following else 'Stopped logging'} farm decisions of {user_id} live")
+        return
+
+    lines = tracer.recent(user_id)
+    if not lines:
+        bot.reply_to(message, f"🔎 No trace recorded for {user_id}")
+        return
+    # Newest records win when the dump is too long for one message
+    body, size = [], 0
+    for line in reversed(lines):
+        size += len(line) + 1
+        if size > TRACE_MESSAGE_LIMIT:
+            break
+        body.append(line)
+    bot.reply_to(message, f"🔎 Last {len(body)} farm decisions of {user_id}:\n" + "\n".join(reversed(body)))
+
 @bot.message_handler(func=lambda m:True,content_types=['text'])
 def generic_text(message):
     uid = message.from_user.id
     txt = message.text.strip()
-    expect = pending_expect.get(uid)
+    rt = users.get(uid)
+    expect = rt.pending_expect if rt else None
     if expect=="otp":
         code = re.sub(r"\s+","",txt)
-        asyncio.run_coroutine_threadsafe(complete_login(uid,code=code),loop)
+        shards.submit(uid, complete_login(uid,code=code))
     elif expect=="password":
-        asyncio.run_coroutine_threadsafe(
-            complete_login(uid, password=txt), loop
-        )
+        shards.submit(uid, complete_login(uid, password=txt))
 
 # ==============================
 # PERIODIC CLEANUP
@@ -1524,13 +2387,191 @@ async def cleanup_expired_approvals():
             approved_users.pop(uid)
             log.info(f"Removed expired approval for user {uid}")
         
-        if expired_users and mongo_manager:
+        # Every pass, not only when something expired: this also prunes old events
+        if mongo_manager:
             mongo_manager.cleanup_expired_approvals()
 
+# ==============================
+# FLEET DASHBOARD
+# ==============================
+def fleet_snapshot():
+    """Build the dashboard view from in-memory state only.
+    Called from web server threads: never touches MongoDB or the Bot API, and
+    works on a snapshot of the registry so the farm loop is never waited on."""
+    now = time.time()
+    names = dict(user_names)
+
+    rows = []
+    for rt in sorted(users.values(), key=lambda r: r.user_id):
+        client = rt.client
+        rows.append({
+            "user_id": rt.user_id,
+            "name": names[rt.user_id][0] if rt.user_id in names else None,
+            "connected": bool(client and client.is_connected()),
+            "hibernated": rt.hibernated,
+            "farming": rt.farming,
+            "captcha": rt.captcha_active,
+            "captcha_age": int(now - rt.captcha_since) if rt.captcha_active and rt.captcha_since else None,
+            "in_combat": rt.in_combat,
+            "last_explore_age": int(now - rt.last_explore) if rt.last_explore else None,
+        })
+
+    return {
+        "generated_at": now,
+        "totals": {
+            "clients": sum(1 for r in rows if r["connected"]),
+            "farming": sum(1 for r in rows if r["farming"]),
+            "captcha": sum(1 for r in rows if r["captcha"]),
+        },
+        "users": rows,
+    }
+
+set_fleet_provider(fleet_snapshot)
+
+# ==============================
+# WEBHOOK MODE
+# ==============================
+# Updates POSTed by Telegram go straight to the ordered handler executor.
+# A full executor answers 503 so Telegram redelivers later.
+# Local test: curl -X POST -H "Content-Type: application/json" \
+#   -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" \
+#   -d @update.json http://localhost:8080/webhook/$WEBHOOK_SECRET
+@web_app.route(WEBHOOK_PATH, methods=["POST"])
+def telegram_webhook():
+    if web_request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+        return "forbidden", 403
+    try:
+        update = types.Update.de_json(web_request.get_data(as_text=True))
+    except Exception as e:
+        log.error(f"[✗] Bad webhook payload: {e}")
+        return "bad request", 400
+    if not bot.dispatch_update(update, block=False):
+        log.warning("[✗] Handler queue full, asking Telegram to retry")
+        return "busy", 503
+    return "ok", 200
+
+def start_webhook():
+    """Register the webhook with Telegram"""
+    try:
+        bot.remove_webhook()
+        if not bot.set_webhook(url=f"{WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET,
+                               max_connections=WEBHOOK_MAX_CONNECTIONS):
+            return False
+    except Exception as e:
+        log.error(f"❌ Failed to set webhook: {e}")
+        return False
+
+    log.info("✅ Webhook mode active")
+    return True
+
+# ==============================
+# SHUTDOWN & HOT RESTART
+# ==============================
+# See shutdown.py for the sequence and the handoff state format.
+async def release_user(rt):
+    """Disconnect one user's client and leave a handoff state (runs on the user's loop)"""
+    client = rt.client or rt.pending_client
+    state = {"handoff": True, "farming": rt.farming, "hibernated": rt.client is None,
+             "released_at": time.time()}
+    rt.farming = False
+    rt.client = rt.pending_client = None
+    if client is not None:
+        try:
+            await client.disconnect()
+        except Exception as e:
+            log.warning(f"[!] Disconnect failed while releasing user {rt.user_id}: {e}")
+    if not rt.logged_in or not mongo_manager:
+        return
+    storage_loop = asyncio.get_running_loop()
+    if not state["hibernated"]:
+        await storage_loop.run_in_executor(None, persist_session_file, rt.user_id)
+    await storage_loop.run_in_executor(None, mongo_manager.save_session_state, rt.user_id, state)
+
+async def release_shard(index: int):
+    released = [rt for rt in (users.get(uid) for uid in shards.users_on(index)) if rt is not None]
+    await asyncio.gather(*(shards.run_on(rt.user_id, release_user(rt)) for rt in released),
+                         return_exceptions=True)
+    return len(released)
+
+async def graceful_shutdown(reason: str):
+    if action_gate.closed:
+        return
+    log.info(f"[🛑] {reason} received, shutting down")
+    action_gate.close()
+    update_executor.close()
+    bot.stop_polling()
+
+    executor_loop = asyncio.get_running_loop()
+    if not await executor_loop.run_in_executor(None, update_executor.drain, SHUTDOWN_GRACE):
+        log.warning(f"[!] {update_executor.get_stats()['queued']} commands still queued after {SHUTDOWN_GRACE}s")
+    if not await executor_loop.run_in_executor(None, action_gate.wait_idle, SHUTDOWN_GRACE):
+        log.warning(f"[!] {action_gate.running} actions still running after {SHUTDOWN_GRACE}s")
+
+    for index in range(len(shards.loops)):
+        released = await release_shard(index)
+        log.info(f"[🤝] Released shard {index} ({released} users)")
+
+    for inserter in (farm_events, trade_log):
+        if inserter:
+            await executor_loop.run_in_executor(None, inserter.flush)
+    if mongo_manager:
+        pending = mongo_manager.get_health().get("wal_pending")
+        if pending:
+            log.warning(f"[!] {pending} writes left in the write-ahead log for the next start")
+        mongo_manager.close_connection()
+
+    log.info("[🛑] Shutdown complete")
+    shards.stop()
+
+async def resume_user(user_id: int, state: dict):
+    """Take over a user released by the previous process (runs on the user's loop)"""
+    mongo_manager.delete_session_state(user_id)
+    if not is_approved(user_id):
+        return
+    rt = users.get_or_create(user_id)
+    rt.hibernated = True  # wake_client() reconnects from the saved session
+    set_user_logged_in(user_id, True)
+    if state.get("hibernated"):
+        return
+    if await wake_client(user_id) is not None and state.get("farming"):
+        request_farming_start(user_id)
+
+async def take_over_sessions():
+    """Resume handed-off users, polling HANDOFF_WAIT seconds for shards a
+    still running process has yet to release"""
+    if not mongo_manager:
+        return
+    deadline = time.time() + HANDOFF_WAIT
+    taken = set()
+    while True:
+        states = await asyncio.get_running_loop().run_in_executor(None, mongo_manager.get_all_session_states)
+        handoffs = {uid: state for uid, state in states.items() if state.get("handoff") and uid not in taken}
+        if handoffs:
+            taken.update(handoffs)
+            await asyncio.gather(*(shards.run_on(uid, resume_user(uid, state)) for uid, state in handoffs.items()),
+                                 return_exceptions=True)
+            log.info(f"[🤝] Took over {len(handoffs)} users from the previous process")
+        if time.time() >= deadline:
+            return
+        await asyncio.sleep(HANDOFF_POLL_INTERVAL)
+
+def install_signal_handlers():
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, lambda sig=sig: loop.create_task(graceful_shutdown(sig.name)))
+        except NotImplementedError:
+            # Windows: no loop signal handlers, hop onto the loop from the handler
+            signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(
+                loop.create_task, graceful_shutdown(signal.Signals(signum).name)))
+
 # ==============================
 # MAIN WITH KEEP-ALIVE
 # ==============================
 def start_polling():
+    try:
+        bot.remove_webhook()
+    except Exception as e:
+        log.error(f"❌ Failed to remove webhook: {e}")
     bot.infinity_polling(timeout=60, long_polling_timeout=60)
 
 if __name__ == "__main__":
@@ -1539,6 +2580,22 @@ if __name__ == "__main__":
     
     # Start the periodic cleanup task
     asyncio.run_coroutine_threadsafe(cleanup_expired_approvals(), loop)
+    asyncio.run_coroutine_threadsafe(hibernate_idle_clients(), loop)
+    asyncio.run_coroutine_threadsafe(farm_timers.run(), loop)
+    asyncio.run_coroutine_threadsafe(take_over_sessions(), loop)
+    asyncio.run_coroutine_threadsafe(supervise_clients(), loop)
+    install_signal_handlers()
+    
+    shards.start()
+    game_rules.start()
+    update_executor.start()
+    if db_stats_cache:
+        db_stats_cache.start()
+    threading.Thread(target=start_trade_analytics, name="trade-analytics", daemon=True).start()
+    if farm_events:
+        farm_events.start()
     
-    threading.Thread(target=start_polling, daemon=True).start()
+    # Webhook mode when configured, long polling otherwise (or as fallback)
+    if not (WEBHOOK_URL and start_webhook()):
+        threading.Thread(target=start_polling, daemon=True).start()
     loop.run_forever()
@@ -0,0 +1,97 @@
+"""
+Shared transport for the telebot Bot API client.
+
+telebot creates a default requests session per thread with urllib3's default
+pool of 10 connections and no limit on how many calls run at once. This module
+installs one persistent session for every thread instead:
+- Connection pool sized from BOT_API_POOL_SIZE, kept alive between calls
+- BOT_API_MAX_CONCURRENCY requests in flight at most, the rest wait for a slot
+- A small executor so coroutines on the asyncio loop can call the sync client
+  without blocking the loop on HTTP
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+
+log = logging.getLogger("BotAPI")
+
+POOL_SIZE = int(os.environ.get("BOT_API_POOL_SIZE", "16"))
+MAX_CONCURRENCY = int(os.environ.get("BOT_API_MAX_CONCURRENCY", str(POOL_SIZE)))
+EXECUTOR_THREADS = int(os.environ.get("BOT_API_EXECUTOR_THREADS", "8"))
+
+
+class BotApiTransport:
+    def __init__(self, pool_size=POOL_SIZE, max_concurrency=MAX_CONCURRENCY, executor_threads=EXECUTOR_THREADS):
+        self.session = requests.Session()
+        # Only api.telegram.org is ever contacted, so one host pool is enough
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=executor_threads, thread_name_prefix="botapi")
+
+        self.requests_sent = 0
+        self.requests_failed = 0
+        self.in_flight = 0
+        self.total_latency = 0.0
+
+    def request(self, method, url, **kwargs):
+        """Request sender used by telebot.apihelper for every Bot API call"""
+        with self._slots:
+            with self._lock:
+                self.in_flight += 1
+            t0 = time.monotonic()
+            try:
+                return self.session.request(method, url, **kwargs)
+            except Exception:
+                with self._lock:
+                    self.requests_failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                    self.requests_sent += 1
+                    self.total_latency += time.monotonic() - t0
+
+    def install(self):
+        """Route all telebot HTTP traffic through this transport"""
+        apihelper.session = self.session
+        apihelper.CUSTOM_REQUEST_SENDER = self.request
+        log.info(f"✅ Bot API transport installed (pool={self.pool_size}, concurrency={self.max_concurrency})")
+
+    async def call(self, func, *args, **kwargs):
+        """Run a blocking telebot call from a coroutine without stalling the loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def get_stats(self):
+        with self._lock:
+            sent = self.requests_sent
+            avg_ms = (self.total_latency / sent * 1000) if sent else 0.0
+            return {
+                "requests_sent": sent,
+                "requests_failed": self.requests_failed,
+                "in_flight": self.in_flight,
+                "avg_latency_ms": round(avg_ms, 1),
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+# Global transport instance
+transport = BotApiTransport()
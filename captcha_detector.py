@@ -0,0 +1,185 @@
+"""
+Captcha detection for game bot messages.
+
+Every known captcha phrase carries a weight:
+- strong  phrases only ever appear in captchas
+- medium  phrases are captcha openers that rarely show up elsewhere
+- weak    phrases also occur in normal messages ("ship") and never pause
+          farming on their own
+The button layout adds evidence: captchas ask to pick an answer, so a row
+of numeric buttons or an unusually large keyboard counts towards the score.
+
+Evidence is combined as 1 - prod(1 - weight), so the confidence grows with
+every independent hint but never exceeds 1. A message is a captcha when the
+confidence reaches the threshold.
+
+The phrases themselves live in game_rules.json and are compiled into a
+CaptchaPatterns by game_rules.py. Matching is case-insensitive: text is
+lowercased once (cheaper than re.IGNORECASE). Every pattern has a literal
+that any match must contain ("hip" for the ship pattern), taken from the
+parsed regex; a pattern's regex only runs when its literal is in the text.
+The common case (no captcha) therefore costs a few substring checks, about
+what the plain `in` checks this module replaced cost, instead of a regex
+pass over the whole message.
+
+CaptchaTracker follows each captcha from detection to its end:
+    start   - captcha detected, farming blocked
+    solved  - the game bot confirmed a correct answer
+    failed  - the game bot rejected the answer
+    cleared - no result seen, but the game moved on to a normal message
+and keeps how long accounts stayed blocked.
+
+The labelled corpus is tests/fixtures/captcha_messages.json (checked by
+tests/test_captcha_detector.py); benchmarks/bench_captcha.py compares the
+speed with the substring check this replaced.
+"""
+
+import re
+import time
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+from collections import Counter, deque
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+DEFAULT_THRESHOLD = 0.5
+
+STRONG, MEDIUM, WEAK = 0.95, 0.7, 0.35
+WEIGHTS = {"strong": STRONG, "medium": MEDIUM, "weak": WEAK}
+
+NUMERIC_BUTTONS = ("numeric_buttons", 0.4)
+MANY_BUTTONS = ("many_buttons", 0.2)
+MANY_BUTTONS_MIN = 6
+
+
+def required_literal(regex: str) -> str:
+    """Longest run of literal characters every match of regex contains,
+    "" if there is none (a top-level alternation, a leading class...)"""
+    best, run = "", []
+    for op, arg in sre_parse.parse(regex):
+        if op is sre_parse.LITERAL:
+            run.append(chr(arg))
+        else:
+            best, run = max(best, "".join(run), key=len), []
+    return max(best, "".join(run), key=len)
+
+
+class CaptchaPatterns:
+    """Compiled captcha phrases and result messages.
+    patterns: (name, weight, literal, regex) with regexes for lowercased text"""
+
+    def __init__(self, patterns, solved, failed):
+        # (name, weight, literal, regex); an empty literal is in every text
+        self.patterns = tuple((name, weight, required_literal(regex), re.compile(regex))
+                              for name, weight, regex in patterns)
+        self.solved = re.compile(solved)
+        self.failed = re.compile(failed)
+
+
+class CaptchaVerdict(NamedTuple):
+    is_captcha: bool
+    confidence: float
+    reasons: Tuple[str, ...]
+
+
+NO_CAPTCHA = CaptchaVerdict(False, 0.0, ())
+
+
+def button_features(buttons) -> Tuple[Tuple[str, float], ...]:
+    """Layout evidence from Telethon-style button rows (objects with .text)"""
+    labels = [button.text.strip() for row in buttons for button in row]
+    features = []
+    if sum(1 for label in labels if label.isdigit()) >= 3:
+        features.append(NUMERIC_BUTTONS)
+    if len(labels) >= MANY_BUTTONS_MIN:
+        features.append(MANY_BUTTONS)
+    return tuple(features)
+
+
+def classify(text: str, patterns: CaptchaPatterns, buttons: Optional[Iterable] = None,
+             threshold: float = DEFAULT_THRESHOLD) -> CaptchaVerdict:
+    """Score one message. Buttons are only inspected when the text alone is
+    suggestive but not conclusive."""
+    text = text.lower()
+    # plain loop, no list built on the common (no match) path
+    evidence = None
+    for name, weight, literal, regex in patterns.patterns:
+        if literal in text and regex.search(text):
+            if evidence is None:
+                evidence = []
+            evidence.append((name, weight))
+    if evidence is None:
+        return NO_CAPTCHA
+
+    miss = 1.0
+    for _, weight in evidence:
+        miss *= 1.0 - weight
+
+    if buttons and 1.0 - miss < threshold:
+        for feature in button_features(buttons):
+            evidence.append(feature)
+            miss *= 1.0 - feature[1]
+
+    confidence = round(1.0 - miss, 3)
+    return CaptchaVerdict(confidence >= threshold, confidence, tuple(name for name, _ in evidence))
+
+
+# ==============================
+# LIFECYCLE
+# ==============================
+SOLVED, FAILED, CLEARED = "solved", "failed", "cleared"
+
+
+def captcha_outcome(text: str, patterns: CaptchaPatterns) -> Optional[str]:
+    """SOLVED / FAILED if the message reports a captcha result, else None"""
+    text = text.lower()
+    if patterns.failed.search(text):
+        return FAILED
+    if patterns.solved.search(text):
+        return SOLVED
+    return None
+
+
+class CaptchaTracker:
+    """Marks captchas on a UserRuntime (captcha_active / captcha_since) and
+    records how long each one blocked farming"""
+
+    def __init__(self, history=500):
+        self.outcomes = Counter()
+        self.total_blocked = 0.0
+        self.max_blocked = 0.0
+        self._recent = deque(maxlen=history)
+
+    def start(self, rt, now=None):
+        """Returns True if this starts a new captcha"""
+        if rt.captcha_active:
+            return False
+        rt.captcha_active = True
+        rt.captcha_since = now if now is not None else time.time()
+        return True
+
+    def finish(self, rt, outcome, now=None) -> float:
+        """End the user's captcha, returns the seconds farming was blocked"""
+        now = now if now is not None else time.time()
+        blocked = max(0.0, now - rt.captcha_since) if rt.captcha_since else 0.0
+        rt.captcha_active = False
+        rt.captcha_since = 0.0
+        self.outcomes[outcome] += 1
+        self.total_blocked += blocked
+        self.max_blocked = max(self.max_blocked, blocked)
+        self._recent.append(blocked)
+        return blocked
+
+    def get_stats(self):
+        recent = sorted(self._recent)
+        finished = sum(self.outcomes.values())
+        return {
+            SOLVED: self.outcomes[SOLVED],
+            FAILED: self.outcomes[FAILED],
+            CLEARED: self.outcomes[CLEARED],
+            "avg_blocked_s": round(self.total_blocked / finished, 1) if finished else 0.0,
+            "p90_blocked_s": round(float(recent[int(len(recent) * 0.9)]), 1) if recent else 0.0,
+            "max_blocked_s": round(float(self.max_blocked), 1),
+        }
+
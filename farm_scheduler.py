@@ -0,0 +1,205 @@
+"""
+Farming schedules and fleet-wide staggered starts.
+
+A schedule is stored in user_config under "schedule":
+    {"windows": [[start_min, end_min], ...],   # minutes since 00:00 UTC
+     "max_session": 90,                        # minutes, 0 = whole window
+     "break": 15}                              # minutes off after max_session
+
+All timers for the whole fleet live in one TimerQueue: a heap driven by a
+single asyncio task, instead of one sleeping task per user. Farming starts go
+through StartStagger so that users starting together (restart, window
+opening at 08:00 for everyone) are spread START_INTERVAL apart.
+"""
+
+import heapq
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+log = logging.getLogger("Scheduler")
+
+DAY_MINUTES = 24 * 60
+
+
+# ==============================
+# SCHEDULE PARSING
+# ==============================
+def parse_clock(value):
+    """Parse 'HH:MM' into minutes since midnight"""
+    hours, sep, minutes = value.partition(":")
+    if not (sep and hours.isdigit() and minutes.isdigit() and len(minutes) == 2):
+        raise ValueError(f"invalid time '{value}', use HH:MM")
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > DAY_MINUTES:
+        raise ValueError(f"invalid time '{value}'")
+    return hours * 60 + minutes
+
+def parse_minutes(arg):
+    """Parse the value of 'max=90' / 'break=15'"""
+    name, _, value = arg.partition("=")
+    if not value.isdigit():
+        raise ValueError(f"{name} must be a whole number of minutes, got '{value}'")
+    return int(value)
+
+def format_clock(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def parse_schedule(args):
+    """Parse ['08:00-12:00', '18:00-23:00', 'max=90', 'break=15'] into a schedule dict.
+    Raises ValueError on bad input."""
+    schedule = {"windows": [], "max_session": 0, "break": 0}
+    for arg in args:
+        if arg.startswith("max="):
+            schedule["max_session"] = parse_minutes(arg)
+        elif arg.startswith("break="):
+            schedule["break"] = parse_minutes(arg)
+        else:
+            start, sep, end = arg.partition("-")
+            if not sep:
+                raise ValueError(f"'{arg}' is not a window, use HH:MM-HH:MM")
+            start, end = parse_clock(start), parse_clock(end)
+            if start == end:
+                raise ValueError(f"empty window {arg}")
+            schedule["windows"].append([start, end])
+
+    if not schedule["windows"]:
+        raise ValueError("no time windows given")
+    return schedule
+
+def format_schedule(schedule):
+    text = ", ".join(f"{format_clock(s)}-{format_clock(e)}" for s, e in schedule["windows"])
+    if schedule.get("max_session"):
+        text += f" | max {schedule['max_session']}m, break {schedule.get('break', 0)}m"
+    return text + " (UTC)"
+
+
+# ==============================
+# WINDOW MATH
+# ==============================
+def _window_spans(schedule, today):
+    """(start_ts, end_ts) of the windows from yesterday to tomorrow, sorted.
+    Windows like 22:00-02:00 wrap past midnight; windows that overlap or
+    touch (22:00-24:00 00:00-06:00, 00:00-24:00 on consecutive days) are
+    merged into one span, so midnight is not a boundary inside them."""
+    spans = []
+    for day_start in (today - 86400, today, today + 86400):
+        for start, end in schedule["windows"]:
+            if end <= start:
+                end += DAY_MINUTES
+            spans.append((day_start + start * 60, day_start + end * 60))
+    spans.sort()
+
+    merged = []
+    for start_ts, end_ts in spans:
+        if merged and start_ts <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end_ts)
+        else:
+            merged.append([start_ts, end_ts])
+    return merged
+
+def window_state(schedule, now=None):
+    """Return (in_window, boundary_ts).
+    In a window, boundary is when it closes; outside, when the next one opens."""
+    now = now if now is not None else time.time()
+    today = datetime.fromtimestamp(now, timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+    # Yesterday's windows can wrap into today, tomorrow's give the next opening
+    for start_ts, end_ts in _window_spans(schedule, today):
+        if start_ts <= now < end_ts:
+            return True, end_ts
+        if start_ts > now:
+            return False, start_ts
+    return False, None
+
+
+# ==============================
+# TIMERS
+# ==============================
+class TimerQueue:
+    """One heap of timers for the whole fleet, run by a single asyncio task.
+    Each key has at most one pending timer; scheduling again replaces it.
+    schedule()/cancel() are safe to call from any thread."""
+
+    def __init__(self):
+        self._heap = []
+        self._tokens = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+
+    def schedule(self, due, key, callback):
+        """Run callback() (a coroutine function) at timestamp due"""
+        with self._lock:
+            self._seq += 1
+            self._tokens[key] = self._seq
+            heapq.heappush(self._heap, (due, self._seq, key, callback))
+            is_first = self._heap[0][1] == self._seq
+        if is_first:
+            self._wake()
+
+    def cancel(self, key):
+        with self._lock:
+            self._tokens.pop(key, None)
+
+    def pending(self):
+        with self._lock:
+            return len(self._tokens)
+
+    def _wake(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _pop_due(self, now):
+        """Pop due timers, returns (callbacks, seconds until the next one)"""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, seq, key, callback = heapq.heappop(self._heap)
+                if self._tokens.get(key) == seq:
+                    del self._tokens[key]
+                    due.append((key, callback))
+            delay = self._heap[0][0] - now if self._heap else None
+        return due, delay
+
+    @staticmethod
+    async def _run_callback(key, callback):
+        try:
+            await callback()
+        except Exception as e:
+            log.error(f"[✗] Scheduled task {key} failed: {e}")
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        while True:
+            due, delay = self._pop_due(time.time())
+            # Run callbacks as tasks so a slow one never delays other timers
+            for key, callback in due:
+                self._loop.create_task(self._run_callback(key, callback))
+            if due:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+class StartStagger:
+    """Hands out start times at least `interval` seconds apart"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def next_slot(self, now=None):
+        now = now if now is not None else time.time()
+        with self._lock:
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+            return slot
@@ -0,0 +1,78 @@
+"""
+Per-user farm tracing.
+
+Farm decisions (explores, clicks, captures, trades...) are recorded into a
+small ring buffer per user instead of being logged. A record is one tuple of
+the timestamp, a short kind, a %-style format string and its arguments, so
+nothing is formatted unless someone reads it:
+    tracer.record(user_id, "click", "Engage %s", button.text)
+    tracer.record(user_id, "explore", "answered", duration=0.84)
+Each user keeps the last TRACE_EVENTS records; /trace <uid> dumps them.
+
+Records are also written to the log when
+- the user is followed (/trace <uid> follow): INFO on the AutoFarm.trace logger
+- the farm logger is enabled for INFO (FARM_LOG_LEVEL=INFO): every user
+"""
+
+import os
+import time
+import logging
+from collections import deque
+
+TRACE_EVENTS = int(os.environ.get("TRACE_EVENTS", "50"))
+
+
+class Tracer:
+    def __init__(self, size=TRACE_EVENTS, farm_log=None):
+        self.size = size
+        self.farm_log = farm_log
+        self.follow_log = logging.getLogger("AutoFarm.trace")
+        self.followed = set()
+        self._rings = {}
+
+    def record(self, user_id, kind, fmt="", *args, duration=None):
+        ring = self._rings.get(user_id)
+        if ring is None:
+            ring = self._rings.setdefault(user_id, deque(maxlen=self.size))
+        entry = (time.time(), kind, fmt, args, duration)
+        ring.append(entry)
+        if user_id in self.followed:
+            self.follow_log.info("[🔎 %s] %s", user_id, self.format(entry))
+        elif self.farm_log is not None and self.farm_log.isEnabledFor(logging.INFO):
+            self.farm_log.info("[User %s] %s", user_id, self.format(entry))
+
+    @staticmethod
+    def format(entry) -> str:
+        ts, kind, fmt, args, duration = entry
+        try:
+            text = fmt % args if args else fmt
+        except (TypeError, ValueError):
+            text = f"{fmt} {args}"
+        line = f"{time.strftime('%H:%M:%S', time.localtime(ts))}.{int(ts % 1 * 1000):03d} {kind:<9} {text}"
+        if duration is not None:
+            line += f" [{duration * 1000:.0f} ms]"
+        return line
+
+    def recent(self, user_id, limit=None):
+        """Formatted records of one user, oldest first"""
+        entries = list(self._rings.get(user_id, ()))
+        if limit:
+            entries = entries[-limit:]
+        return [self.format(entry) for entry in entries]
+
+    def follow(self, user_id, on=True):
+        if on:
+            self.followed.add(user_id)
+        else:
+            self.followed.discard(user_id)
+
+    def forget(self, user_id):
+        self._rings.pop(user_id, None)
+        self.followed.discard(user_id)
+
+    def get_stats(self):
+        return {
+            "users": len(self._rings),
+            "events": sum(len(ring) for ring in list(self._rings.values())),
+            "followed": len(self.followed),
+        }
@@ -0,0 +1,281 @@
+"""
+Game text rules.
+
+Every phrase the bot reacts to in game bot messages lives in
+game_rules.json, next to this module:
+    {"version": 3,
+     "rules": {"encounter": {"phrases": ["threat level", "you run into"]},
+               "combat_item": {"phrases": ["Ring of Life"], "case_sensitive": true},
+               "engage_button": {"phrases": ["engage"], "ignore_spaces": true}},
+     "captcha": {"patterns": [{"name": "...", "weight": "strong", "regex": "..."}],
+                 "solved": "regex", "failed": "regex"}}
+A rule matches when one of its phrases occurs in the text. Phrases are
+lowercased at load unless the rule is case_sensitive, so handlers lowercase
+a message once and test it against any number of rules. Captcha patterns are
+regexes scored by captcha_detector.
+
+The file is validated and compiled once per version. Load errors (unknown
+keys, duplicate phrases, two phrases glued together by a missing comma,
+captcha regexes with capture groups...) reject the whole file. Phrases that
+can never match on their own because a shorter phrase of the same rule
+already does are only logged.
+
+RulesFile keeps the compiled rules in `current` and polls the file every
+RULES_RELOAD_INTERVAL seconds. A changed file is compiled off to the side and
+swapped in with one assignment, so a handler that took `rules.current` once
+sees a single version for the whole message. A file that fails validation
+is logged and the previous version stays active.
+
+benchmarks/bench_game_rules.py measures classification throughput.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from captcha_detector import CaptchaPatterns, WEIGHTS
+
+log = logging.getLogger("GameRules")
+
+RULES_PATH = os.environ.get("GAME_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "game_rules.json"))
+RULES_RELOAD_INTERVAL = float(os.environ.get("GAME_RULES_RELOAD_INTERVAL", "5"))
+
+# Rules bot.py looks up; a file without one of them is rejected
+REQUIRED_RULES = (
+    "essence", "combat_state", "connection_alert", "encounter",
+    "explore_after", "explore_after_exclude", "explore_continue",
+    "combat_attack", "combat_item", "combat_status", "engage_button",
+    "trader", "trader_done", "trader_offers_button", "trader_offer", "fight_required",
+    "pet_capture", "pet_release", "pet_walk_away_button", "pet_walked_away", "pet_special",
+)
+RULE_KEYS = {"phrases", "case_sensitive", "ignore_spaces", "note"}
+CAPTCHA_PATTERN_KEYS = {"name", "weight", "regex", "note"}
+
+
+class RulesError(ValueError):
+    pass
+
+
+class PhraseMatcher:
+    __slots__ = ("name", "phrases", "case_sensitive", "ignore_spaces")
+
+    def __init__(self, name, phrases, case_sensitive=False, ignore_spaces=False):
+        self.name = name
+        self.case_sensitive = case_sensitive
+        self.ignore_spaces = ignore_spaces
+        self.phrases = tuple(self.prepare(phrase) for phrase in phrases)
+
+    def prepare(self, text: str) -> str:
+        """Normalize text the way this rule's phrases are stored"""
+        if not self.case_sensitive:
+            text = text.lower()
+        if self.ignore_spaces:
+            text = text.replace(" ", "")
+        return text
+
+    def search(self, text: str) -> Optional[str]:
+        """First phrase found in (already prepared) text"""
+        # A plain loop of `in` beats one regex alternation of the same literals
+        for phrase in self.phrases:
+            if phrase in text:
+                return phrase
+        return None
+
+    def __call__(self, text: str) -> bool:
+        return self.search(text) is not None
+
+
+class GameRules:
+    """One compiled version of the rules file; rules are attributes by name"""
+
+    def __init__(self, version: int, matchers: Dict[str, PhraseMatcher], captcha: CaptchaPatterns):
+        self.version = version
+        self.matchers = matchers
+        self.captcha = captcha
+        self._lowercase = tuple(m for m in matchers.values() if not m.case_sensitive and not m.ignore_spaces)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["matchers"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def matching(self, text: str) -> Tuple[str, ...]:
+        """Names of the case-insensitive rules that match lowercased text"""
+        return tuple(m.name for m in self._lowercase if m.search(text) is not None)
+
+
+# ==============================
+# VALIDATION
+# ==============================
+def _check_keys(where, entry, allowed):
+    if not isinstance(entry, dict):
+        raise RulesError(f"{where}: expected an object")
+    unknown = set(entry) - allowed
+    if unknown:
+        raise RulesError(f"{where}: unknown keys {sorted(unknown)}")
+
+
+def _glued(phrase, known):
+    """The phrase `phrase` is two known phrases with a missing comma between them:
+    "walked away" "exploring" -> "walked awayexploring". Only whole known
+    phrases count, so "threat levels" next to "threat level" is fine."""
+    for first in known:
+        if first == phrase or not phrase.startswith(first):
+            continue
+        rest = phrase[len(first):]
+        if rest in known:
+            return first, rest
+    return None
+
+
+def compile_rules(data) -> Tuple[GameRules, List[str]]:
+    """Validate and compile parsed rules, returns (rules, warnings)"""
+    _check_keys("rules file", data, {"version", "rules", "captcha"})
+    version = data.get("version")
+    if not isinstance(version, int) or isinstance(version, bool) or version < 1:
+        raise RulesError("version must be a positive integer")
+
+    rules = data.get("rules")
+    if not isinstance(rules, dict):
+        raise RulesError("rules must be an object")
+    missing = [name for name in REQUIRED_RULES if name not in rules]
+    if missing:
+        raise RulesError(f"missing rules: {', '.join(missing)}")
+
+    warnings = []
+    matchers = {}
+    for name, rule in rules.items():
+        _check_keys(f"rule {name}", rule, RULE_KEYS)
+        phrases = rule.get("phrases")
+        if not isinstance(phrases, list) or not phrases:
+            raise RulesError(f"rule {name}: phrases must be a non-empty list")
+        if not all(isinstance(phrase, str) and phrase.strip() for phrase in phrases):
+            raise RulesError(f"rule {name}: phrases must be non-empty strings")
+        matcher = PhraseMatcher(name, phrases, bool(rule.get("case_sensitive")), bool(rule.get("ignore_spaces")))
+        seen = set()
+        for phrase in matcher.phrases:
+            if phrase in seen:
+                raise RulesError(f"rule {name}: duplicate phrase {phrase!r}")
+            seen.add(phrase)
+        matchers[name] = matcher
+
+    known = {phrase for matcher in matchers.values() for phrase in matcher.phrases}
+    for matcher in matchers.values():
+        for phrase in matcher.phrases:
+            glued = _glued(phrase, known)
+            if glued:
+                raise RulesError(f"rule {matcher.name}: {phrase!r} looks like {glued[0]!r} and {glued[1]!r} "
+                                 f"with a missing comma")
+            shorter = next((other for other in matcher.phrases if other != phrase and other in phrase), None)
+            if shorter:
+                warnings.append(f"rule {matcher.name}: {phrase!r} never matches on its own, {shorter!r} already does")
+
+    return GameRules(version, matchers, _compile_captcha(data.get("captcha"))), warnings
+
+
+def _compile_captcha(captcha) -> CaptchaPatterns:
+    _check_keys("captcha", captcha, {"patterns", "solved", "failed"})
+    patterns = []
+    for index, entry in enumerate(captcha.get("patterns") or ()):
+        _check_keys(f"captcha pattern {index}", entry, CAPTCHA_PATTERN_KEYS)
+        name, weight, regex = entry.get("name"), entry.get("weight"), entry.get("regex")
+        if not name or any(name == other for other, _, _ in patterns):
+            raise RulesError(f"captcha pattern {index}: missing or duplicate name {name!r}")
+        weight = WEIGHTS.get(weight, weight)
+        if not isinstance(weight, (int, float)) or not 0 < weight <= 1:
+            raise RulesError(f"captcha pattern {name}: weight must be strong/medium/weak or in (0, 1]")
+        patterns.append((name, float(weight), regex))
+    if not patterns:
+        raise RulesError("captcha: patterns must be a non-empty list")
+
+    try:
+        compiled = CaptchaPatterns(patterns, captcha.get("solved", ""), captcha.get("failed", ""))
+    except (re.error, TypeError) as e:
+        raise RulesError(f"captcha: bad regex: {e}") from None
+    for name, _, _, regex in compiled.patterns:
+        if regex.groups:
+            raise RulesError(f"captcha pattern {name}: use (?:...), captures are never read")
+    if not compiled.solved.pattern or not compiled.failed.pattern:
+        raise RulesError("captcha: solved and failed regexes are required")
+    return compiled
+
+
+def load_rules(path) -> Tuple[GameRules, List[str]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except json.JSONDecodeError as e:
+        raise RulesError(f"invalid JSON: {e}") from None
+    return compile_rules(data)
+
+
+# ==============================
+# HOT RELOAD
+# ==============================
+class RulesFile:
+    def __init__(self, path=RULES_PATH):
+        self.path = path
+        self._stamp = self._file_stamp()
+        self.current, warnings = load_rules(path)
+        self._log_loaded(warnings)
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error = None
+        self._thread = None
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _log_loaded(self, warnings):
+        log.info(f"✅ Loaded game rules v{self.current.version} ({len(self.current.matchers)} rules)")
+        for warning in warnings:
+            log.warning(f"⚠️ Game rules: {warning}")
+
+    def reload(self, force=False) -> bool:
+        """Swap in the file if it changed and is valid, returns True if swapped"""
+        stamp = self._file_stamp()
+        if stamp is None or (stamp == self._stamp and not force):
+            return False
+        self._stamp = stamp
+        try:
+            rules, warnings = load_rules(self.path)
+        except (RulesError, OSError) as e:
+            self.failed_reloads += 1
+            self.last_error = str(e)
+            log.error(f"❌ Game rules not reloaded, keeping v{self.current.version}: {e}")
+            return False
+        if rules.version <= self.current.version:
+            log.warning(f"⚠️ Game rules changed without a version bump (v{rules.version})")
+        self.current = rules
+        self.reloads += 1
+        self.last_error = None
+        self._log_loaded(warnings)
+        return True
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            self.reload()
+
+    def start(self, interval=RULES_RELOAD_INTERVAL):
+        """Start watching the file for changes"""
+        if self._thread is None and interval > 0:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="game-rules", daemon=True)
+            self._thread.start()
+
+    def get_stats(self):
+        return {
+            "version": self.current.version,
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,172 @@
+"""
+Process-wide logging setup.
+
+setup_logging() is called once by bot.py before anything else logs. Log
+calls only put the record on a bounded queue (QueueHandler); one listener
+thread formats and writes them, so a slow sink (container stdout, a piped
+collector) never stalls the event loops. If the queue is full, records
+below WARNING are dropped and counted instead of blocking the caller.
+WARNING and above are never dropped: the caller waits up to
+LOG_BLOCK_TIMEOUT for room, then writes the record itself.
+
+Settings:
+- LOG_LEVEL       root level (default INFO)
+- LOG_FORMAT      "text" (default) or "json", one object per line:
+                  {"ts": "...", "level": "INFO", "logger": "AutoFarm", "msg": "..."}
+- LOG_QUEUE_SIZE  records waiting for the writer before new ones are dropped
+- LOG_BLOCK_TIMEOUT  seconds a WARNING+ record waits for a full queue
+                  (default 0.05)
+- LOG_SAMPLE      keep only a share of high-volume loggers' records below
+                  WARNING, e.g. "AutoFarm.farm=0.1,telethon=0.5"
+
+Records are formatted on the writer thread. Arguments of %-style calls are
+therefore rendered a moment later; pass values, not objects that change
+right after the call.
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_BLOCK_TIMEOUT = float(os.environ.get("LOG_BLOCK_TIMEOUT", "0.05"))
+LOG_SAMPLE = os.environ.get("LOG_SAMPLE", "")
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+_handler = None
+_listener = None
+_sampler = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps `rate` of the records below WARNING from the configured loggers
+    (and their children)"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        name = record.name
+        while name:
+            rate = self.rates.get(name)
+            if rate is not None:
+                if random.random() < rate:
+                    return True
+                self.dropped += 1
+                return False
+            name = name.rpartition(".")[0]
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener. On a full queue
+    records below WARNING are dropped; WARNING and above wait block_timeout
+    for room and then go straight to `overflow` (the writer handler)."""
+
+    def __init__(self, log_queue, overflow=None, block_timeout=LOG_BLOCK_TIMEOUT):
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.overflowed = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                self.dropped += 1
+                return
+        try:
+            self.queue.put(record, timeout=self.block_timeout)
+        except queue.Full:
+            if self.overflow is None:
+                self.dropped += 1
+                return
+            # Out of order with the queued records, but not lost
+            self.overflowed += 1
+            self.overflow.handle(record)
+
+
+def parse_sample_rates(spec):
+    """"AutoFarm.farm=0.1,telethon=0.5" -> {"AutoFarm.farm": 0.1, "telethon": 0.5}"""
+    rates = {}
+    for item in spec.split(","):
+        name, _, rate = item.strip().partition("=")
+        if name and rate:
+            rates[name] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def setup_logging():
+    """Install the queue handler on the root logger (once)"""
+    global _handler, _listener, _sampler
+    if _listener is not None:
+        return
+
+    writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    _handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE), overflow=writer)
+    rates = parse_sample_rates(LOG_SAMPLE)
+    if rates:
+        _sampler = SamplingFilter(rates)
+        _handler.addFilter(_sampler)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(_handler.queue, writer, respect_handler_level=True)
+    _listener.start()
+    # Write out whatever is still queued when the process exits
+    atexit.register(_stop_listener)
+
+
+def _stop_listener():
+    # QueueListener.stop() puts its sentinel with put_nowait, which fails on
+    # a full queue: wait for the writer to take the backlog first
+    _handler.queue.join()
+    _listener.stop()
+
+
+def get_stats():
+    if _handler is None:
+        return {"queued": 0, "dropped": 0, "overflowed": 0, "sampled_out": 0}
+    return {
+        "queued": _handler.queue.qsize(),
+        "dropped": _handler.dropped,
+        "overflowed": _handler.overflowed,
+        "sampled_out": _sampler.dropped if _sampler else 0,
+    }
@@ -0,0 +1,91 @@
+"""
+Event loop shards.
+
+LOOP_SHARDS=1 (the default) keeps every client on the main asyncio loop.
+With N > 1, shard 0 is still the main loop and shards 1..N-1 each run their
+own loop on a dedicated thread.
+
+Every user is pinned to one shard the first time it is seen (the shard with
+the fewest users) and all of that user's Telethon work runs on that loop:
+login, update handlers, farming, hibernation. A slow handler therefore only
+delays the users of its own shard, and crypto done in C extensions such as
+cryptg releases the GIL and overlaps across shards.
+
+Code running outside the user's loop (telebot handler threads, the shared
+timer queue) hands coroutines over with submit() / run_on().
+"""
+
+import asyncio
+import logging
+import threading
+
+log = logging.getLogger("LoopShards")
+
+
+class LoopShards:
+    def __init__(self, main_loop, count=1):
+        self.loops = [main_loop]
+        for _ in range(1, max(1, count)):
+            self.loops.append(asyncio.new_event_loop())
+        self._load = [0] * len(self.loops)
+        self._assigned = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Start the threads of shards 1..N-1 (the caller runs the main loop)"""
+        for index, loop in enumerate(self.loops[1:], 1):
+            thread = threading.Thread(target=self._run, args=(loop,), name=f"loop-shard-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if len(self.loops) > 1:
+            log.info(f"✅ Running {len(self.loops)} event loop shards")
+
+    @staticmethod
+    def _run(loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def shard_of(self, user_id):
+        with self._lock:
+            shard = self._assigned.get(user_id)
+            if shard is None:
+                shard = min(range(len(self.loops)), key=self._load.__getitem__)
+                self._assigned[user_id] = shard
+                self._load[shard] += 1
+            return shard
+
+    def loop_for(self, user_id):
+        return self.loops[self.shard_of(user_id)]
+
+    def release(self, user_id):
+        """Forget a user's shard (after its client was disconnected)"""
+        with self._lock:
+            shard = self._assigned.pop(user_id, None)
+            if shard is not None:
+                self._load[shard] -= 1
+
+    def users_on(self, shard):
+        """User ids currently pinned to one shard"""
+        with self._lock:
+            return [user_id for user_id, index in self._assigned.items() if index == shard]
+
+    def stop(self):
+        """Stop every loop, the main loop included"""
+        for loop in self.loops:
+            loop.call_soon_threadsafe(loop.stop)
+
+    def submit(self, user_id, coro):
+        """Schedule coro on the user's loop from any thread, returns a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop_for(user_id))
+
+    async def run_on(self, user_id, coro):
+        """Await coro on the user's loop from a coroutine on any loop"""
+        loop = self.loop_for(user_id)
+        if loop is asyncio.get_running_loop():
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def get_stats(self):
+        with self._lock:
+            return {"shards": len(self.loops), "users_per_shard": list(self._load)}
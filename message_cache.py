@@ -0,0 +1,54 @@
+"""
+Per-user cache of already-handled game bot message versions.
+
+The game bot edits the same message many times and Telethon can deliver the
+same version more than once (NewMessage + MessageEdited, reconnect replays).
+Each version is identified by (message id, edit date, text hash); a version
+that was already handled is dropped before any farming logic runs.
+"""
+
+from collections import OrderedDict
+
+# How many recent message versions to remember per user
+MAX_VERSIONS_PER_USER = 64
+
+
+class MessageVersionCache:
+    """Bounded LRU set of message versions handled for one user"""
+
+    __slots__ = ("_versions", "max_entries", "suppressed")
+
+    # Duplicates suppressed across all users (for stats)
+    suppressed_total = 0
+
+    def __init__(self, max_entries=MAX_VERSIONS_PER_USER):
+        self._versions = OrderedDict()
+        self.max_entries = max_entries
+        self.suppressed = 0
+
+    @staticmethod
+    def version_key(event):
+        """Build the (message id, edit date, text hash) key for an event"""
+        edit_date = getattr(event, "edit_date", None)
+        return (
+            event.id,
+            edit_date.timestamp() if edit_date else None,
+            hash(event.raw_text),
+        )
+
+    def check(self, event):
+        """Return True if this message version is new, False if already handled"""
+        key = self.version_key(event)
+        if key in self._versions:
+            self._versions.move_to_end(key)
+            self.suppressed += 1
+            MessageVersionCache.suppressed_total += 1
+            return False
+
+        self._versions[key] = None
+        if len(self._versions) > self.max_entries:
+            self._versions.popitem(last=False)
+        return True
+
+    def __len__(self):
+        return len(self._versions)
@@ -1,17 +1,79 @@
 import os
 import logging
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+from pymongo import MongoClient, ReadPreference, WriteConcern
+from pymongo import UpdateOne, DeleteOne, DeleteMany
+from pymongo.errors import CollectionInvalid, ConnectionFailure, OperationFailure, WTimeoutError
 from pymongo.server_api import ServerApi
-from datetime import datetime
+from datetime import datetime, timedelta
+import time
 import asyncio
 import base64
+import functools
+import threading
+from storage_backend import StorageBackend, TRADE_HISTORY_DAYS, UNAVAILABLE
+from sqlite_store import SQLiteManager
+from mongo_wal import WriteAheadLog, CircuitBreaker
+from bson import json_util
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+# Logging is configured by bot.py (log_setup.py)
 log = logging.getLogger("MongoDB")
 
-class MongoDBManager:
+# "mongo" (default) or "sqlite" for the embedded local backend
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "mongo").lower()
+# Backend used when MongoDB can't be reached at startup: "none" (default) or "sqlite".
+# Opt-in only: what is written to the SQLite file is never copied back to MongoDB.
+STORAGE_FALLBACK = os.environ.get("STORAGE_FALLBACK", "none").lower()
+
+# Writes made while MongoDB is unreachable are kept in this local log and replayed later
+MONGO_WAL_PATH = os.environ.get("MONGO_WAL_PATH", "mongo_wal.jsonl")
+MONGO_WAL_FSYNC = os.environ.get("MONGO_WAL_FSYNC", "1") == "1"
+MONGO_RECOVERY_INTERVAL = int(os.environ.get("MONGO_RECOVERY_INTERVAL", "15"))
+
+# Errors meaning "server unreachable" (not "bad request"); they trip the circuit breaker
+UNAVAILABLE_ERRORS = (ConnectionFailure, WTimeoutError)
+
+def fail_fast(default):
+    """Read methods return default() at once while the circuit breaker is open"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.breaker.is_open():
+                return default()
+            return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+# Size of the capped farm event journal (oldest events are overwritten)
+FARM_EVENTS_MAX_MB = int(os.environ.get("FARM_EVENTS_MAX_MB", "64"))
+
+# Connection pool and timeouts
+MONGODB_MAX_POOL_SIZE = int(os.environ.get("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.environ.get("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.environ.get("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+# Short timeouts: the first call of an outage waits them out before the
+# circuit breaker opens, and some callers run on an event loop. The socket
+# timeout leaves room for the /farmstats and /tradestats aggregations.
+MONGODB_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGODB_SOCKET_TIMEOUT_MS", "10000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+# How long a majority write may wait for replication before failing
+MONGODB_MAJORITY_WTIMEOUT_MS = int(os.environ.get("MONGODB_MAJORITY_WTIMEOUT_MS", "10000"))
+# Write concern for telemetry and touches: 1 = acknowledged by the primary, 0 = fire and forget
+MONGODB_TELEMETRY_W = int(os.environ.get("MONGODB_TELEMETRY_W", "1"))
+
+# Durability profiles per operation class: (write concern, read preference)
+# - durable:   approvals, admins, configs, user data, sessions - must survive a failover
+# - fast:      telemetry (trade offers, farm events) and last_accessed touches
+# - analytics: aggregations and statistics where slightly stale data is fine
+DURABILITY_PROFILES = {
+    "durable": (WriteConcern("majority", wtimeout=MONGODB_MAJORITY_WTIMEOUT_MS), ReadPreference.PRIMARY),
+    "fast": (WriteConcern(w=MONGODB_TELEMETRY_W), ReadPreference.PRIMARY),
+    "analytics": (WriteConcern(w=MONGODB_TELEMETRY_W), ReadPreference.SECONDARY_PREFERRED),
+}
+
+class MongoDBManager(StorageBackend):
+    name = "mongodb"
+
     def __init__(self):
         # Get MongoDB Atlas connection string from environment
         self.uri = os.environ.get("MONGODB_URI")
@@ -23,6 +85,14 @@ class MongoDBManager:
         self.db_name = os.environ.get("MONGODB_DB_NAME", "aura_farming_bot")
         self.client = None
         self.db = None
+        self.wal = WriteAheadLog(MONGO_WAL_PATH, fsync=MONGO_WAL_FSYNC)
+        self.breaker = CircuitBreaker()
+        self._wal_lock = threading.Lock()
+        self._replayed = {}  # (collection, filter) -> [(seq, fields set, None for a delete)] of the last replay
+        self._recovery_thread = None
+        self._profiled = {}
+        self._connected = False
+        self._connect_callbacks = []
         self.connect()
     
     def connect(self):
@@ -34,11 +104,15 @@ class MongoDBManager:
                 server_api=ServerApi('1'),
                 retryWrites=True,
                 w='majority',
-                connectTimeoutMS=30000,
-                socketTimeoutMS=30000,
-                serverSelectionTimeoutMS=30000
+                maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                minPoolSize=MONGODB_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS,
+                connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS
             )
             self.db = self.client[self.db_name]
+            self._profiled = {}
             
             # Test connection with ping
             self.client.admin.command('ping')
@@ -47,10 +121,19 @@ class MongoDBManager:
             
             # Create indexes for better performance
             self.create_indexes()
+            self._connected = True
+            
+            # Writes logged during an outage before the last shutdown
+            if self.wal.pending():
+                self.replay_wal()
+            self.start_recovery()
             
         except ConnectionFailure as e:
-            log.error(f"❌ Failed to connect to MongoDB Atlas: {e}")
-            raise
+            # Down at startup: start with the breaker open, writes go to the
+            # local log and the recovery probe finishes connecting later
+            log.error(f"❌ Failed to connect to MongoDB Atlas, keeping writes in the local log until it is back: {e}")
+            self.breaker.record_failure()
+            self.start_recovery()
         except Exception as e:
             log.error(f"❌ MongoDB Atlas connection error: {e}")
             raise
@@ -61,6 +144,7 @@ class MongoDBManager:
             # Index for approved_users collection
             self.db.approved_users.create_index("user_id", unique=True)
             self.db.approved_users.create_index("expiration")
+            self.db.approved_users.create_index([("expiration", 1), ("user_id", 1)])
             
             # Index for user_config collection
             self.db.user_config.create_index("user_id", unique=True)
@@ -77,11 +161,196 @@ class MongoDBManager:
             # Index for admin data in user_data collection
             self.db.user_data.create_index("type")
             
+            # Trade offer history (time-series, expires after TRADE_HISTORY_DAYS)
+            self.create_timeseries_collection("trade_offers", TRADE_HISTORY_DAYS * 86400)
+            
+            # Farm event journal (capped); indexes serve the /farmstats aggregations
+            self.create_capped_collection("farm_events", FARM_EVENTS_MAX_MB * 1024 * 1024)
+            self.db.farm_events.create_index([("user_id", 1), ("ts", 1)])
+            self.db.farm_events.create_index("ts")
+            
             log.info("✅ MongoDB Atlas indexes created successfully")
             
         except Exception as e:
             log.error(f"❌ Error creating indexes: {e}")
 
+    def _coll(self, name, profile="durable"):
+        """Collection handle with the write concern / read preference of a profile"""
+        key = (name, profile)
+        coll = self._profiled.get(key)
+        if coll is None:
+            write_concern, read_preference = DURABILITY_PROFILES[profile]
+            coll = self._profiled[key] = self.db[name].with_options(
+                write_concern=write_concern, read_preference=read_preference
+            )
+        return coll
+    
+    def create_timeseries_collection(self, name, expire_after):
+        """Create a time-series collection (timeField "ts", metaField "meta").
+        Falls back to a regular collection with a TTL index on servers without time-series support."""
+        if name in self.db.list_collection_names():
+            return
+        try:
+            self.db.create_collection(
+                name,
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "minutes"},
+                expireAfterSeconds=expire_after
+            )
+            log.info(f"✅ Created time-series collection {name}")
+        except CollectionInvalid:
+            pass  # created concurrently
+        except OperationFailure as e:
+            log.warning(f"⚠️ Time-series collections unavailable ({e}), using a regular collection for {name}")
+            self.db[name].create_index("ts", expireAfterSeconds=expire_after)
+
+    def create_capped_collection(self, name, size_bytes):
+        """Create a capped collection of size_bytes unless it already exists"""
+        if name in self.db.list_collection_names():
+            return
+        try:
+            self.db.create_collection(name, capped=True, size=size_bytes)
+            log.info(f"✅ Created capped collection {name} ({size_bytes // (1024 * 1024)} MB)")
+        except CollectionInvalid:
+            pass  # created concurrently
+
+    # ==============================
+    # WRITE-AHEAD LOG / CIRCUIT BREAKER
+    # ==============================
+    
+    def is_available(self):
+        return not self.breaker.is_open()
+    
+    def get_health(self):
+        return {
+            "available": self.is_available(),
+            "wal_pending": self.wal.pending(),
+            "breaker_trips": self.breaker.trips,
+        }
+    
+    def _record_error(self, e):
+        """Count connection failures of reads towards the circuit breaker"""
+        if isinstance(e, UNAVAILABLE_ERRORS):
+            self.breaker.record_failure()
+    
+    def _write(self, collection, op, filter, data=None):
+        """Run one idempotent write ("upsert" with $set, "delete", "delete_many").
+        While MongoDB is unavailable, or older logged writes still wait for replay,
+        the write is appended to the local write-ahead log instead.
+        Returns the pymongo result, or None if the write was logged."""
+        seq = self.wal.next_seq()
+        with self._wal_lock:
+            direct = not self.breaker.is_open() and not self.wal.pending()
+            if not direct:
+                self.wal.append(collection, op, filter, data, seq)
+                return None
+        try:
+            coll = self._coll(collection)
+            if op == "upsert":
+                result = coll.update_one(filter, {"$set": data}, upsert=True)
+            elif op == "delete":
+                result = coll.delete_one(filter)
+            else:
+                result = coll.delete_many(filter)
+            self.breaker.record_success()
+            return result
+        except UNAVAILABLE_ERRORS as e:
+            self.breaker.record_failure()
+            log.warning(f"⚠️ MongoDB unavailable, keeping write to {collection} in the local log: {e}")
+            # Under the lock: a replay running now must not clear this entry unapplied
+            with self._wal_lock:
+                newer = [fields for s, fields in self._replayed.get(self._wal_key(collection, filter), ()) if s > seq]
+                if newer:
+                    # Newer writes to this document were replayed while this one timed
+                    # out: keep only the fields they did not set, drop it after a delete
+                    if op == "upsert" and None not in newer:
+                        data = {key: value for key, value in data.items() if not any(key in fields for fields in newer)}
+                    if op != "upsert" or None in newer or not data:
+                        log.info(f"ℹ️ Dropping superseded write to {collection}")
+                        return None
+                self.wal.append(collection, op, filter, data, seq)
+            return None
+    
+    @staticmethod
+    def _wal_key(collection, filter):
+        return collection, json_util.dumps(filter, sort_keys=True)
+    
+    def _remember_replayed(self, entries):
+        """Seq and fields of every replayed write per document, for late failed writes"""
+        replayed = {}
+        for entry in entries:
+            fields = set(entry["d"]) if entry["op"] == "upsert" else None
+            replayed.setdefault(self._wal_key(entry["c"], entry["f"]), []).append((entry.get("s", 0), fields))
+        self._replayed = replayed
+    
+    @staticmethod
+    def _bulk_request(entry):
+        if entry["op"] == "upsert":
+            return UpdateOne(entry["f"], {"$set": entry["d"]}, upsert=True)
+        if entry["op"] == "delete":
+            return DeleteOne(entry["f"])
+        return DeleteMany(entry["f"])
+    
+    def replay_wal(self):
+        """Apply all logged writes with one ordered bulk_write per collection.
+        Safe to repeat: every operation is an upsert or delete."""
+        with self._wal_lock:
+            entries = self.wal.entries()
+            requests = {}
+            for entry in entries:
+                requests.setdefault(entry["c"], []).append(self._bulk_request(entry))
+            try:
+                for collection, ops in requests.items():
+                    self._coll(collection).bulk_write(ops, ordered=True)
+            except Exception as e:
+                self._record_error(e)
+                log.error(f"❌ Replaying the write-ahead log failed, will retry: {e}")
+                return False
+            self.wal.clear()
+            self._remember_replayed(entries)
+        if entries:
+            log.info(f"✅ Replayed {len(entries)} logged writes to MongoDB")
+        return True
+    
+    def recover(self):
+        """Probe MongoDB; once it answers, replay the log and close the breaker"""
+        try:
+            self.client.admin.command("ping")
+        except Exception as e:
+            log.debug(f"MongoDB still unavailable: {e}")
+            return False
+        if not self._connected:
+            self.create_indexes()
+        if not self.replay_wal():
+            return False
+        self.breaker.close()
+        if not self._connected:
+            self._connected = True
+            log.info("✅ Connected to MongoDB Atlas after a startup outage")
+            for callback in self._connect_callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    log.error(f"❌ MongoDB connect callback failed: {e}")
+        return True
+    
+    def on_connected(self, callback):
+        """Run callback() (on the recovery thread) once MongoDB is first reached,
+        if it was down at startup. Reads made before then got fallbacks."""
+        if not self._connected:
+            self._connect_callbacks.append(callback)
+    
+    def _recovery_loop(self):
+        while True:
+            time.sleep(MONGO_RECOVERY_INTERVAL)
+            if self.breaker.is_open() or self.wal.pending():
+                self.recover()
+    
+    def start_recovery(self):
+        """Start the background probe/replay thread"""
+        if self._recovery_thread is None:
+            self._recovery_thread = threading.Thread(target=self._recovery_loop, name="mongo-recovery", daemon=True)
+            self._recovery_thread.start()
+
     # ==============================
     # ADMIN MANAGEMENT (NEW)
     # ==============================
@@ -95,11 +364,7 @@ class MongoDBManager:
                 "last_updated": datetime.utcnow()
             }
             
-            result = self.db.user_data.update_one(
-                {"type": "admin_list"},
-                {"$set": admin_data},
-                upsert=True
-            )
+            self._write("user_data", "upsert", {"type": "admin_list"}, admin_data)
             
             log.info(f"✅ Saved {len(admin_ids)} admins to MongoDB")
             return True
@@ -108,6 +373,7 @@ class MongoDBManager:
             log.error(f"❌ Error saving admins: {e}")
             return False
     
+    @fail_fast(set)
     def get_admins(self):
         """Get admin list from MongoDB"""
         try:
@@ -117,6 +383,7 @@ class MongoDBManager:
             return set()
             
         except Exception as e:
+            self._record_error(e)
             log.error(f"❌ Error loading admins: {e}")
             return set()
 
@@ -137,11 +404,7 @@ class MongoDBManager:
                 "last_accessed": datetime.utcnow()
             }
             
-            result = self.db.session_files.update_one(
-                {"user_id": user_id},
-                {"$set": session_file_doc},
-                upsert=True
-            )
+            self._write("session_files", "upsert", {"user_id": user_id}, session_file_doc)
             
             log.info(f"✅ Session file for user {user_id} saved to MongoDB")
             return True
@@ -150,13 +413,14 @@ class MongoDBManager:
             log.error(f"❌ Error saving session file for user {user_id}: {e}")
             return False
     
+    @fail_fast(lambda: UNAVAILABLE)
     def get_session_file(self, user_id):
         """Get session file data from MongoDB and decode from base64"""
         try:
             session_doc = self.db.session_files.find_one({"user_id": user_id})
             if session_doc and "session_data" in session_doc:
                 # Update last accessed time
-                self.db.session_files.update_one(
+                self._coll("session_files", "fast").update_one(
                     {"user_id": user_id},
                     {"$set": {"last_accessed": datetime.utcnow()}}
                 )
@@ -167,29 +431,33 @@ class MongoDBManager:
             return None
             
         except Exception as e:
+            self._record_error(e)
             log.error(f"❌ Error getting session file for user {user_id}: {e}")
-            return None
+            return UNAVAILABLE if isinstance(e, UNAVAILABLE_ERRORS) else None
     
     def delete_session_file(self, user_id):
         """Delete session file from MongoDB"""
         try:
-            result = self.db.session_files.delete_one({"user_id": user_id})
-            if result.deleted_count > 0:
+            result = self._write("session_files", "delete", {"user_id": user_id})
+            if result is not None and result.deleted_count > 0:
                 log.info(f"✅ Session file for user {user_id} deleted from MongoDB")
-            return result.deleted_count > 0
+            # A logged delete counts as done, it is applied on replay
+            return result is None or result.deleted_count > 0
             
         except Exception as e:
             log.error(f"❌ Error deleting session file for user {user_id}: {e}")
             return False
     
+    @fail_fast(lambda: UNAVAILABLE)
     def session_file_exists(self, user_id):
         """Check if session file exists in MongoDB"""
         try:
             count = self.db.session_files.count_documents({"user_id": user_id})
             return count > 0
         except Exception as e:
+            self._record_error(e)
             log.error(f"❌ Error checking session file existence for user {user_id}: {e}")
-            return False
+            return UNAVAILABLE if isinstance(e, UNAVAILABLE_ERRORS) else False
 
     # ==============================
     # APPROVED USERS MANAGEMENT
@@ -205,11 +473,7 @@ class MongoDBManager:
                 "last_updated": datetime.utcnow()
             }
             
-            result = self.db.approved_users.update_one(
-                {"user_id": user_id},
-                {"$set": user_data},
-                upsert=True
-            )
+            self._write("approved_users", "upsert", {"user_id": user_id}, user_data)
             
             log.info(f"✅ Approved user {user_id} saved to MongoDB")
             return True
@@ -221,15 +485,17 @@ class MongoDBManager:
     def remove_approved_user(self, user_id):
         """Remove approved user from MongoDB"""
         try:
-            result = self.db.approved_users.delete_one({"user_id": user_id})
-            if result.deleted_count > 0:
+            result = self._write("approved_users", "delete", {"user_id": user_id})
+            if result is not None and result.deleted_count > 0:
                 log.info(f"✅ Approved user {user_id} removed from MongoDB")
-            return result.deleted_count > 0
+            # A logged delete counts as done, it is applied on replay
+            return result is None or result.deleted_count > 0
             
         except Exception as e:
             log.error(f"❌ Error removing approved user {user_id}: {e}")
             return False
     
+    @fail_fast(dict)
     def get_approved_users(self):
         """Get all approved users from MongoDB"""
         try:
@@ -243,16 +509,36 @@ class MongoDBManager:
             return approved_dict
             
         except Exception as e:
+            self._record_error(e)
             log.error(f"❌ Error loading approved users: {e}")
             return {}
     
+    @fail_fast(lambda: ([], False))
+    def get_approved_users_page(self, query=None, skip=0, limit=20):
+        """Get one page of approved users sorted by expiration.
+        Returns ([(user_id, expiration), ...], has_more)"""
+        try:
+            cursor = self.db.approved_users.find(
+                query or {},
+                {"_id": 0, "user_id": 1, "expiration": 1}
+            ).sort([("expiration", 1), ("user_id", 1)]).skip(skip).limit(limit + 1)
+            
+            rows = [(doc["user_id"], doc.get("expiration")) for doc in cursor]
+            return rows[:limit], len(rows) > limit
+            
+        except Exception as e:
+            self._record_error(e)
+            log.error(f"❌ Error loading approved users page: {e}")
+            return [], False
+    
     def cleanup_expired_approvals(self):
         """Remove expired approvals from MongoDB"""
+        if not self.is_available():
+            return 0  # runs periodically, nothing to keep for replay
         try:
             current_time = datetime.utcnow().timestamp()
             result = self.db.approved_users.delete_many({
-                "expiration": {"$ne": None},
-                "expiration": {"$lt": current_time}
+                "expiration": {"$ne": None, "$lt": current_time}
             })
             
             if result.deleted_count > 0:
@@ -261,6 +547,7 @@ class MongoDBManager:
             return result.deleted_count
             
         except Exception as e:
+            self._record_error(e)
             log.error(f"❌ Error cleaning up expired approvals: {e}")
             return 0
     
@@ -277,11 +564,7 @@ class MongoDBManager:
                 "last_updated": datetime.utcnow()
             }
             
-            result = self.db.user_config.update_one(
-                {"user_id": user_id},
-                {"$set": user_config},
-                upsert=True
-            )
+            self._write("user_config", "upsert", {"user_id": user_id}, user_config)
             
             log.info(f"✅ User config for {user_id} saved to MongoDB")
             return True
@@ -290,6 +573,7 @@ class MongoDBManager:
             log.error(f"❌ Error saving user config {user_id}: {e}")
             return False
     
+    @fail_fast(dict)
     def get_user_config(self, user_id):
         """Get user configuration from MongoDB"""
         try:
@@ -299,9 +583,11 @@ class MongoDBManager:
             return {}
             
         except Exception as e:
+            self._record_error(e)
             log.error(f"❌ Error getting user config {user_id}: {e}")
             return {}
     
+    @fail_fast(dict)
     def get_all_user_configs(self):
         """Get all user configurations from MongoDB"""
         try:
@@ -314,6 +600,7 @@ class MongoDBManager:
             return config_dict
             
         except Exception as e:
+            self._record_error(e)
             log.error(f"❌ Error loading all user configs: {e}")
             return {}
     
@@ -330,11 +617,7 @@ class MongoDBManager:
                 "last_updated": datetime.utcnow()
             }
             
-            result = self.db.user_data.update_one(
-                {"user_id": user_id},
-                {"$set": data_doc},
-                upsert=True
-            )
+            self._write("user_data", "upsert", {"user_id": user_id}, data_doc)
             
             log.info(f"✅ User data for {user_id} saved to MongoDB")
             return True
@@ -343,6 +626,7 @@ class MongoDBManager:
             log.error(f"❌ Error saving user data {user_id}: {e}")
             return False
     
+    @fail_fast(lambda: {"gc_noti": False, "group_id": None})
     def get_user_data(self, user_id):
         """Get user data from MongoDB"""
         try:
@@ -352,9 +636,11 @@ class MongoDBManager:
             return {"gc_noti": False, "group_id": None}
             
         except Exception as e:
+            self._record_error(e)
             log.error(f"❌ Error getting user data {user_id}: {e}")
             return {"gc_noti": False, "group_id": None}
     
+    @fail_fast(dict)
     def get_all_user_data(self):
         """Get all user data from MongoDB"""
         try:
@@ -367,6 +653,7 @@ class MongoDBManager:
             return data_dict
             
         except Exception as e:
+            self._record_error(e)
             log.error(f"❌ Error loading all user data: {e}")
             return {}
     
@@ -383,11 +670,7 @@ class MongoDBManager:
                 "last_accessed": datetime.utcnow()
             }
             
-            result = self.db.sessions.update_one(
-                {"user_id": user_id},
-                {"$set": session_doc},
-                upsert=True
-            )
+            self._write("sessions", "upsert", {"user_id": user_id}, session_doc)
             
             log.debug(f"✅ Session state for {user_id} saved to MongoDB")
             return True
@@ -396,6 +679,7 @@ class MongoDBManager:
             log.error(f"❌ Error saving session state {user_id}: {e}")
             return False
     
+    @fail_fast(dict)
     def get_session_state(self, user_id):
         """Get session state from MongoDB"""
         try:
@@ -405,39 +689,150 @@ class MongoDBManager:
             return {}
             
         except Exception as e:
+            self._record_error(e)
             log.error(f"❌ Error getting session state {user_id}: {e}")
             return {}
     
+    @fail_fast(dict)
+    def get_all_session_states(self):
+        """Get every stored session state, keyed by user id"""
+        try:
+            return {
+                doc["user_id"]: doc.get("session_data", {})
+                for doc in self.db.sessions.find({}, {"user_id": 1, "session_data": 1})
+            }
+            
+        except Exception as e:
+            self._record_error(e)
+            log.error(f"❌ Error loading session states: {e}")
+            return {}
+    
     def delete_session_state(self, user_id):
         """Delete session state from MongoDB"""
         try:
-            result = self.db.sessions.delete_one({"user_id": user_id})
-            if result.deleted_count > 0:
+            result = self._write("sessions", "delete", {"user_id": user_id})
+            if result is not None and result.deleted_count > 0:
                 log.info(f"✅ Session state for {user_id} deleted from MongoDB")
-            return result.deleted_count > 0
+            # A logged delete counts as done, it is applied on replay
+            return result is None or result.deleted_count > 0
             
         except Exception as e:
             log.error(f"❌ Error deleting session state {user_id}: {e}")
             return False
     
+    # ==============================
+    # APPEND-ONLY COLLECTIONS
+    # ==============================
+    
+    def collection(self, name):
+        return self._coll(name, "fast")
+    
+    # ==============================
+    # TRADE ANALYTICS
+    # ==============================
+    
+    @fail_fast(list)
+    def get_trade_price_counts(self, days=TRADE_HISTORY_DAYS):
+        """Offer and purchase counts per (currency, price) over the last `days` days"""
+        try:
+            since = datetime.utcnow() - timedelta(days=days)
+            pipeline = [
+                {"$match": {"ts": {"$gte": since}}},
+                {"$group": {
+                    "_id": {"currency": "$meta.currency", "price": "$price"},
+                    "offers": {"$sum": 1},
+                    "bought": {"$sum": {"$cond": ["$bought", 1, 0]}},
+                }},
+            ]
+            return [
+                (row["_id"]["currency"], row["_id"]["price"], row["offers"], row["bought"])
+                for row in self._coll("trade_offers", "analytics").aggregate(pipeline)
+            ]
+            
+        except Exception as e:
+            self._record_error(e)
+            log.error(f"❌ Error loading trade history: {e}")
+            return []
+    
+    # ==============================
+    # FARM EVENT JOURNAL
+    # ==============================
+    
+    @fail_fast(dict)
+    def get_farm_event_counts(self, hours=24, user_id=None):
+        """Event counts per kind over the last `hours` hours, for one user or everyone"""
+        try:
+            match = {"ts": {"$gte": datetime.utcnow() - timedelta(hours=hours)}}
+            if user_id is not None:
+                match["user_id"] = user_id
+            pipeline = [
+                {"$match": match},
+                {"$group": {"_id": "$kind", "count": {"$sum": 1}}},
+            ]
+            return {row["_id"]: row["count"] for row in self._coll("farm_events", "analytics").aggregate(pipeline)}
+            
+        except Exception as e:
+            self._record_error(e)
+            log.error(f"❌ Error counting farm events: {e}")
+            return {}
+    
+    @fail_fast(dict)
+    def get_farm_events_per_hour(self, user_id, hours=24):
+        """{"YYYY-MM-DD HH:00": {kind: count}} for one user over the last `hours` hours"""
+        try:
+            pipeline = [
+                {"$match": {
+                    "user_id": user_id,
+                    "ts": {"$gte": datetime.utcnow() - timedelta(hours=hours)},
+                }},
+                {"$group": {
+                    "_id": {
+                        "hour": {"$dateToString": {"format": "%Y-%m-%d %H:00", "date": "$ts"}},
+                        "kind": "$kind",
+                    },
+                    "count": {"$sum": 1},
+                }},
+            ]
+            hourly = {}
+            for row in self._coll("farm_events", "analytics").aggregate(pipeline):
+                hourly.setdefault(row["_id"]["hour"], {})[row["_id"]["kind"]] = row["count"]
+            return dict(sorted(hourly.items()))
+            
+        except Exception as e:
+            self._record_error(e)
+            log.error(f"❌ Error loading hourly farm events {user_id}: {e}")
+            return {}
+    
     # ==============================
     # STATISTICS AND MAINTENANCE
     # ==============================
     
+    STATS_COLLECTIONS = ("approved_users", "user_config", "user_data", "sessions", "session_files", "trade_offers", "farm_events")
+    
+    @fail_fast(dict)
     def get_database_stats(self):
-        """Get database statistics"""
-        try:
-            stats = {
-                "approved_users": self.db.approved_users.count_documents({}),
-                "user_configs": self.db.user_config.count_documents({}),
-                "user_data": self.db.user_data.count_documents({}),
-                "sessions": self.db.sessions.count_documents({}),
-                "session_files": self.db.session_files.count_documents({}),
-                "admins": len(self.get_admins())
-            }
-            return stats
+        """Get database statistics from collection metadata (no collection scans)"""
+        try:
+            collections = {}
+            for name in self.STATS_COLLECTIONS:
+                coll_stats = {"count": self._coll(name, "analytics").estimated_document_count()}
+                try:
+                    raw = self.db.command("collStats", name)
+                    coll_stats.update({
+                        "size": raw.get("size", 0),
+                        "storage_size": raw.get("storageSize", 0),
+                        "index_size": raw.get("totalIndexSize", 0),
+                        "avg_obj_size": raw.get("avgObjSize", 0),
+                    })
+                except OperationFailure as e:
+                    # collStats may be restricted on shared Atlas tiers
+                    log.debug(f"collStats unavailable for {name}: {e}")
+                collections[name] = coll_stats
+            
+            return {"collections": collections, "taken_at": datetime.utcnow().timestamp()}
             
         except Exception as e:
+            self._record_error(e)
             log.error(f"❌ Error getting database stats: {e}")
             return {}
     
@@ -450,12 +845,24 @@ class MongoDBManager:
         except Exception as e:
             log.error(f"❌ Error closing MongoDB connection: {e}")
 
-# Global MongoDB manager instance
-try:
-    mongo_manager = MongoDBManager()
-except Exception as e:
-    log.error(f"❌ Failed to initialize MongoDB manager: {e}")
-    mongo_manager = None
+def create_storage():
+    """Open the configured backend (SQLite fallback only with STORAGE_FALLBACK=sqlite)"""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteManager()
+    try:
+        return MongoDBManager()
+    except Exception as e:
+        log.error(f"❌ Failed to initialize MongoDB manager: {e}")
+    if STORAGE_FALLBACK == "sqlite":
+        log.warning("⚠️ Falling back to local SQLite storage, these writes will not reach MongoDB later")
+        try:
+            return SQLiteManager()
+        except Exception as e:
+            log.error(f"❌ Failed to open SQLite storage: {e}")
+    return None
+
+# Global storage manager instance (MongoDB or SQLite, None if neither is available)
+mongo_manager = create_storage()
 
 # Async version for compatibility with existing code
 async def async_save_session_state(user_id, session_data):
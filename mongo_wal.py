@@ -0,0 +1,120 @@
+"""
+Local write-ahead log and circuit breaker for MongoDB writes.
+
+While MongoDB is unreachable, MongoDBManager appends each write to a local
+append-only file instead of failing it. Entries are JSON lines encoded with
+bson.json_util, so datetimes and binary data survive the round trip:
+    {"s": 42, "c": "user_config", "op": "upsert", "f": {"user_id": 1}, "d": {...}}
+
+"s" is a sequence number taken when the write was issued, not when it was
+logged: a direct write that fails after its timeout is logged late, behind
+newer writes to the same document, and entries() returns the log sorted by
+"s" so replay still applies the writes in the order they were made.
+
+Every logged operation is an idempotent upsert ($set) or delete, so the log
+can be replayed with bulk writes as often as needed: a replay that fails
+halfway is simply retried in full on the next attempt.
+
+The circuit breaker trips on connection failures. While it is open, writes
+go straight to the log and reads return their fallback immediately instead
+of waiting out the MongoDB timeouts; a background probe closes it again once
+the server answers and the log has been replayed. A MongoDB that is down at
+startup is handled the same way: the manager starts with the breaker open.
+"""
+
+import os
+import time
+import logging
+import threading
+from bson import json_util
+
+log = logging.getLogger("MongoWAL")
+
+
+class WriteAheadLog:
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._count = 0
+        self._seq = 0
+        for entry in self.entries():
+            self._count += 1
+            self._seq = max(self._seq, entry.get("s", 0))
+
+    def next_seq(self):
+        """Sequence number for a write about to be issued"""
+        with self._lock:
+            self._seq += 1
+            return self._seq
+
+    def append(self, collection, op, filter, data=None, seq=None):
+        """Durably record one operation (one short write + fsync).
+        seq: from next_seq() when the write was issued, default now."""
+        entry = {"s": seq if seq is not None else self.next_seq(), "c": collection, "op": op, "f": filter}
+        if data is not None:
+            entry["d"] = data
+        line = json_util.dumps(entry) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self._count += 1
+
+    def entries(self):
+        """All logged operations in issue order (a torn last line from a crash is skipped)"""
+        with self._lock:
+            if not os.path.exists(self.path):
+                return []
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        entries = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                entries.append(json_util.loads(line))
+            except ValueError:
+                log.warning(f"⚠️ Skipping unreadable write-ahead log line {number}")
+        entries.sort(key=lambda entry: entry.get("s", 0))  # stable: file order for equal/missing "s"
+        return entries
+
+    def clear(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._count = 0
+
+    def pending(self):
+        return self._count
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; closed again by close()"""
+
+    def __init__(self, threshold=1):
+        self.threshold = threshold
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+
+    def is_open(self):
+        return self.opened_at is not None
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold and self.opened_at is None:
+            self.opened_at = time.time()
+            self.trips += 1
+            log.warning("⚠️ MongoDB circuit breaker opened")
+
+    def close(self):
+        if self.opened_at is not None:
+            log.info(f"✅ MongoDB circuit breaker closed after {time.time() - self.opened_at:.0f}s")
+        self.failures = 0
+        self.opened_at = None
@@ -0,0 +1,97 @@
+"""
+Runtime bootstrap: event loop implementation and Telethon's AES backend.
+
+bootstrap() runs once at startup, before the first event loop is created:
+- Installs uvloop's event loop policy when uvloop is available (USE_UVLOOP=0
+  keeps the stock asyncio loop). Every loop created afterwards, including
+  the loop shards, is a uvloop loop.
+- Detects which AES-IGE implementation Telethon will use for MTProto:
+      cryptg   C extension, fastest, releases the GIL
+      libssl   OpenSSL through ctypes, fast enough
+      python   pure Python (pyaes), orders of magnitude slower
+- Logs both, and in production mode (RUNTIME_MODE=production) refuses to
+  start with pure-Python crypto and warns about the stock asyncio loop.
+
+benchmarks/bench_runtime.py compares the throughput of the available AES
+backends and event loops.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import platform
+import threading
+
+import telethon
+from telethon.crypto import aes as telethon_aes, libssl
+
+log = logging.getLogger("Runtime")
+
+RUNTIME_MODE = os.environ.get("RUNTIME_MODE", "development").lower()
+USE_UVLOOP = os.environ.get("USE_UVLOOP", "1") == "1"
+
+CRYPTO_CRYPTG, CRYPTO_LIBSSL, CRYPTO_PYTHON = "cryptg", "libssl", "python"
+
+info = {}
+
+
+def install_uvloop():
+    """Install uvloop's policy, returns the uvloop version or None"""
+    if not USE_UVLOOP:
+        return None
+    try:
+        import uvloop
+    except ImportError:
+        return None
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return uvloop.__version__
+
+
+def crypto_backend():
+    """The AES-IGE implementation Telethon picked at import"""
+    if telethon_aes.cryptg is not None:
+        return CRYPTO_CRYPTG
+    if libssl.encrypt_ige and libssl.decrypt_ige:
+        return CRYPTO_LIBSSL
+    return CRYPTO_PYTHON
+
+
+def bootstrap():
+    """Set up the runtime and check it, returns the capability report"""
+    uvloop_version = install_uvloop()
+    info.update({
+        "mode": RUNTIME_MODE,
+        "python": f"{platform.python_implementation()} {platform.python_version()}",
+        "telethon": telethon.__version__,
+        "event_loop": f"uvloop {uvloop_version}" if uvloop_version else "asyncio",
+        "crypto": crypto_backend(),
+        "started": time.time(),
+    })
+    log.info(f"[✓] Runtime: {info['python']}, loop {info['event_loop']}, "
+             f"crypto {info['crypto']}, telethon {info['telethon']} ({RUNTIME_MODE})")
+
+    if info["crypto"] == CRYPTO_PYTHON:
+        if RUNTIME_MODE == "production":
+            log.critical("❌ Telethon would use pure-Python AES, install cryptg (pip install cryptg)")
+            sys.exit(1)
+        log.warning("⚠️ Telethon uses pure-Python AES, install cryptg for production")
+    elif info["crypto"] == CRYPTO_LIBSSL:
+        log.info("[✓] libssl AES in use, cryptg is faster and releases the GIL")
+    if not uvloop_version and RUNTIME_MODE == "production" and sys.platform != "win32":
+        log.warning("⚠️ Running on the stock asyncio loop, install uvloop for production")
+    return info
+
+
+def loop_lag(loop, timeout=2.0):
+    """Seconds a callback scheduled from another thread waits to run on
+    `loop`, None if it did not run within `timeout`"""
+    ran = threading.Event()
+    start = time.perf_counter()
+    lag = []
+    def probe():
+        lag.append(time.perf_counter() - start)
+        ran.set()
+    loop.call_soon_threadsafe(probe)
+    return lag[0] if ran.wait(timeout) else None
@@ -0,0 +1,60 @@
+"""
+Graceful shutdown and hot restart.
+
+On SIGTERM / SIGINT the bot shuts down in this order:
+1. The action gate closes: Telethon updates, explores and farming starts
+   are dropped from now on, while actions already running may finish.
+   The control bot stops polling and its handler queue stops taking updates.
+2. Queued commands and in-flight actions get SHUTDOWN_GRACE seconds each.
+3. Users are released shard by shard: each client is disconnected (Telethon
+   saves its session file on disconnect), the file is copied to storage and
+   a handoff state is written to the `sessions` collection:
+       {"handoff": True, "farming": True, "hibernated": False, "released_at": ts}
+   All users of a shard are released concurrently on their own loop.
+4. Buffered journal/trade writes are flushed; writes still in the MongoDB
+   write-ahead log stay on disk and are replayed by the next process.
+
+A starting process takes over every handoff state it finds and keeps
+looking for HANDOFF_WAIT seconds. Started next to the old one during a
+deploy, it picks up each shard as soon as the old process releases it, so a
+user is offline from its release until the new client is connected.
+"""
+
+import os
+import threading
+
+SHUTDOWN_GRACE = float(os.environ.get("SHUTDOWN_GRACE", "5"))
+HANDOFF_WAIT = float(os.environ.get("HANDOFF_WAIT", "30"))
+HANDOFF_POLL_INTERVAL = 1.0
+
+
+class ActionGate:
+    """Counts running actions and refuses new ones once closed"""
+
+    def __init__(self):
+        self.closed = False
+        self.running = 0
+        self._idle = threading.Condition()
+
+    def enter(self):
+        """Returns False (and counts nothing) once the gate is closed"""
+        with self._idle:
+            if self.closed:
+                return False
+            self.running += 1
+            return True
+
+    def exit(self):
+        with self._idle:
+            self.running -= 1
+            if not self.running:
+                self._idle.notify_all()
+
+    def close(self):
+        with self._idle:
+            self.closed = True
+
+    def wait_idle(self, timeout=None):
+        """Wait for running actions to finish, returns False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self.running == 0, timeout)
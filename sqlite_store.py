@@ -0,0 +1,445 @@
+"""
+Embedded SQLite storage backend.
+
+Same API as mongo_db.MongoDBManager (see storage_backend.StorageBackend),
+kept in one local database file in WAL mode: readers don't block the writer
+and commits are a sequential log append, so small deployments and offline
+runs get persistent state without a MongoDB server. mongo_db also falls
+back to it when MongoDB is unreachable at startup.
+
+Documents are stored as JSON next to the columns that are queried.
+Append-only collections (trade_offers, farm_events) share the `events`
+table and are pruned by age instead of a TTL index / capped size.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import timezone
+
+from storage_backend import StorageBackend, TRADE_HISTORY_DAYS
+
+log = logging.getLogger("SQLite")
+
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "autofarm.db")
+# Farm events older than this are pruned (the MongoDB backend uses a capped collection)
+FARM_EVENTS_DAYS = int(os.environ.get("FARM_EVENTS_DAYS", "30"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS approved_users (
+    user_id INTEGER PRIMARY KEY, expiration REAL, approved_at REAL, last_updated REAL);
+CREATE INDEX IF NOT EXISTS approved_users_expiration ON approved_users (expiration, user_id);
+CREATE TABLE IF NOT EXISTS user_config (user_id INTEGER PRIMARY KEY, config TEXT NOT NULL, last_updated REAL);
+CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, last_updated REAL);
+CREATE TABLE IF NOT EXISTS sessions (user_id INTEGER PRIMARY KEY, session_data TEXT NOT NULL, last_accessed REAL);
+CREATE TABLE IF NOT EXISTS session_files (
+    user_id INTEGER PRIMARY KEY, session_data BLOB NOT NULL, created_at REAL, last_accessed REAL);
+CREATE TABLE IF NOT EXISTS events (collection TEXT NOT NULL, ts REAL NOT NULL, user_id INTEGER, doc TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS events_user_ts ON events (collection, user_id, ts);
+CREATE INDEX IF NOT EXISTS events_ts ON events (collection, ts);
+"""
+
+TABLES = ("approved_users", "user_config", "user_data", "sessions", "session_files")
+EVENT_RETENTION = {"trade_offers": TRADE_HISTORY_DAYS, "farm_events": FARM_EVENTS_DAYS}
+
+# Subset of the MongoDB filter syntax used by bot.py for approval lists
+FILTER_FIELDS = ("user_id", "expiration")
+FILTER_OPS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+DEFAULT_USER_DATA = {"gc_noti": False, "group_id": None}
+
+
+def _timestamp(value):
+    """Unix timestamp from a naive UTC datetime, a timestamp, or None (now)"""
+    if value is None:
+        return time.time()
+    if hasattr(value, "timestamp"):
+        return value.replace(tzinfo=timezone.utc).timestamp()
+    return float(value)
+
+def _where(query):
+    """Translate a MongoDB filter into (sql, params)"""
+    clauses, params = [], []
+    for field, cond in (query or {}).items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"unsupported filter field {field}")
+        if isinstance(cond, dict):
+            for op, value in cond.items():
+                if op == "$in":
+                    value = list(value)
+                    clauses.append(f"{field} IN ({', '.join('?' * len(value))})" if value else "0")
+                    params.extend(value)
+                elif op in FILTER_OPS:
+                    clauses.append(f"{field} {FILTER_OPS[op]} ?")
+                    params.append(value)
+                else:
+                    raise ValueError(f"unsupported filter operator {op}")
+        elif cond is None:
+            clauses.append(f"{field} IS NULL")
+        else:
+            clauses.append(f"{field} = ?")
+            params.append(cond)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+class SQLiteEventCollection:
+    """BatchInserter target writing into the shared events table"""
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def insert_many(self, docs, ordered=False):
+        rows = []
+        for doc in docs:
+            doc = dict(doc)
+            ts = _timestamp(doc.pop("ts", None))
+            user_id = doc.get("user_id", doc.get("meta", {}).get("user_id"))
+            rows.append((self.name, ts, user_id, json.dumps(doc, default=str)))
+        with self.store.lock:
+            with self.store.conn:
+                self.store.conn.executemany(
+                    "INSERT INTO events (collection, ts, user_id, doc) VALUES (?, ?, ?, ?)", rows
+                )
+
+
+class SQLiteManager(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # durable across app crashes, fsync at checkpoints
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.executescript(SCHEMA)
+        log.info(f"✅ Using local SQLite storage: {path}")
+
+    def _write(self, sql, params=()):
+        """Run one write in its own transaction, returns the cursor"""
+        with self.lock:
+            with self.conn:
+                return self.conn.execute(sql, params)
+
+    def _read(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    # ==============================
+    # ADMIN MANAGEMENT
+    # ==============================
+
+    def save_admins(self, admin_ids):
+        try:
+            self._write("INSERT OR REPLACE INTO meta (key, value) VALUES ('admin_list', ?)",
+                        (json.dumps(list(admin_ids)),))
+            log.info(f"✅ Saved {len(admin_ids)} admins to SQLite")
+            return True
+        except Exception as e:
+            log.error(f"❌ Error saving admins: {e}")
+            return False
+
+    def get_admins(self):
+        try:
+            rows = self._read("SELECT value FROM meta WHERE key = 'admin_list'")
+            return set(json.loads(rows[0][0])) if rows else set()
+        except Exception as e:
+            log.error(f"❌ Error loading admins: {e}")
+            return set()
+
+    # ==============================
+    # SESSION FILE MANAGEMENT
+    # ==============================
+
+    def save_session_file(self, user_id, session_data):
+        try:
+            now = time.time()
+            self._write(
+                "INSERT INTO session_files (user_id, session_data, created_at, last_accessed) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET session_data = excluded.session_data, "
+                "created_at = excluded.created_at, last_accessed = excluded.last_accessed",
+                (user_id, sqlite3.Binary(session_data), now, now)
+            )
+            log.info(f"✅ Session file for user {user_id} saved to SQLite")
+            return True
+        except Exception as e:
+            log.error(f"❌ Error saving session file for user {user_id}: {e}")
+            return False
+
+    def get_session_file(self, user_id):
+        try:
+            rows = self._read("SELECT session_data FROM session_files WHERE user_id = ?", (user_id,))
+            if not rows:
+                return None
+            self._write("UPDATE session_files SET last_accessed = ? WHERE user_id = ?", (time.time(), user_id))
+            return bytes(rows[0][0])
+        except Exception as e:
+            log.error(f"❌ Error getting session file for user {user_id}: {e}")
+            return None
+
+    def delete_session_file(self, user_id):
+        try:
+            deleted = self._write("DELETE FROM session_files WHERE user_id = ?", (user_id,)).rowcount
+            if deleted:
+                log.info(f"✅ Session file for user {user_id} deleted from SQLite")
+            return deleted > 0
+        except Exception as e:
+            log.error(f"❌ Error deleting session file for user {user_id}: {e}")
+            return False
+
+    def session_file_exists(self, user_id):
+        try:
+            return bool(self._read("SELECT 1 FROM session_files WHERE user_id = ?", (user_id,)))
+        except Exception as e:
+            log.error(f"❌ Error checking session file existence for user {user_id}: {e}")
+            return False
+
+    # ==============================
+    # APPROVED USERS MANAGEMENT
+    # ==============================
+
+    def save_approved_user(self, user_id, expiration=None):
+        try:
+            now = time.time()
+            self._write(
+                "INSERT OR REPLACE INTO approved_users (user_id, expiration, approved_at, last_updated) "
+                "VALUES (?, ?, ?, ?)",
+                (user_id, expiration, now, now)
+            )
+            log.info(f"✅ Approved user {user_id} saved to SQLite")
+            return True
+        except Exception as e:
+            log.error(f"❌ Error saving approved user {user_id}: {e}")
+            return False
+
+    def remove_approved_user(self, user_id):
+        try:
+            deleted = self._write("DELETE FROM approved_users WHERE user_id = ?", (user_id,)).rowcount
+            if deleted:
+                log.info(f"✅ Approved user {user_id} removed from SQLite")
+            return deleted > 0
+        except Exception as e:
+            log.error(f"❌ Error removing approved user {user_id}: {e}")
+            return False
+
+    def get_approved_users(self):
+        try:
+            approved = dict(self._read("SELECT user_id, expiration FROM approved_users"))
+            log.info(f"✅ Loaded {len(approved)} approved users from SQLite")
+            return approved
+        except Exception as e:
+            log.error(f"❌ Error loading approved users: {e}")
+            return {}
+
+    def get_approved_users_page(self, query=None, skip=0, limit=20):
+        try:
+            where, params = _where(query)
+            rows = self._read(
+                f"SELECT user_id, expiration FROM approved_users{where} "
+                "ORDER BY expiration, user_id LIMIT ? OFFSET ?",
+                (*params, limit + 1, skip)
+            )
+            return rows[:limit], len(rows) > limit
+        except Exception as e:
+            log.error(f"❌ Error loading approved users page: {e}")
+            return [], False
+
+    def cleanup_expired_approvals(self):
+        """Remove expired approvals (also prunes old events, this runs periodically)"""
+        try:
+            deleted = self._write(
+                "DELETE FROM approved_users WHERE expiration IS NOT NULL AND expiration < ?", (time.time(),)
+            ).rowcount
+            if deleted:
+                log.info(f"✅ Removed {deleted} expired approvals from SQLite")
+            self.prune_events()
+            return deleted
+        except Exception as e:
+            log.error(f"❌ Error cleaning up expired approvals: {e}")
+            return 0
+
+    # ==============================
+    # USER CONFIG / USER DATA
+    # ==============================
+
+    def _save_json(self, table, column, user_id, value):
+        self._write(
+            f"INSERT OR REPLACE INTO {table} (user_id, {column}, last_updated) VALUES (?, ?, ?)",
+            (user_id, json.dumps(value), time.time())
+        )
+
+    def _load_json(self, table, column, user_id):
+        rows = self._read(f"SELECT {column} FROM {table} WHERE user_id = ?", (user_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def _load_all_json(self, table, column):
+        return {user_id: json.loads(value) for user_id, value in self._read(f"SELECT user_id, {column} FROM {table}")}
+
+    def save_user_config(self, user_id, config_data):
+        try:
+            self._save_json("user_config", "config", user_id, config_data)
+            log.info(f"✅ User config for {user_id} saved to SQLite")
+            return True
+        except Exception as e:
+            log.error(f"❌ Error saving user config {user_id}: {e}")
+            return False
+
+    def get_user_config(self, user_id):
+        try:
+            config = self._load_json("user_config", "config", user_id)
+            return config if config is not None else {}
+        except Exception as e:
+            log.error(f"❌ Error getting user config {user_id}: {e}")
+            return {}
+
+    def get_all_user_configs(self):
+        try:
+            return self._load_all_json("user_config", "config")
+        except Exception as e:
+            log.error(f"❌ Error loading all user configs: {e}")
+            return {}
+
+    def save_user_data(self, user_id, user_data):
+        try:
+            self._save_json("user_data", "data", user_id, user_data)
+            log.info(f"✅ User data for {user_id} saved to SQLite")
+            return True
+        except Exception as e:
+            log.error(f"❌ Error saving user data {user_id}: {e}")
+            return False
+
+    def get_user_data(self, user_id):
+        try:
+            data = self._load_json("user_data", "data", user_id)
+            return data if data is not None else dict(DEFAULT_USER_DATA)
+        except Exception as e:
+            log.error(f"❌ Error getting user data {user_id}: {e}")
+            return dict(DEFAULT_USER_DATA)
+
+    def get_all_user_data(self):
+        try:
+            return self._load_all_json("user_data", "data")
+        except Exception as e:
+            log.error(f"❌ Error loading all user data: {e}")
+            return {}
+
+    # ==============================
+    # SESSION MANAGEMENT
+    # ==============================
+
+    def save_session_state(self, user_id, session_data):
+        try:
+            self._write(
+                "INSERT OR REPLACE INTO sessions (user_id, session_data, last_accessed) VALUES (?, ?, ?)",
+                (user_id, json.dumps(session_data, default=str), time.time())
+            )
+            log.debug(f"✅ Session state for {user_id} saved to SQLite")
+            return True
+        except Exception as e:
+            log.error(f"❌ Error saving session state {user_id}: {e}")
+            return False
+
+    def get_session_state(self, user_id):
+        try:
+            rows = self._read("SELECT session_data FROM sessions WHERE user_id = ?", (user_id,))
+            return json.loads(rows[0][0]) if rows else {}
+        except Exception as e:
+            log.error(f"❌ Error getting session state {user_id}: {e}")
+            return {}
+
+    def get_all_session_states(self):
+        try:
+            return self._load_all_json("sessions", "session_data")
+        except Exception as e:
+            log.error(f"❌ Error loading session states: {e}")
+            return {}
+
+    def delete_session_state(self, user_id):
+        try:
+            deleted = self._write("DELETE FROM sessions WHERE user_id = ?", (user_id,)).rowcount
+            if deleted:
+                log.info(f"✅ Session state for {user_id} deleted from SQLite")
+            return deleted > 0
+        except Exception as e:
+            log.error(f"❌ Error deleting session state {user_id}: {e}")
+            return False
+
+    # ==============================
+    # APPEND-ONLY COLLECTIONS
+    # ==============================
+
+    def collection(self, name):
+        return SQLiteEventCollection(self, name)
+
+    def prune_events(self):
+        """Drop events past their retention period"""
+        now = time.time()
+        for name, days in EVENT_RETENTION.items():
+            self._write("DELETE FROM events WHERE collection = ? AND ts < ?", (name, now - days * 86400))
+
+    def get_trade_price_counts(self, days=TRADE_HISTORY_DAYS):
+        try:
+            return self._read(
+                "SELECT json_extract(doc, '$.meta.currency'), json_extract(doc, '$.price'), "
+                "COUNT(*), SUM(json_extract(doc, '$.bought')) "
+                "FROM events WHERE collection = 'trade_offers' AND ts >= ? GROUP BY 1, 2",
+                (time.time() - days * 86400,)
+            )
+        except Exception as e:
+            log.error(f"❌ Error loading trade history: {e}")
+            return []
+
+    def get_farm_event_counts(self, hours=24, user_id=None):
+        try:
+            sql = "SELECT json_extract(doc, '$.kind'), COUNT(*) FROM events WHERE collection = 'farm_events' AND ts >= ?"
+            params = [time.time() - hours * 3600]
+            if user_id is not None:
+                sql += " AND user_id = ?"
+                params.append(user_id)
+            return dict(self._read(sql + " GROUP BY 1", params))
+        except Exception as e:
+            log.error(f"❌ Error counting farm events: {e}")
+            return {}
+
+    def get_farm_events_per_hour(self, user_id, hours=24):
+        try:
+            rows = self._read(
+                "SELECT strftime('%Y-%m-%d %H:00', ts, 'unixepoch'), json_extract(doc, '$.kind'), COUNT(*) "
+                "FROM events WHERE collection = 'farm_events' AND user_id = ? AND ts >= ? "
+                "GROUP BY 1, 2 ORDER BY 1",
+                (user_id, time.time() - hours * 3600)
+            )
+            hourly = {}
+            for hour, kind, count in rows:
+                hourly.setdefault(hour, {})[kind] = count
+            return hourly
+        except Exception as e:
+            log.error(f"❌ Error loading hourly farm events {user_id}: {e}")
+            return {}
+
+    # ==============================
+    # STATISTICS AND MAINTENANCE
+    # ==============================
+
+    def get_database_stats(self):
+        try:
+            collections = {name: {"count": self._read(f"SELECT COUNT(*) FROM {name}")[0][0]} for name in TABLES}
+            for name, count in self._read("SELECT collection, COUNT(*) FROM events GROUP BY collection"):
+                collections[name] = {"count": count}
+            return {"collections": collections, "taken_at": time.time()}
+        except Exception as e:
+            log.error(f"❌ Error getting database stats: {e}")
+            return {}
+
+    def close_connection(self):
+        try:
+            with self.lock:
+                self.conn.close()
+            log.info("✅ SQLite connection closed")
+        except Exception as e:
+            log.error(f"❌ Error closing SQLite connection: {e}")
@@ -0,0 +1,56 @@
+"""
+Cached database statistics snapshot.
+
+Collection statistics are fetched by a background thread every `ttl` seconds
+and kept in memory, so /dbstats answers instantly from the last snapshot
+instead of hitting the database on every call.
+"""
+
+import time
+import logging
+import threading
+
+log = logging.getLogger("StatsCache")
+
+
+class StatsSnapshotCache:
+    def __init__(self, fetch, ttl=300):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.snapshot = {}
+        self.updated_at = 0.0
+        self._refreshing = threading.Lock()
+        self._thread = None
+
+    def refresh(self):
+        """Fetch a new snapshot now (skipped if a refresh is already running)"""
+        if not self._refreshing.acquire(blocking=False):
+            return
+        try:
+            snapshot = self.fetch()
+            if snapshot:
+                self.snapshot = snapshot
+                self.updated_at = time.time()
+        except Exception as e:
+            log.error(f"❌ Stats refresh failed: {e}")
+        finally:
+            self._refreshing.release()
+
+    def get(self):
+        """Return (snapshot, age in seconds) without blocking on the database"""
+        # The refresh thread keeps this fresh; only kick it if it fell behind
+        if time.time() - self.updated_at > self.ttl * 2:
+            threading.Thread(target=self.refresh, daemon=True).start()
+        age = time.time() - self.updated_at if self.updated_at else None
+        return self.snapshot, age
+
+    def _run(self):
+        while True:
+            self.refresh()
+            time.sleep(self.ttl)
+
+    def start(self):
+        """Start the background refresh thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stats-refresh", daemon=True)
+            self._thread.start()
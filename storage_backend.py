@@ -0,0 +1,200 @@
+"""
+Storage backend interface.
+
+bot.py talks to storage only through the methods below, so the MongoDB
+backend (mongo_db.MongoDBManager) and the embedded SQLite backend
+(sqlite_store.SQLiteManager) are interchangeable. mongo_db.mongo_manager
+holds whichever one is active.
+
+Append-only data (trade offers, farm events) is written through
+BatchInserter on collection(name), which both backends provide.
+"""
+
+import os
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from pymongo.errors import BulkWriteError
+
+log = logging.getLogger("Storage")
+
+# Trade offer history kept for /tradestats
+TRADE_HISTORY_DAYS = int(os.environ.get("TRADE_HISTORY_DAYS", "90"))
+
+
+class _Unavailable:
+    """Answer of a read the backend could not make (server unreachable).
+    Falsy like an empty result, but callers that must not mistake an outage
+    for "nothing stored" (session files) check `is UNAVAILABLE` first."""
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "UNAVAILABLE"
+
+
+UNAVAILABLE = _Unavailable()
+
+
+class StorageBackend(ABC):
+    """Methods every backend implements. Writes return True/False and reads
+    return an empty value on errors, they never raise. The session file
+    reads return UNAVAILABLE instead while the backend is unreachable."""
+
+    name = "none"
+
+    # Admins
+    @abstractmethod
+    def save_admins(self, admin_ids): ...
+    @abstractmethod
+    def get_admins(self): ...
+
+    # Telethon session files (raw bytes)
+    @abstractmethod
+    def save_session_file(self, user_id, session_data): ...
+    @abstractmethod
+    def get_session_file(self, user_id): ...
+    @abstractmethod
+    def delete_session_file(self, user_id): ...
+    @abstractmethod
+    def session_file_exists(self, user_id): ...
+
+    # Approvals; expiration is a unix timestamp or None for permanent
+    @abstractmethod
+    def save_approved_user(self, user_id, expiration=None): ...
+    @abstractmethod
+    def remove_approved_user(self, user_id): ...
+    @abstractmethod
+    def get_approved_users(self): ...
+    @abstractmethod
+    def get_approved_users_page(self, query=None, skip=0, limit=20):
+        """query uses the MongoDB filter syntax: equality, $in, $gt/$gte/$lt/$lte"""
+    @abstractmethod
+    def cleanup_expired_approvals(self):
+        """Remove expired approvals and prune expired events; runs every hour"""
+
+    # Per-user config and data
+    @abstractmethod
+    def save_user_config(self, user_id, config_data): ...
+    @abstractmethod
+    def get_user_config(self, user_id): ...
+    @abstractmethod
+    def get_all_user_configs(self): ...
+    @abstractmethod
+    def save_user_data(self, user_id, user_data): ...
+    @abstractmethod
+    def get_user_data(self, user_id): ...
+    @abstractmethod
+    def get_all_user_data(self): ...
+
+    # Session state
+    @abstractmethod
+    def save_session_state(self, user_id, session_data): ...
+    @abstractmethod
+    def get_session_state(self, user_id): ...
+    @abstractmethod
+    def delete_session_state(self, user_id): ...
+    @abstractmethod
+    def get_all_session_states(self): ...
+
+    # Append-only collections and their aggregations
+    @abstractmethod
+    def collection(self, name):
+        """Target for BatchInserter: has .name and .insert_many(docs, ordered=False)"""
+    @abstractmethod
+    def get_trade_price_counts(self, days=TRADE_HISTORY_DAYS): ...
+    @abstractmethod
+    def get_farm_event_counts(self, hours=24, user_id=None): ...
+    @abstractmethod
+    def get_farm_events_per_hour(self, user_id, hours=24): ...
+
+    # Maintenance
+    def is_available(self):
+        """False while reads are answered with fallbacks (outage)"""
+        return True
+    def get_health(self):
+        return {"available": self.is_available(), "wal_pending": 0, "breaker_trips": 0}
+    def on_connected(self, callback):
+        """Run callback() once a backend that was unreachable at startup connects.
+        Backends that are connected from the start never call it."""
+    @abstractmethod
+    def get_database_stats(self): ...
+    @abstractmethod
+    def close_connection(self): ...
+
+
+# ==============================
+# BATCHED INSERTS
+# ==============================
+
+class BatchInserter:
+    """Buffers documents in memory and writes them with insert_many from a
+    background thread, so callers never wait on the database.
+    add() is O(1); if the database is unreachable for long the oldest
+    buffered documents are dropped once max_buffer is reached."""
+    
+    def __init__(self, collection, batch_size=500, flush_interval=5.0, max_buffer=20000):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = deque(maxlen=max_buffer)
+        self._wake = threading.Event()
+        self._thread = None
+        self.inserted = 0
+        self.dropped = 0
+        self.failed_batches = 0
+    
+    def add(self, doc):
+        """Queue one document (never blocks)"""
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(doc)
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+    
+    def flush(self):
+        """Write everything buffered; returns False if a batch failed and was requeued"""
+        while self._buffer:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._buffer.popleft())
+            except IndexError:
+                pass
+            try:
+                self.collection.insert_many(batch, ordered=False)
+                self.inserted += len(batch)
+            except BulkWriteError as e:
+                # Unordered: the rest of the batch was still written
+                self.inserted += e.details.get("nInserted", 0)
+                log.error(f"❌ {len(e.details.get('writeErrors', []))} documents rejected by {self.collection.name}")
+            except Exception as e:
+                self.failed_batches += 1
+                # Requeued at the front; a full buffer evicts the newest documents
+                self.dropped += max(0, len(self._buffer) + len(batch) - self._buffer.maxlen)
+                self._buffer.extendleft(reversed(batch))
+                log.error(f"❌ Batch insert into {self.collection.name} failed, will retry: {e}")
+                return False
+        return True
+    
+    def get_stats(self):
+        return {
+            "buffered": len(self._buffer),
+            "inserted": self.inserted,
+            "dropped": self.dropped,
+            "failed_batches": self.failed_batches,
+        }
+    
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+    
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"{self.collection.name}-writer", daemon=True)
+            self._thread.start()
@@ -0,0 +1,55 @@
+import json
+import os
+from typing import NamedTuple
+
+import pytest
+
+from captcha_detector import DEFAULT_THRESHOLD, classify, required_literal
+from game_rules import RULES_PATH, load_rules
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "captcha_messages.json")
+
+with open(FIXTURE, encoding="utf-8") as f:
+    MESSAGES = json.load(f)["messages"]
+
+
+class Button(NamedTuple):
+    text: str
+
+
+def keyboard(rows):
+    return [[Button(label) for label in row] for row in rows]
+
+
+@pytest.fixture(scope="module")
+def patterns():
+    rules, _ = load_rules(RULES_PATH)
+    return rules.captcha
+
+
+@pytest.mark.parametrize("message", MESSAGES, ids=lambda m: m["text"][:40])
+def test_corpus_labels(patterns, message):
+    verdict = classify(message["text"], patterns, keyboard(message["buttons"]), DEFAULT_THRESHOLD)
+    assert verdict.is_captcha == message["captcha"], verdict
+
+
+@pytest.mark.parametrize("text", ["You used Friendship Band!", "an old shrine of worship", "Membership bonus"])
+def test_words_containing_ship_are_not_evidence(patterns, text):
+    assert classify(text, patterns).confidence == 0.0
+
+
+@pytest.mark.parametrize("message", MESSAGES, ids=lambda m: m["text"][:40])
+def test_literal_prefilter_never_hides_a_match(patterns, message):
+    text = message["text"].lower()
+    expected = tuple(name for name, _, _, regex in patterns.patterns if regex.search(text))
+    assert classify(message["text"], patterns).reasons == expected
+
+
+@pytest.mark.parametrize("regex, literal", [
+    ("rich merchant", "rich merchant"),
+    ("you stumble upon (?:an? )?evil mystic wizard", "evil mystic wizard"),
+    ("s(?<=\\bs)hips?\\b", "hip"),
+    ("wrong|incorrect", ""),
+])
+def test_required_literal(regex, literal):
+    assert required_literal(regex) == literal
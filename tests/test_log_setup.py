@@ -0,0 +1,32 @@
+import io
+import queue
+import logging
+
+from log_setup import DroppingQueueHandler
+
+
+def full_handler():
+    stream = io.StringIO()
+    handler = DroppingQueueHandler(queue.Queue(1), overflow=logging.StreamHandler(stream), block_timeout=0.01)
+    handler.queue.put_nowait(None)
+    return handler, stream
+
+
+def record(level, msg):
+    return logging.LogRecord("AutoFarm", level, __file__, 1, msg, None, None)
+
+
+def test_full_queue_drops_info():
+    handler, stream = full_handler()
+    handler.handle(record(logging.INFO, "explore answered"))
+    assert handler.dropped == 1
+    assert stream.getvalue() == ""
+
+
+def test_full_queue_never_loses_warnings():
+    handler, stream = full_handler()
+    handler.handle(record(logging.WARNING, "no response after /explore"))
+    handler.handle(record(logging.ERROR, "failed to send /explore"))
+    assert handler.dropped == 0
+    assert handler.overflowed == 2
+    assert stream.getvalue().splitlines() == ["no response after /explore", "failed to send /explore"]
@@ -0,0 +1,28 @@
+from mongo_wal import WriteAheadLog
+
+
+def test_late_append_replays_in_issue_order(tmp_path):
+    wal = WriteAheadLog(str(tmp_path / "wal.jsonl"), fsync=False)
+    old = wal.next_seq()  # direct write issued, then times out
+    wal.append("user_config", "upsert", {"user_id": 1}, {"limit": 200})  # newer write, logged first
+    wal.append("user_config", "upsert", {"user_id": 1}, {"limit": 100}, old)
+    assert [entry["d"]["limit"] for entry in wal.entries()] == [100, 200]
+
+
+def test_sequence_continues_after_restart(tmp_path):
+    path = str(tmp_path / "wal.jsonl")
+    wal = WriteAheadLog(path, fsync=False)
+    wal.append("sessions", "delete", {"user_id": 1})
+    wal.append("sessions", "delete", {"user_id": 2})
+    reopened = WriteAheadLog(path, fsync=False)
+    assert reopened.pending() == 2
+    assert reopened.next_seq() == 3
+
+
+def test_entries_without_sequence_keep_file_order(tmp_path):
+    path = tmp_path / "wal.jsonl"
+    path.write_text('{"c": "sessions", "op": "delete", "f": {"user_id": 1}}\n'
+                    '{"c": "sessions", "op": "delete", "f": {"user_id": 2}}\n'
+                    '{"c": "sessions", "op": "delete", "f": {"user_id": 3', encoding="utf-8")
+    wal = WriteAheadLog(str(path), fsync=False)
+    assert [entry["f"]["user_id"] for entry in wal.entries()] == [1, 2]
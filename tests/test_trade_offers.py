@@ -0,0 +1,40 @@
+import json
+import os
+import random
+
+import pytest
+
+from benchmarks.bench_trade_offers import legacy_decide, random_offer_message
+from trade_offers import decide_offer, parse_offer
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "trade_offers.json")
+
+with open(FIXTURE, encoding="utf-8") as f:
+    RECORDED = json.load(f)
+
+LIMITS = RECORDED["limits"]
+
+
+@pytest.mark.parametrize("message", RECORDED["messages"], ids=lambda m: m["text"].split("\n", 1)[-1][:40])
+def test_recorded_offers(message):
+    offer = parse_offer(message["text"])
+    assert offer.prices == message["prices"]
+    assert decide_offer(offer, LIMITS) == message["decision"]
+
+
+@pytest.mark.parametrize("message", RECORDED["messages"], ids=lambda m: m["text"].split("\n", 1)[-1][:40])
+def test_recorded_offers_match_legacy_parser(message):
+    assert decide_offer(parse_offer(message["text"]), LIMITS) == legacy_decide(message["text"], LIMITS)
+
+
+def test_random_offers_match_legacy_parser():
+    rng = random.Random(1)
+    for _ in range(5000):
+        text = random_offer_message(rng)
+        limits = {"pearl": rng.randint(0, 400), "ticket": rng.randint(0, 800)}
+        assert decide_offer(parse_offer(text), limits) == legacy_decide(text, limits), text
+
+
+def test_currency_without_limit_is_never_bought():
+    offer = parse_offer("🧳 The trader offers you:\n5 Pearls for 1")
+    assert decide_offer(offer, {"ticket": 500}) is None
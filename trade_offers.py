@@ -0,0 +1,59 @@
+"""
+Trader offer parsing and buy decisions.
+
+The trader lists one offer per line, e.g. "5 Pearls for 180" or
+"2 Tickets for 450". parse_offer() finds the last "<currency>s for " in the
+lowercased message with str.rfind and reads the number after it;
+decide_offer() then compares the prices against the user's maximum prices.
+
+Recorded trader messages and the expected decisions are in
+tests/fixtures/trade_offers.json (tests/test_trade_offers.py).
+"""
+
+import re
+from typing import Dict, NamedTuple, Optional
+
+# Currencies the trader sells, in buying priority order
+CURRENCIES = ("pearl", "ticket")
+
+# "<currency>s for " keys, searched in lowercased text (cheaper than re.IGNORECASE)
+OFFER_KEYS = tuple((currency, currency + "s for ") for currency in CURRENCIES)
+PRICE_PATTERN = re.compile(r"\d+")
+
+
+class TradeOffer(NamedTuple):
+    """Per-unit prices found in one trader message, keyed by currency"""
+    prices: Dict[str, int]
+
+    def price(self, currency: str) -> Optional[int]:
+        return self.prices.get(currency)
+
+
+def parse_offer(text: str) -> TradeOffer:
+    """Extract all currency offers from a trader message.
+    If a currency appears more than once the last offer wins."""
+    # One rfind per currency instead of a regex pass over the whole message.
+    # The per-line parser bot.py had is still ~0.4 us faster per message
+    # (python -m benchmarks.bench_trade_offers): the difference is building
+    # the TradeOffer that trade_stats records, and the trader shows a few
+    # offers per user per hour, so it is not worth a second code path.
+    text = text.lower()
+    prices = {}
+    for currency, key in OFFER_KEYS:
+        start = text.rfind(key)
+        if start >= 0:
+            match = PRICE_PATTERN.match(text, start + len(key))
+            if match:
+                prices[currency] = int(match.group())
+    return TradeOffer(prices)
+
+
+def decide_offer(offer: TradeOffer, max_prices: Dict[str, int]) -> Optional[str]:
+    """Return the currency to buy, or None to walk away.
+    Currencies without a max price are never bought."""
+    for currency in CURRENCIES:
+        price = offer.prices.get(currency)
+        limit = max_prices.get(currency)
+        if price and limit is not None and price <= limit:
+            return currency
+    return None
@@ -0,0 +1,104 @@
+"""
+Trader offer analytics.
+
+Every offer the trader shows (and whether we bought it) is counted in a
+per-currency price histogram and handed to a sink, normally a
+mongo_db.BatchInserter writing to the `trade_offers` time-series collection.
+record() only bumps a few counters and appends to the sink's buffer, so it
+never slows down the trade decision itself.
+
+Percentiles are read off the histograms: prices are whole numbers in a small
+range, so a query walks a few hundred distinct prices at most, no matter how
+many offers were seen.
+
+Document layout in `trade_offers`:
+    {"ts": datetime, "meta": {"user_id": 123, "currency": "pearl"},
+     "price": 180, "limit": 250, "bought": True}
+"""
+
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from trade_offers import CURRENCIES, TradeOffer
+
+
+def histogram_percentiles(counts: Counter, quantiles: List[float]) -> List[Optional[int]]:
+    """Prices at the given quantiles (0..1) of a price -> count histogram"""
+    total = sum(counts.values())
+    if not total:
+        return [None] * len(quantiles)
+    prices = sorted(counts.items())
+    result = []
+    for q in quantiles:
+        target, seen = q * total, 0
+        for price, n in prices:
+            seen += n
+            if seen >= target:
+                result.append(price)
+                break
+    return result
+
+
+class TradeStats:
+    def __init__(self, sink=None):
+        # sink(doc) receives one document per offered currency
+        self.sink = sink
+        self._prices = {currency: Counter() for currency in CURRENCIES}
+        self._bought = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, user_id: int, offer: TradeOffer, bought: Optional[str], limits: Dict[str, int]):
+        """Count one trader offer and the decision taken for it"""
+        now = datetime.utcnow()
+        with self._lock:
+            for currency, price in offer.prices.items():
+                self._prices[currency][price] += 1
+                if currency == bought:
+                    self._bought[currency] += 1
+        if self.sink:
+            for currency, price in offer.prices.items():
+                self.sink({
+                    "ts": now,
+                    "meta": {"user_id": user_id, "currency": currency},
+                    "price": price,
+                    "limit": limits.get(currency),
+                    "bought": currency == bought,
+                })
+
+    def load(self, rows):
+        """Merge history rows of (currency, price, offers, bought)"""
+        with self._lock:
+            for currency, price, offers, bought in rows:
+                if currency in self._prices:
+                    self._prices[currency][price] += offers
+                    self._bought[currency] += bought
+
+    def summary(self, currency: str, quantiles=(0.1, 0.5, 0.9)):
+        """Offer count, purchases and price percentiles for one currency"""
+        with self._lock:
+            counts = Counter(self._prices[currency])
+            bought = self._bought[currency]
+        return {
+            "offers": sum(counts.values()),
+            "bought": bought,
+            "percentiles": dict(zip(quantiles, histogram_percentiles(counts, list(quantiles)))),
+        }
+
+    def share_at_or_below(self, currency: str, limit: int) -> Optional[float]:
+        """Fraction of offers a max price of `limit` would have accepted"""
+        with self._lock:
+            counts = self._prices[currency]
+            total = sum(counts.values())
+            if not total:
+                return None
+            return sum(n for price, n in counts.items() if price <= limit) / total
+
+    def suggest_limit(self, currency: str, buy_rate: float, min_samples: int = 50) -> Optional[int]:
+        """Max price that would have bought roughly `buy_rate` of past offers"""
+        with self._lock:
+            counts = Counter(self._prices[currency])
+        if sum(counts.values()) < min_samples:
+            return None
+        return histogram_percentiles(counts, [buy_rate])[0]
@@ -0,0 +1,125 @@
+"""
+Ordered executor for control bot updates.
+
+Updates from different users run concurrently on a fixed thread pool, while
+updates from the same user run strictly one after another in arrival order.
+That keeps register_next_step_handler flows (login, gcnoti, /rate) correct
+without letting one slow command block everyone else.
+
+Each key owns a FIFO lane. A lane is present in `_lanes` exactly while it has
+work, and its key sits in the ready queue at most once, so no two workers ever
+run tasks for the same key at the same time.
+"""
+
+import queue
+import logging
+import threading
+from collections import deque
+
+log = logging.getLogger("UpdateExecutor")
+
+
+class KeyedExecutor:
+    def __init__(self, workers=8, max_queued=1000, name="handler"):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.name = name
+
+        self._lanes = {}
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._threads = []
+        self.closed = False
+
+        # Metrics
+        self.queued = 0
+        self.peak_queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        log.info(f"✅ {self.name} executor started ({self.workers} workers, max queue {self.max_queued})")
+
+    def submit(self, key, fn, *args, block=True, **kwargs):
+        """Queue fn(*args, **kwargs) on the lane for key.
+        Returns False if the executor is closed, or full and block is False."""
+        with self._not_full:
+            if self.closed:
+                self.rejected += 1
+                return False
+            while self.queued >= self.max_queued:
+                if not block:
+                    self.rejected += 1
+                    return False
+                self._not_full.wait()
+
+            self.queued += 1
+            self.submitted += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+
+            lane = self._lanes.get(key)
+            if lane is None:
+                self._lanes[key] = deque([(fn, args, kwargs)])
+                self._ready.put(key)
+            else:
+                lane.append((fn, args, kwargs))
+        return True
+
+    def close(self):
+        """Reject new tasks from now on; queued ones still run"""
+        with self._lock:
+            self.closed = True
+
+    def drain(self, timeout=None):
+        """Wait until every queued task has run, returns False on timeout"""
+        with self._not_full:
+            return self._not_full.wait_for(lambda: self.queued == 0, timeout)
+
+    def _worker(self):
+        while True:
+            key = self._ready.get()
+            with self._lock:
+                fn, args, kwargs = self._lanes[key][0]
+                self.running += 1
+
+            failed = False
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                failed = True
+                log.error(f"[✗] {self.name} task for {key} failed: {e}")
+
+            with self._not_full:
+                self.failed += failed
+                self.running -= 1
+                self.completed += 1
+                self.queued -= 1
+                lane = self._lanes[key]
+                lane.popleft()
+                if lane:
+                    self._ready.put(key)
+                else:
+                    del self._lanes[key]
+                self._not_full.notify_all()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self.queued,
+                "peak_queued": self.peak_queued,
+                "running": self.running,
+                "active_lanes": len(self._lanes),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
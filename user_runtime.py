@@ -0,0 +1,118 @@
+"""
+Per-user runtime state.
+
+Everything the process keeps in memory about one account lives in a single
+UserRuntime record, stored in the `users` registry.
+
+Lifecycle:
+1. created    - get_or_create() on /setup, session restore or login
+2. logging in - waiting_for_phone, then pending_client + pending_expect
+                ("otp" / "password") until Telethon authorizes the session
+3. logged in  - client set, logged_in True; farming flipped by /toggle and
+                the combat/captcha flags updated by game bot messages
+   hibernated - logged in but idle: client disconnected and dropped, session
+                kept on disk and in MongoDB until farming is turned on again
+4. removed    - remove() on /cancel or /delete drops the whole record, so no
+                per-user entry can be left behind
+
+The Telethon session itself is persisted in MongoDB and is not touched by
+any of these steps.
+"""
+
+from typing import Dict, Optional
+
+
+class UserRuntime:
+    __slots__ = (
+        "user_id",
+        # Telethon clients and login flow
+        "client", "pending_client", "pending_expect", "waiting_for_phone", "logged_in", "hibernated",
+        # Farming state
+        "farming", "paused", "farm_started", "last_active", "last_explore", "explore_event",
+        "in_combat", "captcha_active", "captcha_since", "latest_msg_id", "explore_sent_msg_id",
+        # Handled game bot message versions (MessageVersionCache, created lazily)
+        "versions",
+        # Watchdog backoff (see watchdog.py)
+        "watchdog_failures", "watchdog_retry_at",
+    )
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.client = None
+        self.pending_client = None
+        self.pending_expect: Optional[str] = None
+        self.waiting_for_phone = False
+        self.logged_in = False
+        self.hibernated = False
+        self.farming = False
+        # Turned off by the user: schedules do not restart farming until /toggle on
+        self.paused = False
+        self.farm_started = 0.0
+        self.last_active = 0.0
+        self.last_explore = 0.0
+        self.explore_event = None
+        self.in_combat = False
+        self.captcha_active = False
+        self.captcha_since = 0.0
+        self.latest_msg_id = None
+        self.explore_sent_msg_id = None
+        self.versions = None
+        self.watchdog_failures = 0
+        self.watchdog_retry_at = 0.0
+
+    def active_client(self):
+        """The logged-in client, or the one still waiting for OTP/password"""
+        return self.client or self.pending_client
+
+
+class UserRegistry:
+    def __init__(self):
+        self._users: Dict[int, UserRuntime] = {}
+
+    def get(self, user_id: int) -> Optional[UserRuntime]:
+        return self._users.get(user_id)
+
+    def get_or_create(self, user_id: int) -> UserRuntime:
+        rt = self._users.get(user_id)
+        if rt is None:
+            rt = self._users[user_id] = UserRuntime(user_id)
+        return rt
+
+    def remove(self, user_id: int) -> Optional[UserRuntime]:
+        return self._users.pop(user_id, None)
+
+    def values(self):
+        """Snapshot of all records, safe to iterate while others change the registry"""
+        return list(self._users.values())
+
+    def is_farming(self, user_id: int) -> bool:
+        rt = self._users.get(user_id)
+        return rt is not None and rt.farming
+
+    def has_client(self, user_id: int) -> bool:
+        rt = self._users.get(user_id)
+        return rt is not None and rt.client is not None
+
+    def has_session(self, user_id: int) -> bool:
+        """Logged in, whether the client is connected or hibernated"""
+        rt = self._users.get(user_id)
+        return rt is not None and (rt.client is not None or rt.hibernated)
+
+    def client_count(self) -> int:
+        return sum(1 for rt in self.values() if rt.client is not None)
+
+    def hibernated_count(self) -> int:
+        return sum(1 for rt in self.values() if rt.hibernated)
+
+    def farming_count(self) -> int:
+        return sum(1 for rt in self.values() if rt.farming)
+
+    def __contains__(self, user_id):
+        return user_id in self._users
+
+    def __len__(self):
+        return len(self._users)
+
+
+# Global registry instance
+users = UserRegistry()
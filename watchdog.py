@@ -0,0 +1,89 @@
+"""
+Per-client watchdog.
+
+A sweep every WATCHDOG_INTERVAL seconds looks at each farming user once,
+reading a few UserRuntime fields (O(1) per user, no I/O):
+- reconnect  the client is gone or Telethon reports it disconnected
+- rekick     connected, but the game bot has been silent for STALL_AFTER
+             seconds: the explore chain broke (a lost /explore, a handler
+             that timed out, a combat that never finished)
+Users in a captcha are left alone, they wait for a human.
+
+Recovery attempts back off exponentially per user (BACKOFF_BASE doubling up
+to BACKOFF_MAX, with jitter so a fleet-wide outage does not reconnect
+everyone in lockstep). A user counts as healthy again, and the backoff
+resets, as soon as a sweep finds the bot talking to it.
+"""
+
+import os
+import time
+import random
+from collections import Counter
+from typing import Optional
+
+WATCHDOG_INTERVAL = float(os.environ.get("WATCHDOG_INTERVAL", "15"))
+STALL_AFTER = float(os.environ.get("WATCHDOG_STALL_AFTER", "90"))
+BACKOFF_BASE = float(os.environ.get("WATCHDOG_BACKOFF_BASE", "15"))
+BACKOFF_MAX = float(os.environ.get("WATCHDOG_BACKOFF_MAX", "900"))
+# Failed attempts in a row before the user is told farming is stuck
+ALERT_AFTER = int(os.environ.get("WATCHDOG_ALERT_AFTER", "5"))
+
+# Longest a Telethon update may spend in its handlers before it is cancelled
+HANDLER_TIMEOUT = float(os.environ.get("WATCHDOG_HANDLER_TIMEOUT", "60"))
+
+RECONNECT, REKICK = "reconnect", "rekick"
+
+
+class ClientWatchdog:
+    def __init__(self, stall_after=STALL_AFTER, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
+        self.stall_after = stall_after
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.actions = Counter()
+        self.unhealthy = 0
+        self.last_sweep = time.time()
+
+    def diagnose(self, rt, now) -> Optional[str]:
+        """What is wrong with a farming user, None if nothing"""
+        if not rt.farming or rt.captcha_active:
+            return None
+        client = rt.client
+        if client is None or not client.is_connected():
+            return RECONNECT
+        if now - max(rt.last_active, rt.farm_started) > self.stall_after:
+            return REKICK
+        return None
+
+    def check(self, rt, now) -> Optional[str]:
+        """Diagnose one user and return the recovery to run now, if any"""
+        problem = self.diagnose(rt, now)
+        if problem is None:
+            rt.watchdog_failures = 0
+            return None
+        self.unhealthy += 1
+        if now < rt.watchdog_retry_at:
+            return None
+        delay = min(self.backoff_max, self.backoff_base * 2 ** rt.watchdog_failures)
+        rt.watchdog_retry_at = now + delay * random.uniform(0.8, 1.2)
+        rt.watchdog_failures += 1
+        self.actions[problem] += 1
+        return problem
+
+    def sweep(self, runtimes, now):
+        """(rt, action) for every user that needs a recovery now"""
+        self.unhealthy = 0
+        self.last_sweep = now
+        due = []
+        for rt in runtimes:
+            action = self.check(rt, now)
+            if action:
+                due.append((rt, action))
+        return due
+
+    def get_stats(self):
+        return {
+            "unhealthy": self.unhealthy,
+            "reconnects": self.actions[RECONNECT],
+            "rekicks": self.actions[REKICK],
+            "last_sweep": self.last_sweep,
+        }
@@ -0,0 +1,134 @@
+"""
+Keep-alive web server.
+Runs a small Flask app in a background thread so the host keeps the process
+awake. bot.py also registers the Telegram webhook endpoint on this app.
+
+Fleet dashboard (read-only):
+- /fleet         JSON snapshot of every account
+- /fleet/stream  the same snapshot pushed as server-sent events
+- /fleet/view    HTML page that renders the stream
+Snapshots come from a provider registered by bot.py that only copies
+in-memory state. Every route requires ?token=DASHBOARD_TOKEN; while
+DASHBOARD_TOKEN is unset the dashboard is disabled (403).
+
+Health probes (no token, for the orchestrator):
+- /healthz  liveness: every event loop answers
+- /readyz   readiness: loops answer, the watchdog sweeps, not shutting down
+           (storage is reported in the body but never fails it)
+Both return a JSON body and 200, or 503 when the check fails.
+"""
+
+import os
+import hmac
+import json
+import time
+import logging
+from threading import Thread
+from flask import Flask, Response, abort, jsonify, request
+
+log = logging.getLogger("WebServer")
+
+app = Flask(__name__)
+
+DASHBOARD_TOKEN = os.environ.get("DASHBOARD_TOKEN", "")
+FLEET_STREAM_INTERVAL = float(os.environ.get("FLEET_STREAM_INTERVAL", "2"))
+
+_fleet_provider = None
+_health_checks = {}
+
+def set_fleet_provider(provider):
+    """Register the function that returns the fleet snapshot dict"""
+    global _fleet_provider
+    _fleet_provider = provider
+
+def set_health_checks(liveness, readiness):
+    """Register the probes, each returns (ok, details dict)"""
+    _health_checks.update(liveness=liveness, readiness=readiness)
+
+def _probe(name):
+    check = _health_checks.get(name)
+    if check is None:
+        return jsonify({"ok": False, "reason": "starting"}), 503
+    ok, details = check()
+    return jsonify(dict(details, ok=ok)), 200 if ok else 503
+
+def _authorized_fleet_provider():
+    token = request.args.get("token", "")
+    if not DASHBOARD_TOKEN or not hmac.compare_digest(token.encode(), DASHBOARD_TOKEN.encode()):
+        abort(403)
+    if _fleet_provider is None:
+        abort(503)
+    return _fleet_provider
+
+@app.route('/')
+def home():
+    return "AutoFarm Bot is alive!"
+
+@app.route('/healthz')
+def healthz():
+    return _probe("liveness")
+
+@app.route('/readyz')
+def readyz():
+    return _probe("readiness")
+
+@app.route('/fleet')
+def fleet_json():
+    provider = _authorized_fleet_provider()
+    return jsonify(provider())
+
+@app.route('/fleet/stream')
+def fleet_stream():
+    provider = _authorized_fleet_provider()
+
+    def events():
+        while True:
+            yield f"data: {json.dumps(provider())}\n\n"
+            time.sleep(FLEET_STREAM_INTERVAL)
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+FLEET_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>AutoFarm Fleet</title>
+<style>
+body{font-family:sans-serif;margin:1em}table{border-collapse:collapse}
+td,th{padding:2px 8px;border-bottom:1px solid #ddd;text-align:left}
+.on{color:#080}.off{color:#999}.warn{color:#c00;font-weight:bold}
+</style></head><body>
+<h2>AutoFarm Fleet</h2><div id="totals"></div>
+<table><thead><tr><th>User</th><th>Name</th><th>Client</th><th>Farming</th>
+<th>Captcha</th><th>Combat</th><th>Last explore</th></tr></thead><tbody id="rows"></tbody></table>
+<script>
+const esc = (s) => String(s).replace(/[&<>"']/g, c => `&#${c.charCodeAt(0)};`);
+const src = new EventSource("stream" + location.search);
+src.onmessage = (e) => {
+  const d = JSON.parse(e.data);
+  document.getElementById("totals").textContent =
+    `clients ${d.totals.clients} | farming ${d.totals.farming} | captcha ${d.totals.captcha}`;
+  document.getElementById("rows").innerHTML = d.users.map(u => `<tr>
+    <td>${u.user_id}</td><td>${esc(u.name || "")}</td>
+    <td class="${u.connected ? "on" : "off"}">${u.connected ? "connected" : (u.hibernated ? "hibernated" : "-")}</td>
+    <td class="${u.farming ? "on" : "off"}">${u.farming ? "on" : "off"}</td>
+    <td class="${u.captcha ? "warn" : ""}">${u.captcha ? "CAPTCHA" + (u.captcha_age == null ? "" : ` ${u.captcha_age}s`) : ""}</td>
+    <td>${u.in_combat ? "yes" : ""}</td>
+    <td>${u.last_explore_age == null ? "-" : u.last_explore_age + "s ago"}</td></tr>`).join("");
+};
+</script></body></html>"""
+
+@app.route('/fleet/view')
+def fleet_view():
+    _authorized_fleet_provider()
+    return FLEET_PAGE
+
+def run():
+    port = int(os.environ.get("PORT", "8080"))
+    app.run(host='0.0.0.0', port=port, threaded=True)
+
+def keep_alive():
+    """Start the web server in a background thread"""
+    t = Thread(target=run, daemon=True)
+    t.start()
+    log.info("✅ Keep-alive web server started")
+    if not DASHBOARD_TOKEN:
+        log.warning("⚠️ DASHBOARD_TOKEN not set, the /fleet dashboard is disabled")